@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import multiprocessing as mp
+import time
+from collections import deque
+from pathlib import Path
+from typing import TextIO
+
+from url_classifier import classify, classify_many
+from utils import Message
+from worker import Worker, Handler
+
+logger = logging.getLogger(__name__)
+
+
+class BatchManager(Worker):
+    METHODS = Worker.METHODS + ["mainloop", "scrap_finished"]
+
+    def __init__(self, address: str, handler: Handler, *, urls_file: str, output_dir: str,
+                 manifest: str, page_workers: list[str], jobs_per_worker: int):
+        super().__init__(address, handler)
+        self._urls_file = Path(urls_file)
+        self._output_dir = Path(output_dir)
+        self._manifest_path = Path(manifest)
+        self._page_workers = page_workers
+        self._jobs_per_worker = jobs_per_worker
+
+        self._manifest: TextIO | None = None
+        self._queue: deque[tuple[str, str]] = deque()
+        self._in_flight: dict[int, tuple[str, str, str]] = {}
+        self._load: dict[str, int] = {name: 0 for name in page_workers}
+        self._next_job_id = 0
+        self._counts = {"ok": 0, "error": 0}
+        self._started = 0.0
+
+    def _finished_keys(self) -> set[str]:
+        if not self._manifest_path.exists():
+            return set()
+        finished = set()
+        with open(self._manifest_path, encoding="utf-8") as manifest:
+            for line in manifest:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("status") == "ok":
+                    finished.add(classify(entry["url"]).key)
+        return finished
+
+    def init(self) -> list[Message]:
+        if self._is_init:
+            raise RuntimeError("Cannot initialize BatchManager twice")
+        self._output_dir.mkdir(parents=True, exist_ok=True)
+        self._manifest_path.parent.mkdir(parents=True, exist_ok=True)
+
+        finished = self._finished_keys()
+        with open(self._urls_file, encoding="utf-8") as urls:
+            result = classify_many(urls, lenient=True)
+        for info in result.accepted:
+            if info.key not in finished:
+                self._queue.append((info.key, info.canonical))
+        skipped = len(result.accepted) - len(self._queue)
+        for url in result.rejected:
+            logger.warning(f"Not a score URL, skipped : {url}")
+        logger.info(f"Batch of {len(self._queue)} URLs ({result.duplicates} duplicates, "
+                    f"{len(result.rejected)} invalid, {skipped} already finished)")
+
+        self._manifest = open(self._manifest_path, "a", encoding="utf-8")
+        return super().init()
+
+    def close(self) -> list[Message]:
+        if not self._is_init or not self._ready:
+            raise RuntimeError("Cannot close BatchManager before initialization")
+        if self._manifest:
+            self._manifest.close()
+        return super().close()
+
+    def _dispatch(self) -> list[Message]:
+        messages = []
+        for name in self._page_workers:
+            while self._queue and self._load[name] < self._jobs_per_worker:
+                key, url = self._queue.popleft()
+                job_id = self._next_job_id
+                self._next_job_id += 1
+                kind, value = key.split(":", 1)
+                file_name = value if kind == "score" else hashlib.sha1(value.encode()).hexdigest()[:16]
+                result_path = self._output_dir / f"{file_name}.pdf"
+                self._in_flight[job_id] = (url, str(result_path), name)
+                self._load[name] += 1
+                messages.append((self._address, name, ("scrap", (url, str(result_path)), {
+                    "job_id": job_id, "reply_to": self._address, "progress": False,
+                })))
+        return messages
+
+    def _check_done(self) -> list[Message]:
+        if self._queue or self._in_flight:
+            return []
+        logger.info(f"Batch finished in {time.perf_counter() - self._started:.1f} s : "
+                    f"{self._counts['ok']} succeeded, {self._counts['error']} failed")
+        return [(self._address, "manager", "request_shutdown")]
+
+    def mainloop(self) -> list[Message]:
+        logger.info(f"Starting the batch on {len(self._page_workers)} page workers")
+        self._started = time.perf_counter()
+        return self._dispatch() + self._check_done()
+
+    def scrap_finished(self, success: bool, detail: str, job_id: int | None = None,
+                       title: str | None = None, elapsed_sec: float = 0.0) -> list[Message]:
+        in_flight = self._in_flight.pop(job_id, None)
+        if in_flight is None:
+            # A replayed order answered twice, or answered by the manager when
+            # it was dropped before it completed
+            logger.warning(f"Ignored a reply to a finished or unknown job : {job_id} ({detail})")
+            return []
+        url, result_path, name = in_flight
+        self._load[name] -= 1
+        status = "ok" if success else "error"
+        self._counts[status] += 1
+        self._manifest.write(json.dumps({
+            "url": url,
+            "score_id": classify(url).score_id,
+            "status": status,
+            "title": title,
+            "output": result_path if success else None,
+            "error": None if success else detail,
+            "elapsed_sec": round(elapsed_sec, 3),
+            "worker": name,
+            "finished_at": time.time(),
+        }, ensure_ascii=False) + "\n")
+        self._manifest.flush()
+        logger.info(f"[{sum(self._counts.values())}] {status} {url}")
+        return self._dispatch() + self._check_done()
+
+
+def multiprocess_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int,
+                      peers: dict[str, mp.Queue] | None = None, **batch_kwargs):
+    batch_handler = Handler(BatchManager, "batch", send_queue, recv_queue, ppid, peers, **batch_kwargs)
+    batch_handler.listen()
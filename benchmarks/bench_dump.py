@@ -0,0 +1,91 @@
+"""Conversion of a fixture score, in the download threads or in a pool of processes.
+
+Usage: python benchmarks/bench_dump.py [--pages N] [--processes N] [--output results.json]
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import settings  # noqa: E402
+from downloader import Downloader, DownloadSession, PageCheckpoint  # noqa: E402
+from dump_manager import ScoreDumper, convert_page  # noqa: E402
+from http_engine import HTTPEngine  # noqa: E402
+from standin_server import score_svg  # noqa: E402
+
+
+def fixture_urls(pages: int) -> list[str]:
+    return [f"fixture://{index}" for index in range(pages)]
+
+
+def timed_dump(dumper: ScoreDumper, checkpoint: PageCheckpoint, pages: int, result_path: Path) -> float:
+    # Every page is already in the checkpoint: nothing is downloaded
+    engine = HTTPEngine(user_agent=settings.HTTP_USER_AGENT, max_per_host=1, timeout=settings.HTTP_TIMEOUT_SEC)
+    downloader = Downloader(engine, retries=0, backoff_base_sec=0.0, backoff_max_sec=0.0)
+    session = DownloadSession(downloader, fixture_urls(pages), checkpoint)
+    start = time.perf_counter()
+    dumper.dump(session, result_path)
+    elapsed = time.perf_counter() - start
+    engine.close()
+    return elapsed
+
+
+def run(pages: int, processes: int | None = None) -> dict:
+    processes = processes or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        checkpoint = PageCheckpoint(directory / "pages", fixture_urls(pages))
+        for index in range(pages):
+            checkpoint.save(index, score_svg(5000, index))
+
+        threads_sec = timed_dump(ScoreDumper(concurrency=settings.DUMP_CONCURRENCY), checkpoint, pages,
+                                 directory / "threads.pdf")
+        with ProcessPoolExecutor(processes, mp_context=mp.get_context("spawn")) as converter:
+            # The processes are started before the measure, as in the dump worker
+            list(converter.map(convert_page, [checkpoint.load(0)] * processes))
+            dumper = ScoreDumper(concurrency=settings.DUMP_CONCURRENCY, converter=converter,
+                                 window=2 * max(settings.DUMP_CONCURRENCY, processes))
+            processes_sec = timed_dump(dumper, checkpoint, pages, directory / "processes.pdf")
+
+        digests = {name: hashlib.sha256((directory / f"{name}.pdf").read_bytes()).hexdigest()
+                   for name in ("threads", "processes")}
+    return {
+        "pages": pages,
+        "processes": processes,
+        "threads_sec": threads_sec,
+        "processes_sec": processes_sec,
+        "threads_pages_per_sec": pages / threads_sec,
+        "processes_pages_per_sec": pages / processes_sec,
+        "speedup": threads_sec / processes_sec,
+        "identical": digests["threads"] == digests["processes"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=None, help="conversion processes (default: one per core)")
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    result = run(args.pages, args.processes)
+    print(f"threads   : {result['pages']} pages in {result['threads_sec']:.2f} s "
+          f"({result['threads_pages_per_sec']:.1f} pages/s)")
+    print(f"processes : {result['pages']} pages in {result['processes_sec']:.2f} s "
+          f"({result['processes_pages_per_sec']:.1f} pages/s, {result['processes']} processes)")
+    print(f"speedup   : x{result['speedup']:.2f}, identical output: {result['identical']}")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
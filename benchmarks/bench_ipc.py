@@ -0,0 +1,100 @@
+"""Round trip latency between two workers, relayed by the manager or over direct channels.
+
+Usage: python benchmarks/bench_ipc.py [--round-trips N] [--output results.json]
+"""
+import argparse
+import json
+import multiprocessing as mp
+import statistics
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from handler_manager import HandlerManager  # noqa: E402
+from utils import Message  # noqa: E402
+from worker import Worker, Handler  # noqa: E402
+
+
+class PingWorker(Worker):
+    METHODS = Worker.METHODS + ["mainloop", "pong"]
+
+    def __init__(self, address: str, handler: Handler, *, round_trips: int, result_file: str):
+        super().__init__(address, handler)
+        self._round_trips = round_trips
+        self._result_file = result_file
+        self._samples: list[float] = []
+
+    def _ping(self) -> list[Message]:
+        return [(self._address, "pong", ("ping", (time.perf_counter(),), {}))]
+
+    def mainloop(self) -> list[Message]:
+        return self._ping()
+
+    def pong(self, sent: float) -> list[Message]:
+        self._samples.append(time.perf_counter() - sent)
+        if len(self._samples) < self._round_trips:
+            return self._ping()
+        with open(self._result_file, "w") as result:
+            json.dump(self._samples, result)
+        return [(self._address, "manager", "request_shutdown")]
+
+
+class PongWorker(Worker):
+    METHODS = Worker.METHODS + ["ping"]
+
+    def ping(self, sent: float) -> list[Message]:
+        return [(self._address, "ping", ("pong", (sent,), {}))]
+
+
+def ping_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int,
+              peers: dict[str, mp.Queue] | None = None, **kwargs):
+    Handler(PingWorker, "ping", send_queue, recv_queue, ppid, peers, **kwargs).listen()
+
+
+def pong_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int,
+              peers: dict[str, mp.Queue] | None = None):
+    Handler(PongWorker, "pong", send_queue, recv_queue, ppid, peers).listen()
+
+
+def run(direct_channels: bool, round_trips: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        result_file = str(Path(directory) / "samples.json")
+        workers = {"ping": partial(ping_main, round_trips=round_trips, result_file=result_file),
+                   "pong": pong_main}
+        HandlerManager(workers, main_worker="ping", direct_channels=direct_channels).run()
+        with open(result_file) as result:
+            samples = json.load(result)
+
+    # The first round trips include the warm up of both processes
+    samples = sorted(samples[len(samples) // 20:])
+    quantiles = statistics.quantiles(samples, n=100)
+    return {
+        "round_trips": len(samples),
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": quantiles[49] * 1e6,
+        "p95_us": quantiles[94] * 1e6,
+        "p99_us": quantiles[98] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--round-trips", type=int, default=5000)
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = {mode: run(mode == "direct", args.round_trips) for mode in ("relay", "direct")}
+    for mode, result in results.items():
+        print(f"{mode:>6} : p50 {result['p50_us']:.1f} us, p95 {result['p95_us']:.1f} us, "
+              f"p99 {result['p99_us']:.1f} us, mean {result['mean_us']:.1f} us")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Classification of single URLs and bulk validation of URL lists.
+
+Usage: python benchmarks/bench_url_classifier.py [--urls N] [--output results.json]
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from url_classifier import classify, classify_many  # noqa: E402
+
+
+def make_urls(count: int, seed: int = 0) -> list[str]:
+    # Score URLs in their usual variants, a fifth of them repeated, and some
+    # other sites and garbage
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(count):
+        roll = rng.random()
+        score_id = rng.randrange(1, count // 5 * 4 + 2)
+        if roll < 0.6:
+            host = rng.choice(["musescore.com", "www.musescore.com"])
+            suffix = rng.choice(["", "/", "?share=copy_link", "#comments"])
+            urls.append(f"https://{host}/user/{rng.randrange(1, 10 ** 8)}/scores/{score_id}{suffix}")
+        elif roll < 0.85:
+            urls.append(f"https://musescore.com/official_scores/scores/{score_id}")
+        elif roll < 0.95:
+            urls.append(f"https://example.org/scores/{score_id}")
+        else:
+            urls.append(f"musescore {score_id}")
+    return urls
+
+
+def legacy_check(url: str) -> str | None:
+    # What the GUI did on every keystroke before the classifier
+    url_patterns = [
+        ("score utilisateur", re.compile(r"^https://(?:www\.)?musescore\.com/user/[0-9]+/scores/[0-9]+$")),
+        ("score officiel", re.compile(r"^https://(?:www\.)?musescore\.com/official_scores/scores/[0-9]+$")),
+        ("autre site", re.compile(r"^https://[a-zA-Z0-9\-.]+\.[a-z]{2,}/.*$"))
+    ]
+    for match_type, pattern in url_patterns:
+        if pattern.match(url):
+            return match_type
+    return None
+
+
+def per_url_ns(func, urls: list[str]) -> float:
+    start = time.perf_counter_ns()
+    for url in urls:
+        func(url)
+    return (time.perf_counter_ns() - start) / len(urls)
+
+
+def run(count: int) -> dict:
+    urls = make_urls(count)
+    sample = urls[:min(count, 20000)]
+    start = time.perf_counter()
+    result = classify_many(urls)
+    bulk_sec = time.perf_counter() - start
+    return {
+        "urls": count,
+        "legacy_check_ns": per_url_ns(legacy_check, sample),
+        "classify_ns": per_url_ns(classify, sample),
+        "bulk_sec": bulk_sec,
+        "bulk_urls_per_sec": count / bulk_sec,
+        "accepted": len(result.accepted),
+        "duplicates": result.duplicates,
+        "rejected": len(result.rejected),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--urls", type=int, default=100_000)
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    result = run(args.urls)
+    print(f"per URL : legacy check {result['legacy_check_ns']:.0f} ns, classify {result['classify_ns']:.0f} ns")
+    print(f"bulk    : {result['urls']} URLs in {result['bulk_sec'] * 1000:.0f} ms "
+          f"({result['accepted']} accepted, {result['duplicates']} duplicates, {result['rejected']} rejected)")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""Offline benchmarks against a local musescore.com stand-in.
+
+Usage: python benchmarks/run_benchmarks.py [--only title scrap dump convert ipc url] [--compare OLD.json]
+
+Results are written to benchmarks/results/<commit>.json.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import settings  # noqa: E402
+from bench_dump import run as run_convert  # noqa: E402
+from bench_ipc import run as run_ipc  # noqa: E402
+from bench_url_classifier import run as run_url_classifier  # noqa: E402
+from downloader import Downloader, DownloadSession  # noqa: E402
+from dump_manager import ScoreDumper  # noqa: E402
+from handler_manager import HandlerManager  # noqa: E402
+from http_engine import HTTPEngine  # noqa: E402
+from standin_server import StandInServer  # noqa: E402
+from utils import Message  # noqa: E402
+from worker import Worker, Handler  # noqa: E402
+
+BENCHMARKS = ("title", "scrap", "dump", "convert", "ipc", "url")
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def peak_rss_kb(children: bool = False) -> int | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def summarize(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    if len(samples) < 2:
+        return {"count": 1, "p50_ms": samples[0] * 1000}
+    quantiles = statistics.quantiles(samples, n=100)
+    return {"count": len(samples), "mean_ms": statistics.fmean(samples) * 1000,
+            "p50_ms": quantiles[49] * 1000, "p95_ms": quantiles[94] * 1000, "p99_ms": quantiles[98] * 1000}
+
+
+class BenchDriver(Worker):
+    # Stands in for the GUI: the page worker answers titles and progress to "gui"
+    METHODS = Worker.METHODS + ["mainloop", "set_title", "scrap_progress", "scrap_finished"]
+
+    def __init__(self, address: str, handler: Handler, *, started: float, title_urls: list[tuple[str, str]],
+                 scrap_urls: list[str], output_dir: str, result_file: str):
+        super().__init__(address, handler)
+        self._started = started
+        self._title_jobs = list(title_urls)
+        self._scrap_jobs = list(scrap_urls)
+        self._output_dir = Path(output_dir)
+        self._result_file = result_file
+        self._results: dict = {"titles": [], "scraps": []}
+        self._sent = 0.0
+        self._kind = ""
+
+    def _next(self) -> list[Message]:
+        self._sent = time.perf_counter()
+        if self._title_jobs:
+            self._kind, url = self._title_jobs.pop(0)
+            return [(self._address, "page", ("fetch_title", (url,), {"request_id": len(self._results["titles"])}))]
+        if self._scrap_jobs:
+            url = self._scrap_jobs.pop(0)
+            job_id = len(self._results["scraps"])
+            result_path = str(self._output_dir / f"{job_id}.pdf")
+            self._results["scraps"].append({"url": url, "pages": 0})
+            return [(self._address, "page", ("scrap", (url, result_path), {"job_id": job_id}))]
+        with open(self._result_file, "w") as result:
+            json.dump(self._results, result)
+        return [(self._address, "manager", "request_shutdown")]
+
+    def mainloop(self) -> list[Message]:
+        self._results["driver_startup_sec"] = time.time() - self._started
+        return self._next()
+
+    def set_title(self, title: str, request_id: int | None = None) -> list[Message]:
+        if not self._results["titles"]:
+            self._results["first_title_sec"] = time.time() - self._started
+        self._results["titles"].append({"kind": self._kind, "title": title,
+                                        "latency_sec": time.perf_counter() - self._sent})
+        return self._next()
+
+    def scrap_progress(self, done: int, total: int, job_id: int | None = None, **stats) -> list[Message]:
+        self._results["scraps"][job_id]["pages"] = done
+        return []
+
+    def scrap_finished(self, success: bool, detail: str, job_id: int | None = None,
+                       title: str | None = None, elapsed_sec: float = 0.0) -> list[Message]:
+        self._results["scraps"][job_id].update(success=success, detail=detail, elapsed_sec=elapsed_sec)
+        return self._next()
+
+
+def driver_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int,
+                peers: dict[str, mp.Queue] | None = None, **driver_kwargs):
+    Handler(BenchDriver, "gui", send_queue, recv_queue, ppid, peers, **driver_kwargs).listen()
+
+
+def page_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int,
+              peers: dict[str, mp.Queue] | None = None, *, cache_dir: str):
+    # Keeps the real caches out of the measurements
+    settings.METADATA_CACHE_FILE = Path(cache_dir) / "metadata.sqlite3"
+    settings.BROWSER_PROFILE_DIR = Path(cache_dir) / "profiles"
+    from page_manager import multiprocess_main
+    multiprocess_main(send_queue, recv_queue, ppid, peers)
+
+
+def dump_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int,
+              peers: dict[str, mp.Queue] | None = None, *, cache_dir: str):
+    settings.DUMP_SPOOL_DIR = Path(cache_dir) / "dumps"
+    from dump_manager import multiprocess_main
+    multiprocess_main(send_queue, recv_queue, ppid, peers)
+
+
+def run_workers(server: StandInServer, rounds: int, scraps: int) -> dict:
+    title_urls = []
+    for index in range(rounds):
+        title_urls += [("user", server.user_score_url(1000 + index)),
+                       ("official", server.official_score_url(2000 + index)),
+                       ("not_found", server.not_found_url(3000 + index))]
+    scrap_urls = [server.user_score_url(4000 + index) for index in range(scraps)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        result_file = str(Path(directory) / "driver.json")
+        workers = {"gui": partial(driver_main, started=time.time(), title_urls=title_urls, scrap_urls=scrap_urls,
+                                  output_dir=directory, result_file=result_file),
+                   "page": partial(page_main, cache_dir=directory),
+                   "dump": partial(dump_main, cache_dir=directory)}
+        HandlerManager(workers).run()
+        with open(result_file) as result:
+            results = json.load(result)
+
+    titles = {kind: summarize([title["latency_sec"] for title in results["titles"] if title["kind"] == kind])
+              for kind in ("user", "official", "not_found")}
+    done = [scrap for scrap in results["scraps"] if scrap.get("success")]
+    errors = sorted({scrap.get("detail") for scrap in results["scraps"] if not scrap.get("success")})
+    pages = sum(scrap["pages"] for scrap in done)
+    elapsed = sum(scrap["elapsed_sec"] for scrap in done)
+    return {
+        "title": {"first_title_sec": results.get("first_title_sec"), **titles},
+        "scrap": {"succeeded": len(done), "failed": len(results["scraps"]) - len(done), "pages": pages,
+                  "pages_per_sec": pages / elapsed if elapsed else 0.0, "errors": errors},
+        "startup": {"driver_startup_sec": results.get("driver_startup_sec")},
+        "workers_peak_rss_kb": peak_rss_kb(children=True),
+    }
+
+
+def dump_stage(asset_urls: list[str], result_path: str, results: mp.Queue):
+    engine = HTTPEngine(user_agent=settings.HTTP_USER_AGENT, max_per_host=settings.DUMP_CONCURRENCY,
+                        timeout=settings.DOWNLOAD_TIMEOUT_SEC)
+    downloader = Downloader(engine, retries=0, backoff_base_sec=0.0, backoff_max_sec=0.0)
+    session = DownloadSession(downloader, asset_urls, None)
+    start = time.perf_counter()
+    pages = ScoreDumper(concurrency=settings.DUMP_CONCURRENCY).dump(session, result_path)
+    elapsed = time.perf_counter() - start
+    engine.close()
+    results.put({"pages": pages, "elapsed_sec": elapsed, "pages_per_sec": pages / elapsed,
+                 "bytes": session.progress(pages).bytes_downloaded,
+                 "pdf_bytes": Path(result_path).stat().st_size, "peak_rss_kb": peak_rss_kb()})
+
+
+def run_dump(server: StandInServer) -> dict:
+    # The download and conversion pipeline alone, in its own process for the RSS
+    asset_urls = [f"{server.base_url}/static/scoredata/5000/score_{index}.svg" for index in range(server.pages)]
+    with tempfile.TemporaryDirectory() as directory:
+        results = mp.Queue()
+        process = mp.Process(target=dump_stage, args=(asset_urls, str(Path(directory) / "dump.pdf"), results))
+        process.start()
+        result = results.get()
+        process.join()
+    return result
+
+
+def commit_name() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=Path(__file__).parent).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(old: dict, new: dict):
+    old_flat, new_flat = flatten(old["results"]), flatten(new["results"])
+    print(f"Compared to {old['commit']}:")
+    for key in sorted(old_flat.keys() & new_flat.keys()):
+        before, after = old_flat[key], new_flat[key]
+        change = f"{(after - before) / before * 100:+.1f} %" if before else "n/a"
+        print(f"  {key:<40} {before:>12.3f} -> {after:>12.3f}  ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--pages", type=int, default=20, help="pages of every stand-in score")
+    parser.add_argument("--fixture-pages", type=int, default=100, help="pages of the score converted by 'convert'")
+    parser.add_argument("--rounds", type=int, default=20, help="title lookups of each kind")
+    parser.add_argument("--scraps", type=int, default=3, help="scores downloaded through the page worker")
+    parser.add_argument("--round-trips", type=int, default=2000, help="IPC round trips of each mode")
+    parser.add_argument("--urls", type=int, default=100_000, help="URLs of the bulk validation")
+    parser.add_argument("--output-dir", default=str(RESULTS_DIR))
+    parser.add_argument("--compare", metavar="RESULTS_FILE", help="print the changes from older results")
+    args = parser.parse_args()
+    # Read first: the older results may be the file about to be overwritten
+    previous = json.loads(Path(args.compare).read_text()) if args.compare else None
+
+    results = {}
+    with StandInServer(pages=args.pages) as server:
+        if "title" in args.only or "scrap" in args.only:
+            workers = run_workers(server, args.rounds if "title" in args.only else 0,
+                                  args.scraps if "scrap" in args.only else 0)
+            results.update({key: value for key, value in workers.items() if key in args.only or key not in BENCHMARKS})
+        if "dump" in args.only:
+            results["dump"] = run_dump(server)
+    if "convert" in args.only:
+        results["convert"] = run_convert(args.fixture_pages)
+    if "ipc" in args.only:
+        results["ipc"] = {mode: run_ipc(mode == "direct", args.round_trips) for mode in ("relay", "direct")}
+    if "url" in args.only:
+        results["url"] = run_url_classifier(args.urls)
+
+    report = {"commit": commit_name(), "timestamp": time.time(), "python": platform.python_version(),
+              "platform": platform.platform(), "results": results}
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output = output_dir / f"{report['commit']}.json"
+    output.write_text(json.dumps(report, indent=2))
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+    if previous is not None:
+        compare(previous, report)
+
+
+if __name__ == "__main__":
+    main()
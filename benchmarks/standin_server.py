@@ -0,0 +1,123 @@
+"""Local stand-in for musescore.com serving the fixture pages and generated score pages."""
+import random
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from string import Template
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+USER_SCORE = re.compile(r"^/user/([0-9]+)/scores/([0-9]+)/?$")
+OFFICIAL_SCORE = re.compile(r"^/official_scores/scores/([0-9]+)/?$")
+SCORE_ASSET = re.compile(r"^/static/scoredata/([0-9]+)/score_([0-9]+)\.svg$")
+PAGE_MARKUP = '<div class="EEnGW"><img src="/static/scoredata/$score_id/score_$index.svg" alt=""></div>'
+
+
+def score_svg(score_id: int, index: int, notes: int = 400) -> bytes:
+    # A page of staves and note heads, about the size of a real engraved page
+    rng = random.Random(score_id * 1000 + index)
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<svg xmlns="http://www.w3.org/2000/svg" width="2977px" height="4208px" viewBox="0 0 2977 4208">']
+    for system in range(10):
+        top = 300 + system * 380
+        for line in range(5):
+            y = top + line * 25
+            parts.append(f'<polyline class="StaffLines" fill="none" stroke="#000000" stroke-width="2.73" '
+                         f'points="200,{y} 2777,{y}"/>')
+    for _ in range(notes):
+        x = rng.uniform(260, 2700)
+        y = 300 + rng.randrange(10) * 380 + rng.randrange(-4, 14) * 12.5
+        r = 14
+        parts.append(f'<path class="Note" transform="matrix(1,0,0,1,{x:.2f},{y:.2f})" '
+                     f'd="M{-r},0 C{-r},{-r * 0.7:.2f} {-r * 0.3:.2f},{-r * 0.9:.2f} 0,{-r * 0.9:.2f} '
+                     f'C{r * 0.9:.2f},{-r * 0.9:.2f} {r},{-r * 0.5:.2f} {r},0 '
+                     f'C{r},{r * 0.7:.2f} {r * 0.3:.2f},{r * 0.9:.2f} 0,{r * 0.9:.2f} '
+                     f'C{-r * 0.9:.2f},{r * 0.9:.2f} {-r},{r * 0.5:.2f} {-r},0 Z"/>')
+        parts.append(f'<polyline class="Stem" fill="none" stroke="#000000" stroke-width="3" '
+                     f'points="{x + r - 1:.2f},{y:.2f} {x + r - 1:.2f},{y - 87.5:.2f}"/>')
+    parts.append(f'<text x="1488" y="4100">{index + 1}</text>')
+    parts.append("</svg>")
+    return "\n".join(parts).encode()
+
+
+class StandInServer:
+    def __init__(self, *, pages: int = 10, host: str = "127.0.0.1", port: int = 0):
+        self.pages = pages
+        self._templates = {name: Template((FIXTURES_DIR / f"{name}.html").read_text(encoding="utf-8"))
+                           for name in ("user_score", "official_score", "not_found")}
+        self._assets: dict[tuple[int, int], bytes] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def user_score_url(self, score_id: int, user_id: int = 1) -> str:
+        return f"{self.base_url}/user/{user_id}/scores/{score_id}"
+
+    def official_score_url(self, score_id: int) -> str:
+        return f"{self.base_url}/official_scores/scores/{score_id}"
+
+    def not_found_url(self, score_id: int) -> str:
+        return f"{self.base_url}/user/0/scores/{score_id}/missing"
+
+    def asset(self, score_id: int, index: int) -> bytes:
+        with self._lock:
+            if (score_id, index) not in self._assets:
+                self._assets[score_id, index] = score_svg(score_id, index)
+            return self._assets[score_id, index]
+
+    def render(self, path: str) -> tuple[int, str, bytes]:
+        if match := SCORE_ASSET.match(path):
+            score_id, index = int(match.group(1)), int(match.group(2))
+            if index < self.pages:
+                return 200, "image/svg+xml", self.asset(score_id, index)
+        elif (match := USER_SCORE.match(path)) or (match := OFFICIAL_SCORE.match(path)):
+            score_id = int(match.group(match.lastindex))
+            template = self._templates["user_score" if match.re is USER_SCORE else "official_score"]
+            pages = "\n".join(Template(PAGE_MARKUP).substitute(score_id=score_id, index=index)
+                              for index in range(self.pages))
+            body = template.substitute(title=f"Stand-in score {score_id}", pages=pages)
+            return 200, "text/html; charset=utf-8", body.encode()
+        return 404, "text/html; charset=utf-8", self._templates["not_found"].template.encode()
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes: with Nagle every response
+            # would wait for the delayed ACK of the client.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, content_type, body = server.render(self.path.split("?", 1)[0])
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="standin-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
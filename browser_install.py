@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+from importlib.metadata import version
+from pathlib import Path
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+def browsers_path() -> Path:
+    env_path = os.environ.get("PLAYWRIGHT_BROWSERS_PATH")
+    if env_path == "0":
+        import playwright
+        return Path(playwright.__file__).parent / "driver" / "package" / ".local-browsers"
+    if env_path:
+        return Path(env_path)
+    if sys.platform == "win32":
+        return Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local")) / "ms-playwright"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "ms-playwright"
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "ms-playwright"
+
+
+def _read_marker() -> dict[str, str]:
+    try:
+        return json.loads(settings.BROWSER_INSTALL_MARKER.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def is_browser_installed(browser: str) -> bool:
+    if _read_marker().get(browser) != version("playwright"):
+        return False
+    root = browsers_path()
+    return root.is_dir() and any(root.glob(f"{browser}*"))
+
+
+def ensure_browser_installed(browser: str) -> bool:
+    if is_browser_installed(browser):
+        return False
+
+    logger.info(f"Installing the playwright browser: {browser}")
+    subprocess.run([sys.executable, "-m", "playwright", "install", browser], check=True)
+
+    marker = _read_marker()
+    marker[browser] = version("playwright")
+    settings.BROWSER_INSTALL_MARKER.parent.mkdir(parents=True, exist_ok=True)
+    settings.BROWSER_INSTALL_MARKER.write_text(json.dumps(marker))
+    return True
@@ -0,0 +1,73 @@
+import logging
+import os
+import shutil
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# HTTP and compiled script caches of the supported browsers: they can be
+# trimmed file by file, unlike the databases that hold the session state.
+CACHE_DIR_NAMES = frozenset({"Cache", "Code Cache", "GPUCache", "CacheStorage", "ScriptCache",
+                             "cache2", "startupCache", "WebKitCache"})
+# Held in their user data directory by running browsers: Chromium on POSIX
+# and on Windows, Firefox on POSIX
+LOCK_NAMES = frozenset({"SingletonLock", "lockfile", "lock"})
+
+
+def _files(directory: Path) -> list[tuple[float, int, Path]]:
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = Path(root, name)
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+
+def directory_size(directory: Path) -> int:
+    return sum(size for _, size, _ in _files(directory))
+
+
+def _cache_dirs(profile: Path) -> list[Path]:
+    return [Path(root, name) for root, names, _ in os.walk(profile) for name in names if name in CACHE_DIR_NAMES]
+
+
+def in_use(profile: Path) -> bool:
+    return any(name in LOCK_NAMES for _, _, names in os.walk(profile) for name in names)
+
+
+def prune_profiles(root: Path, max_bytes: int) -> int:
+    # The profiles of every worker are under root, those a browser is using
+    # are left alone
+    if not root.is_dir():
+        return 0
+    total = directory_size(root)
+    if total <= max_bytes:
+        return total
+    logger.info(f"Browser profiles use {total / 1e6:.0f} MB, pruning to {max_bytes / 1e6:.0f} MB")
+    idle = [profile for profile in root.iterdir() if profile.is_dir() and not in_use(profile)]
+
+    # The least recently written cache entries go first
+    cached = sorted(entry for profile in idle for directory in _cache_dirs(profile) for entry in _files(directory))
+    for _, size, path in cached:
+        if total <= max_bytes:
+            return total
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+
+    # Session state alone is over the cap: drop the least recently used profiles
+    profiles = sorted((profile.stat().st_mtime, profile) for profile in idle)
+    for _, profile in profiles:
+        if total <= max_bytes:
+            break
+        size = directory_size(profile)
+        shutil.rmtree(profile, ignore_errors=True)
+        total -= size
+        logger.info(f"Removed browser profile {profile.name}")
+    return total
@@ -0,0 +1,147 @@
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from http_engine import HTTPEngine, HTTPEngineError
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+@dataclass(frozen=True)
+class DownloadProgress:
+    done: int
+    total: int
+    pages_downloaded: int
+    bytes_downloaded: int
+    elapsed_sec: float
+
+    @property
+    def pages_per_sec(self) -> float:
+        return self.pages_downloaded / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+    @property
+    def bytes_per_sec(self) -> float:
+        return self.bytes_downloaded / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+    @property
+    def eta_sec(self) -> float | None:
+        # Pages resumed from a checkpoint do not count in the rate
+        rate = self.pages_per_sec
+        return (self.total - self.done) / rate if rate > 0 else None
+
+
+class PageCheckpoint:
+    # The pages are only resumed for the same list of assets: the manifest
+    # keeps their URLs, without the query strings that change on every visit.
+    MANIFEST = "manifest.json"
+
+    def __init__(self, directory: Path, asset_urls: list[str]):
+        self._directory = directory
+        manifest = [url.split("?", 1)[0] for url in asset_urls]
+        if self._read_manifest() != manifest and directory.exists():
+            logger.info(f"Discarding the pages in {directory}, they belong to other assets")
+            self.clear()
+        directory.mkdir(parents=True, exist_ok=True)
+        self._write(directory / self.MANIFEST, json.dumps(manifest).encode())
+
+    def _read_manifest(self) -> list[str] | None:
+        try:
+            return json.loads((self._directory / self.MANIFEST).read_bytes())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        # Written under a temporary name first so that a killed dump never
+        # leaves a truncated file behind.
+        temporary = path.with_suffix(".part")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+
+    def _path(self, index: int) -> Path:
+        return self._directory / f"page_{index:04d}"
+
+    def load(self, index: int) -> bytes | None:
+        try:
+            return self._path(index).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def save(self, index: int, data: bytes):
+        self._write(self._path(index), data)
+
+    def first_missing(self, total: int) -> int:
+        return next((index for index in range(total) if not self._path(index).exists()), total)
+
+    def clear(self):
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+
+class Downloader:
+    def __init__(self, engine: HTTPEngine, *, retries: int, backoff_base_sec: float, backoff_max_sec: float):
+        self._engine = engine
+        self._retries = retries
+        self._backoff_base_sec = backoff_base_sec
+        self._backoff_max_sec = backoff_max_sec
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, HTTPEngineError):
+            return error.status in RETRYABLE_STATUSES
+        return isinstance(error, (OSError, http.client.HTTPException))
+
+    def fetch(self, url: str) -> bytes:
+        attempt = 0
+        while True:
+            try:
+                return self._engine.fetch_bytes(url)
+            except Exception as e:
+                if attempt >= self._retries or not self._is_retryable(e):
+                    raise
+                # Full jitter keeps concurrent retries from hitting the server together
+                delay = random.uniform(0, min(self._backoff_max_sec, self._backoff_base_sec * 2 ** attempt))
+                attempt += 1
+                logger.warning(f"Retrying {url} in {delay:.2f} s (attempt {attempt}/{self._retries}) : {str(e)}")
+                time.sleep(delay)
+
+
+class DownloadSession:
+    def __init__(self, downloader: Downloader, asset_urls: list[str], checkpoint: PageCheckpoint | None):
+        self._downloader = downloader
+        self._asset_urls = asset_urls
+        self._checkpoint = checkpoint
+        self._lock = threading.Lock()
+        self._downloaded = 0
+        self._bytes = 0
+        self._start = time.perf_counter()
+
+    @property
+    def total(self) -> int:
+        return len(self._asset_urls)
+
+    def fetch_page(self, index: int) -> bytes:
+        data = self._checkpoint.load(index) if self._checkpoint is not None else None
+        downloaded = data is None
+        if downloaded:
+            data = self._downloader.fetch(self._asset_urls[index])
+            if self._checkpoint is not None:
+                self._checkpoint.save(index, data)
+        if downloaded:
+            with self._lock:
+                self._downloaded += 1
+                self._bytes += len(data)
+        return data
+
+    def progress(self, done: int) -> DownloadProgress:
+        with self._lock:
+            return DownloadProgress(done, self.total, self._downloaded, self._bytes,
+                                    time.perf_counter() - self._start)
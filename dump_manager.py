@@ -0,0 +1,260 @@
+import asyncio
+import contextvars
+import logging
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import metrics
+import settings
+import shared_payload
+from downloader import Downloader, DownloadProgress, DownloadSession, PageCheckpoint
+from http_engine import HTTPEngine
+from page_converter import convert_asset
+from pdf_writer import PdfPage, PdfStreamWriter
+from scheduler import FairShare
+from shared_payload import PayloadHandle, SharedPayload
+from utils import Message
+from worker import Worker, AsyncHandler
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[DownloadProgress], None]
+
+
+class DumpCancelled(Exception):
+    pass
+
+
+def convert_page(data: bytes | PayloadHandle) -> PdfPage:
+    # Runs in the conversion processes, large assets come through shared memory
+    if isinstance(data, PayloadHandle):
+        payload = SharedPayload(data)
+        try:
+            data = bytes(payload)
+        finally:
+            payload.release()
+    return convert_asset(data)
+
+
+class ScoreDumper:
+    # Without a converter the pages are converted by the download threads.
+    # With one, a process pool, the threads only download and the pages are
+    # converted on every core; they are written in the same order either way,
+    # so both give the same file.
+    def __init__(self, *, concurrency: int, share: FairShare | None = None, converter: Executor | None = None,
+                 window: int | None = None):
+        if concurrency < 1:
+            raise ValueError("Dump concurrency must be at least 1")
+        self._concurrency = concurrency
+        self._share = share
+        self.converter = converter
+        self._window = window or 2 * concurrency
+
+    @staticmethod
+    def _convert(data: bytes, converter: Executor | None) -> PdfPage | Future[PdfPage]:
+        if converter is None:
+            return convert_asset(data)
+        if len(data) >= settings.SHARED_PAYLOAD_MIN_BYTES:
+            return converter.submit(convert_page, shared_payload.export(data))
+        return converter.submit(convert_page, data)
+
+    def _fetch_page(self, session: DownloadSession, index: int,
+                    converter: Executor | None) -> PdfPage | Future[PdfPage]:
+        # Concurrent dumps take turns for every page when they share the downloads
+        if self._share is None:
+            return self._convert(session.fetch_page(index), converter)
+        with self._share.turn(session):
+            return self._convert(session.fetch_page(index), converter)
+
+    def dump(self, session: DownloadSession, result_path: str | Path,
+             on_progress: ProgressCallback | None = None, cancelled: threading.Event | None = None) -> int:
+        # Pages are fetched ahead of the writer within the window and written
+        # in order, so at most that many pages are held in memory whatever the
+        # length of the score. The whole dump goes through the converter it
+        # started with, and stops before the next page once cancelled.
+        total = session.total
+        converter = self.converter
+        start = time.perf_counter()
+        pending: dict[int, Future[PdfPage | Future[PdfPage]]] = {}
+        next_submit = 0
+
+        executor = ThreadPoolExecutor(self._concurrency, thread_name_prefix="dump")
+        try:
+            with PdfStreamWriter(result_path) as writer:
+                for index in range(total):
+                    if cancelled is not None and cancelled.is_set():
+                        raise DumpCancelled(f"Dump cancelled at page {index + 1}/{total}")
+                    while next_submit < total and next_submit < index + self._window:
+                        pending[next_submit] = executor.submit(self._fetch_page, session, next_submit, converter)
+                        next_submit += 1
+                    page = pending.pop(index).result()
+                    writer.add_page(page.result() if isinstance(page, Future) else page)
+                    if on_progress is not None:
+                        on_progress(session.progress(index + 1))
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+        logger.info(f"Dumped {total} pages to {result_path} in {time.perf_counter() - start:.2f} s")
+        return total
+
+
+@dataclass
+class DumpJob:
+    result_path: str
+    job_id: int | None
+    reply_to: str
+    progress: bool
+    title: str | None
+    # Spent by the page worker looking for the pages
+    elapsed_sec: float
+    started: float = field(default_factory=time.perf_counter)
+    last_progress: float = 0.0
+    # Set when the order is cancelled, the dump thread stops at the next page
+    cancelled: threading.Event = field(default_factory=threading.Event)
+
+
+class DumpManager(Worker):
+    # Downloads the pages found by the page workers and writes the PDF, away
+    # from the event loop of the browser.
+    METHODS = Worker.METHODS + ["dump"]
+
+    def __init__(self, address: str, handler: AsyncHandler, processes: int | None = settings.DUMP_PROCESSES,
+                 jobs: int = settings.DUMP_JOBS):
+        super().__init__(address, handler)
+        self._processes = processes or os.cpu_count() or 1
+        self._jobs = jobs
+
+        self.asset_http: HTTPEngine | None = None
+        self.downloader: Downloader | None = None
+        self.dumper: ScoreDumper | None = None
+        self.job_executor: ThreadPoolExecutor | None = None
+        self._converter_lock = threading.Lock()
+        # Checkpoint keys of the running dumps
+        self._active: set[str] = set()
+
+    def _converter(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked: this process already runs threads
+        return ProcessPoolExecutor(self._processes, mp_context=mp.get_context("spawn"))
+
+    async def init(self) -> list[Message]:
+        if self._is_init:
+            raise RuntimeError("Cannot initialize DumpManager twice")
+        logger.info(f"Converting pages with {self._processes} processes")
+        self.asset_http = HTTPEngine(user_agent=settings.HTTP_USER_AGENT,
+                                     max_per_host=settings.DUMP_CONCURRENCY,
+                                     timeout=settings.DOWNLOAD_TIMEOUT_SEC)
+        self.downloader = Downloader(self.asset_http,
+                                     retries=settings.DOWNLOAD_RETRIES,
+                                     backoff_base_sec=settings.DOWNLOAD_BACKOFF_BASE_SEC,
+                                     backoff_max_sec=settings.DOWNLOAD_BACKOFF_MAX_SEC)
+        # Every running dump gets a thread, they share the page downloads in
+        # turn and keep enough pages in flight for every conversion process
+        self.dumper = ScoreDumper(concurrency=settings.DUMP_CONCURRENCY,
+                                  share=FairShare(settings.DUMP_CONCURRENCY),
+                                  converter=self._converter(),
+                                  window=2 * max(settings.DUMP_CONCURRENCY, self._processes))
+        self.job_executor = ThreadPoolExecutor(self._jobs, thread_name_prefix="dump-job")
+        return super().init()
+
+    async def close(self) -> list[Message]:
+        if not self._is_init or not self._ready:
+            raise RuntimeError("Cannot close DumpManager before initialization")
+        # Cancelling the orders flags their dumps, which stop at their next
+        # page; the loop keeps serving while the threads wind down
+        await self._handler.cancel_tasks()
+        if self.job_executor:
+            await asyncio.to_thread(self.job_executor.shutdown, cancel_futures=True)
+        if self.dumper and self.dumper.converter:
+            await asyncio.to_thread(self.dumper.converter.shutdown, cancel_futures=True)
+        if self.asset_http:
+            self.asset_http.close()
+        return super().close()
+
+    def collect_metrics(self):
+        metrics.set_gauge("dump_processes", self._processes)
+
+    async def dump(self, asset_urls: list[str], result_path: str, key: str, job_id: int | None = None,
+                   reply_to: str = "gui", progress: bool = True, title: str | None = None,
+                   elapsed_sec: float = 0.0) -> list[Message]:
+        if not self._ready:
+            return []
+        job = DumpJob(result_path, job_id, reply_to, progress, title, elapsed_sec)
+        if key in self._active:
+            logger.error(f"{result_path} is already being written")
+            return [self._finish(job, False, "Déjà en cours")]
+        self._active.add(key)
+        try:
+            checkpoint = PageCheckpoint(settings.DUMP_SPOOL_DIR / key, asset_urls)
+            if resume_at := checkpoint.first_missing(len(asset_urls)):
+                logger.info(f"Resuming the dump at page {resume_at + 1}/{len(asset_urls)}")
+            session = DownloadSession(self.downloader, asset_urls, checkpoint)
+            # The thread runs in the context of the order, to report it running
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.job_executor, contextvars.copy_context().run, self._dump, job,
+                                              session, checkpoint)
+        except asyncio.CancelledError:
+            job.cancelled.set()
+            raise
+        finally:
+            self._active.discard(key)
+
+    def _dump(self, job: DumpJob, session: DownloadSession, checkpoint: PageCheckpoint) -> list[Message]:
+        self._handler.order_running()
+        on_progress = (lambda progress: self._send_progress(job, progress)) if job.progress else None
+        converter = self.dumper.converter
+        try:
+            self.dumper.dump(session, job.result_path, on_progress=on_progress, cancelled=job.cancelled)
+        except DumpCancelled as e:
+            logger.info(str(e))
+            return []
+        except BrokenProcessPool as e:
+            # A conversion process died, the pool is of no use any more. Only
+            # the first of the jobs that used it starts a new one.
+            logger.error(f"Conversion processes failed, starting new ones : {str(e)}")
+            with self._converter_lock:
+                if self.dumper.converter is converter:
+                    self.dumper.converter = self._converter()
+                    converter.shutdown(wait=False, cancel_futures=True)
+            return [self._finish(job, False, str(e))]
+        except Exception as e:
+            logger.error(f"Could not dump the score : {str(e)}")
+            return [self._finish(job, False, str(e))]
+        checkpoint.clear()
+        return [self._finish(job, True, job.result_path)]
+
+    def _send_progress(self, job: DumpJob, progress: DownloadProgress):
+        # At most one update per frame and job, the last page is always sent
+        now = time.perf_counter()
+        if progress.done < progress.total and now - job.last_progress < settings.PROGRESS_INTERVAL_SEC:
+            return
+        job.last_progress = now
+        self._handler.send_message(job.reply_to, ("scrap_progress", (progress.done, progress.total), {
+            "job_id": job.job_id,
+            "bytes_downloaded": progress.bytes_downloaded,
+            "pages_per_sec": progress.pages_per_sec,
+            "bytes_per_sec": progress.bytes_per_sec,
+            "eta_sec": progress.eta_sec,
+        }))
+
+    def _finish(self, job: DumpJob, success: bool, detail: str) -> Message:
+        metrics.inc("scraps_total", result="success" if success else "failure")
+        return (self._address, job.reply_to, ("scrap_finished", (success, detail), {
+            "job_id": job.job_id,
+            "title": job.title,
+            "elapsed_sec": job.elapsed_sec + time.perf_counter() - job.started,
+        }))
+
+
+def multiprocess_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int,
+                      peers: dict[str, mp.Queue] | None = None, name: str = "dump",
+                      processes: int | None = settings.DUMP_PROCESSES, jobs: int = settings.DUMP_JOBS):
+    dump_handler = AsyncHandler(DumpManager, name, send_queue, recv_queue, ppid, peers,
+                                processes=processes, jobs=jobs)
+    dump_handler.listen()
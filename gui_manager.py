@@ -1,32 +1,55 @@
 import asyncio
 import logging
 import multiprocessing as mp
+from dataclasses import dataclass
 from pathlib import Path, UnsupportedOperation
-import re
 import sys
 
 import PySide6.QtAsyncio as QtAsyncio
-from PySide6.QtCore import Qt, QTimer, QStandardPaths
+from PySide6.QtCore import Qt, QTimer, QStandardPaths, QSocketNotifier
 from PySide6.QtGui import QFont
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QFileDialog, QSpacerItem, QSizePolicy,
-    QProgressBar, QCheckBox
+    QProgressBar, QCheckBox, QTreeWidget, QTreeWidgetItem, QHeaderView
 )
 
 import settings
+import tracing
+from url_classifier import UrlKind, classify, classify_many
 from utils import Message
 from worker import Worker, Handler
 
 logger = logging.getLogger(__name__)
 
 button_status = 0b00
+URL_KIND_LABELS = {
+    UrlKind.USER_SCORE: "score utilisateur",
+    UrlKind.OFFICIAL_SCORE: "score officiel",
+    UrlKind.OTHER_SITE: "autre site",
+}
+
+
+def default_folder() -> str:
+    return QStandardPaths.writableLocation(getattr(QStandardPaths.StandardLocation, settings.DEFAULT_FOLDER_LOCATION))
 
 
 def update_button_status(button: QPushButton):
     button.setEnabled(button_status == 0b11)
 
 
+@dataclass
+class DownloadJob:
+    job_id: int
+    url: str
+    result_path: str
+    item: QTreeWidgetItem
+    done: int = 0
+    total: int = 0
+    finished: bool = False
+    success: bool = False
+
+
 class MainWindow(QMainWindow):
     def __init__(self, app):
         super().__init__()
@@ -37,10 +60,14 @@ class MainWindow(QMainWindow):
         self.url_entry: QLineEdit | None = None
         self.path_entry: QLineEdit | None = None
         self.status_debounce: QTimer | None = None
+        self.url_edited_us: int | None = None
         self.preview_title_label: QLabel | None = None
         self.preview_spinner: QProgressBar | None = None
         self.auto_output: QCheckBox | None = None
         self.previous_path: str | None = None
+        self.download_progress: QProgressBar | None = None
+        self.download_status_label: QLabel | None = None
+        self.queue_view: QTreeWidget | None = None
 
         self.setWindowTitle("MuseScore scrapper")
         self.setFixedSize(settings.WINDOW_GEOMETRY[0], settings.WINDOW_GEOMETRY[1])
@@ -53,12 +80,15 @@ class MainWindow(QMainWindow):
     def fetch_title(self):
         self.app.fetch_title()
 
+    def paste_list(self):
+        self.app.enqueue_list(QApplication.clipboard().text())
+
     def browse_save_location(self):
         if getattr(self, "auto_output", None) and self.auto_output.isChecked():
             directory = QFileDialog.getExistingDirectory(
                 self,
                 "Choisir un dossier de destination",
-                self.path_entry.text() or QStandardPaths.writableLocation(settings.DEFAULT_FOLDER_LOCATION),
+                self.path_entry.text() or default_folder(),
                 options=QFileDialog.Option.ShowDirsOnly,
             )
             if directory:
@@ -68,31 +98,29 @@ class MainWindow(QMainWindow):
             file_path, _ = QFileDialog.getSaveFileName(
                 self,
                 "Choisir un fichier de sortie",
-                self.path_entry.text() or QStandardPaths.writableLocation(settings.DEFAULT_FOLDER_LOCATION),
+                self.path_entry.text() or default_folder(),
             )
             if file_path:
                 self.path_entry.setText(file_path)
         self.check_path(self.path_entry.text())
 
     def check_url(self, text: str):
-        url_patterns = [
-            ("score utilisateur", re.compile(r"^https://(?:www\.)?musescore\.com/user/[0-9]+/scores/[0-9]+$")),
-            ("score officiel", re.compile(r"^https://(?:www\.)?musescore\.com/official_scores/scores/[0-9]+$")),
-            ("autre site", re.compile(r"^https://[a-zA-Z0-9\-.]+\.[a-z]{2,}/.*$"))
-        ]
+        info = classify(text)
 
         global button_status
-        for match_type, pattern in url_patterns:
-            if pattern.match(text):
-                button_status |= 0b10
-                self.url_type_label.setText(f"Type : {match_type}")
-                self.url_type_label.setStyleSheet("color: gray")
-
-                self.app.result_url = self.url_entry.text()
-                self.status_debounce.start()
-                break
+        if info.kind != UrlKind.INVALID:
+            button_status |= 0b10
+            self.url_type_label.setText(f"Type : {URL_KIND_LABELS[info.kind]}")
+            self.url_type_label.setStyleSheet("color: gray")
+
+            self.app.result_url = info.canonical
+            if tracing.ENABLED:
+                self.url_edited_us = tracing.now_us()
+            self.status_debounce.start()
         else:
             button_status &= 0b01
+            self.status_debounce.stop()
+            self.app.cancel_title()
             self.url_type_label.setText("URL invalide")
             self.url_type_label.setStyleSheet("color: red")
 
@@ -197,7 +225,7 @@ class MainWindow(QMainWindow):
         save_layout_vertical.addLayout(save_label_layout)
 
         self.path_entry = QLineEdit()
-        self.path_entry.setText(str(Path(QStandardPaths.writableLocation(settings.DEFAULT_FOLDER_LOCATION))
+        self.path_entry.setText(str(Path(default_folder())
                                     / settings.DEFAULT_FILE_NAME))
         self.previous_path = self.path_entry.text()
         self.path_entry.textChanged.connect(self.check_path)
@@ -229,14 +257,37 @@ class MainWindow(QMainWindow):
         button_layout = QHBoxLayout()
         cancel_button = QPushButton("Annuler")
         cancel_button.clicked.connect(self.close)
+        paste_button = QPushButton("Coller une liste")
+        paste_button.setToolTip("Ajouter à la file les adresses copiées, une par ligne")
+        paste_button.clicked.connect(self.paste_list)
         self.validate_button = QPushButton("Récupérer")
         self.validate_button.setDefault(True)
         self.validate_button.clicked.connect(self.scrap)
         self.validate_button.setEnabled(False)
         button_layout.addWidget(cancel_button)
+        button_layout.addWidget(paste_button)
         button_layout.addWidget(self.validate_button)
         main_layout.addLayout(button_layout)
 
+        # Download progress section
+        progress_layout = QHBoxLayout()
+        self.download_progress = QProgressBar(self)
+        self.download_progress.setTextVisible(False)
+        self.download_progress.setVisible(False)
+        self.download_status_label = QLabel("", self)
+        self.download_status_label.setStyleSheet("color: gray")
+        progress_layout.addWidget(self.download_progress)
+        progress_layout.addWidget(self.download_status_label, alignment=Qt.AlignmentFlag.AlignRight)
+        main_layout.addLayout(progress_layout)
+
+        # Download queue section
+        self.queue_view = QTreeWidget(self)
+        self.queue_view.setHeaderLabels(["Partition", "Progression"])
+        self.queue_view.setRootIsDecorated(False)
+        self.queue_view.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.queue_view.header().setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
+        main_layout.addWidget(self.queue_view)
+
 
         main_layout.addSpacerItem(
             QSpacerItem(0, 0, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding)
@@ -252,7 +303,7 @@ class MainWindow(QMainWindow):
 
 
 class GUIManager(Worker, QApplication):
-    METHODS = Worker.METHODS + ["mainloop", "set_title"]
+    METHODS = Worker.METHODS + ["mainloop", "set_title", "scrap_progress", "scrap_finished"]
 
     def __init__(self, address: str, handler: Handler):
         QApplication.__init__(self, sys.argv)
@@ -263,12 +314,24 @@ class GUIManager(Worker, QApplication):
         self.window: MainWindow | None = None
 
         self._preview_task: asyncio.Task | None = None
+        self._title_request_id = 0
+        self._title_pending = False
+        self._message_notifier: QSocketNotifier | QTimer | None = None
+        self._jobs: dict[int, DownloadJob] = {}
+        self._next_job_id = 0
+        self._pending_progress: dict[int, tuple] = {}
+        self._progress_timer: QTimer | None = None
 
     def init(self) -> list[Message]:
         if self._is_init:
             raise RuntimeError("Cannot initialize GUI twice")
         logger.info("Initialising the GUI")
         self.window = MainWindow(self)
+        # Progress updates are applied at most once per frame, whatever their rate
+        self._progress_timer = QTimer(self)
+        self._progress_timer.setSingleShot(True)
+        self._progress_timer.setInterval(int(settings.PROGRESS_INTERVAL_SEC * 1000))
+        self._progress_timer.timeout.connect(self.flush_progress)
         return super().init()
 
     def close(self) -> list[Message]:
@@ -282,31 +345,143 @@ class GUIManager(Worker, QApplication):
     def scrap(self):
         logger.info(f"URL validated : {self.result_url}")
         logger.info(f"Path validated : {self.result_path}")
-        self._handler.send_message("page", ("scrap", (self.result_url,), {}))
+        self.enqueue(self.result_url, self.result_path)
+
+    def enqueue(self, url: str, result_path: str):
+        job = DownloadJob(self._next_job_id, url, result_path, QTreeWidgetItem([url, "En attente"]))
+        self._next_job_id += 1
+        self._jobs[job.job_id] = job
+        self.window.queue_view.addTopLevelItem(job.item)
+        self._handler.send_message("page", ("scrap", (url, result_path), {"job_id": job.job_id}))
+        self.update_overall_progress()
+
+    def enqueue_list(self, text: str):
+        # Pasted scores are named after their id next to the current output path
+        directory = Path(self.result_path).parent if self.result_path else Path(default_folder())
+        queued = (classify(job.url).key for job in self._jobs.values() if not job.finished)
+        result = classify_many(text.splitlines(), seen=queued)
+        for info in result.accepted:
+            self.enqueue(info.canonical, str(directory / f"{info.score_id}.pdf"))
+        added, ignored = len(result.accepted), len(result.rejected) + result.duplicates
+        logger.info(f"Queued {added} pasted URLs ({len(result.rejected)} invalid, {result.duplicates} duplicates)")
+        self.window.download_status_label.setStyleSheet("color: gray")
+        self.window.download_status_label.setText(
+            f"{added} partition(s) ajoutée(s)" + (f", {ignored} ignorée(s)" if ignored else ""))
 
     def fetch_title(self):
+        self._title_request_id += 1
+        self._title_pending = True
         self.window.preview_spinner.setVisible(True)
         self.window.preview_title_label.setText("")
-        self._handler.send_message("page", ("fetch_title", (self.result_url,), {}))
+        # The trace starts at the last keystroke so that it covers the debounce
+        trace = tracing.begin(self.window.url_edited_us) if tracing.ENABLED else None
+        self._handler.send_message("page", ("fetch_title", (self.result_url,),
+                                            {"request_id": self._title_request_id}), trace)
+
+    def cancel_title(self):
+        if not self._title_pending:
+            return
+        self._title_request_id += 1
+        self._title_pending = False
+        self.window.preview_spinner.setVisible(False)
+        self._handler.send_message("page", "cancel_title")
 
-    def set_title(self, title: str) -> list[Message]:
+    def set_title(self, title: str, request_id: int | None = None) -> list[Message]:
+        if request_id is not None and request_id != self._title_request_id:
+            logger.info(f"Discarded stale title (request {request_id}, current {self._title_request_id})")
+            return []
+        self._title_pending = False
         self.window.preview_title_label.setText(title)
         self.window.update_path_with_title(title)
         self.window.preview_spinner.setVisible(False)
         return []
 
+    def scrap_progress(self, done: int, total: int, job_id: int | None = None, bytes_downloaded: int = 0,
+                       pages_per_sec: float = 0.0, bytes_per_sec: float = 0.0,
+                       eta_sec: float | None = None) -> list[Message]:
+        if job_id not in self._jobs:
+            return []
+        self._pending_progress[job_id] = (done, total, bytes_per_sec, eta_sec)
+        if not self._progress_timer.isActive():
+            self._progress_timer.start()
+        return []
+
+    def flush_progress(self):
+        for job_id, (done, total, bytes_per_sec, eta_sec) in self._pending_progress.items():
+            job = self._jobs[job_id]
+            job.done, job.total = done, total
+            text = f"{done}/{total} pages · {bytes_per_sec / 1024:.0f} Ko/s"
+            if eta_sec is not None and done < total:
+                text += f" · {eta_sec:.0f} s restantes"
+            job.item.setText(1, text)
+        self._pending_progress.clear()
+        self.update_overall_progress()
+
+    def update_overall_progress(self):
+        running = [job for job in self._jobs.values() if not job.finished]
+        if not running:
+            self.window.download_progress.setVisible(False)
+            return
+        self.window.download_progress.setVisible(True)
+        if any(job.total == 0 for job in running):
+            # Some scores are still looking for their pages
+            self.window.download_progress.setRange(0, 0)
+        else:
+            self.window.download_progress.setRange(0, sum(job.total for job in running))
+            self.window.download_progress.setValue(sum(job.done for job in running))
+        self.window.download_status_label.setStyleSheet("color: gray")
+        self.window.download_status_label.setText(f"{len(running)} partition(s) en cours")
+
+    def scrap_finished(self, success: bool, detail: str, job_id: int | None = None,
+                       title: str | None = None, elapsed_sec: float = 0.0) -> list[Message]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return []
+        self._pending_progress.pop(job_id, None)
+        job.finished = True
+        job.success = success
+        if title:
+            job.item.setText(0, title)
+        if success:
+            logger.info(f"Score saved : {detail}")
+            job.item.setText(1, f"Enregistrée en {elapsed_sec:.0f} s")
+            job.item.setForeground(1, Qt.GlobalColor.darkGreen)
+        else:
+            logger.error(f"Scrap failed : {detail}")
+            job.item.setText(1, "Échec du téléchargement")
+            job.item.setToolTip(1, detail)
+            job.item.setForeground(1, Qt.GlobalColor.red)
+        self.update_overall_progress()
+        if all(job.finished for job in self._jobs.values()):
+            failed = sum(1 for job in self._jobs.values() if not job.success)
+            self.window.download_status_label.setText("File terminée" + (f", {failed} échec(s)" if failed else ""))
+            self.window.download_status_label.setStyleSheet("color: red" if failed else "color: green")
+        return []
+
+    def process_messages(self):
+        while self._handler.listen_step():
+            pass
+        if not self._handler.is_running:
+            self.quit()
+
     def mainloop(self) -> list[Message]:
         logger.info("Starting the GUI")
         self.window.show()
 
-        timer = QTimer()
-        timer.timeout.connect(self._handler.listen_step)
-        timer.start(int(1000 / 60))
+        if sys.platform == "win32":
+            # QSocketNotifier only works with sockets on Windows, not with pipes
+            self._message_notifier = QTimer(self)
+            self._message_notifier.timeout.connect(self.process_messages)
+            self._message_notifier.start(int(settings.GUI_MESSAGE_POLL_INTERVAL_SEC * 1000))
+        else:
+            self._message_notifier = QSocketNotifier(self._handler.fileno(), QSocketNotifier.Type.Read, self)
+            self._message_notifier.activated.connect(self.process_messages)
 
         QtAsyncio.run(handle_sigint=True)
         return [(self._address, "manager", "request_shutdown")]
 
 
-def multiprocess_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int):
-    gui_handler = Handler(GUIManager, "gui", send_queue, recv_queue, ppid)
+def multiprocess_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int,
+                      peers: dict[str, mp.Queue] | None = None):
+    gui_handler = Handler(GUIManager, "gui", send_queue, recv_queue, ppid, peers)
     gui_handler.listen()
@@ -1,78 +1,466 @@
+import importlib
+import itertools
 import logging
 import multiprocessing as mp
 import multiprocessing.connection
 import os
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable
 
-from utils import serialize_send, Order
-from gui_manager import multiprocess_main as gui_worker
-from page_manager import multiprocess_main as page_worker
+import import_timer
+import metrics
+import settings
+import shared_payload
+import tracing
+from utils import serialize_send, queue_fileno, Order
 
 
 logger = logging.getLogger(__name__)
 
+
+def worker_entry(module: str, /, **kwargs):
+    # Worker modules are only imported by the process that runs them: the
+    # manager loads neither Qt nor Playwright, each worker only its own stack.
+    with import_timer.measure() as timer:
+        worker_module = importlib.import_module(module)
+    timer.log(module, settings.IMPORT_TIME_TOP)
+    worker_module.multiprocess_main(**kwargs)
+
+
+def worker_kind(func: Callable) -> Callable | str:
+    # The module, or else the function, a worker runs
+    while isinstance(func, partial):
+        if func.func is worker_entry:
+            return func.args[0]
+        func = func.func
+    return func
+
+
+@dataclass
+class InFlightOrder:
+    sender: str
+    what: Order
+    # Until the order gets its slot or thread it is only waiting, and not timed
+    started: float | None
+    attempts: int = 1
+
+    @property
+    def method(self) -> str:
+        return self.what[0] if isinstance(self.what, tuple) else self.what
+
+
+@dataclass
+class Supervision:
+    # What the manager knows of the current process of a supervised worker,
+    # the orders it has been sent and not finished being keyed by the tokens
+    # of the journal.
+    pid: int
+    in_flight: dict[int, InFlightOrder] = field(default_factory=dict)
+    ready: bool = False
+    healthy: bool = True
+    last_ping: float = 0.0
+    ping_sent: float | None = None
+    restarted: float | None = None
+    restarts: list[float] = field(default_factory=list)
+
+
 class HandlerManager:
     ADDRESS = "manager"
-    WORKERS = {"gui": gui_worker, "page": page_worker}
+    WORKERS = {"gui": "gui_manager", "page": "page_manager", "dump": "dump_manager"}
 
-    def __init__(self):
+    def __init__(self, workers: dict[str, Callable | str] | None = None, main_worker: str = "gui",
+                 direct_channels: bool = settings.DIRECT_CHANNELS, supervised: Iterable[str] | None = None,
+                 standby: bool = settings.SUPERVISOR_STANDBY, metrics_port: int | None = settings.METRICS_PORT,
+                 metrics_file: Path | None = settings.METRICS_FILE if settings.METRICS_TO_FILE else None):
+        # Workers are given by function or by the name of their module
+        self._worker_funcs = {name: partial(worker_entry, func) if isinstance(func, str) else func
+                              for name, func in (workers if workers is not None else self.WORKERS).items()}
+        self._main_worker = main_worker
+        self._direct_channels = direct_channels
+        # Every worker but the main one is restarted when it fails. The standby
+        # runs the function of the first supervised one, under its own name, and
+        # only takes over the workers running the same module or function.
+        self._supervised = list(supervised) if supervised is not None else [
+            name for name in self._worker_funcs if name != main_worker]
+        self._standby_enabled = standby and bool(self._supervised)
+        self._standby_for = {name for name in self._supervised if worker_kind(self._worker_funcs[name])
+                             == worker_kind(self._worker_funcs[self._supervised[0]])}
         self._workers: dict[str, tuple[mp.Queue, mp.Process]] = {}
-        self._recv_queue = mp.Queue()
+        # Every process writes to the manager on a queue of its own, so that a
+        # killed worker never leaves a queue of the others half written
+        self._recv_queues: dict[str, mp.Queue] = {}
         self._running_count = 0
 
+        self._supervision: dict[str, Supervision] = {}
+        self._tokens = itertools.count()
+        self._origins: dict[str, str] = {}
+        self._stopped: set[str] = set()
+        self._closing = False
+        self._standby: str | None = None
+        self._standby_initialised = False
+        self._standby_ready = False
+        self._standby_restarts: list[float] = []
+
+        self._metrics_port = metrics_port
+        self._metrics_file = metrics_file
+        self._exporter: metrics.Exporter | None = None
+        self._metrics_due = 0.0
+
+    def _spawn(self, name: str, worker_func: Callable, recv_queue: mp.Queue, peers: dict[str, mp.Queue], /,
+               **kwargs) -> mp.Process:
+        self._recv_queues[name] = mp.Queue()
+        proc = mp.Process(target=worker_func, kwargs={"send_queue": self._recv_queues[name],
+                                                      "recv_queue": recv_queue,
+                                                      "ppid": os.getpid(),
+                                                      "peers": peers, **kwargs})
+        proc.start()
+        return proc
+
     def start_all_workers(self):
-        for name, worker_func in self.WORKERS.items():
-            send_queue = mp.Queue()
-            proc = mp.Process(target=worker_func, kwargs={"send_queue": self._recv_queue,
-                                                          "recv_queue": send_queue,
-                                                          "ppid": os.getpid()})
-            self._workers[name] = send_queue, proc
-            proc.start()
+        if self._metrics_port is not None or self._metrics_file is not None:
+            self._exporter = metrics.Exporter(self._metrics_port, self._metrics_file)
+        # With direct channels every worker writes straight into the queues of
+        # the other workers: only lifecycle messages go through the manager.
+        inbound = {name: mp.Queue() for name in self._worker_funcs}
+        for name, worker_func in self._worker_funcs.items():
+            send_queue = inbound[name]
+            peers = {peer: queue for peer, queue in inbound.items()
+                     if peer != name} if self._direct_channels else {}
+            self._workers[name] = send_queue, self._spawn(name, worker_func, send_queue, peers)
+            self._origins[name] = name
             self._running_count += 1
+        for name in self._supervised:
+            self._supervision[name] = Supervision(self._workers[name][1].pid)
+        if self._standby_enabled:
+            self.start_standby()
+
+    def _peer_queues(self, name: str) -> dict[str, mp.Queue]:
+        # The direct channels of a new process, to the current queues of the
+        # others. The standby is only reached through the manager.
+        if not self._direct_channels:
+            return {}
+        return {peer: queue for peer, (queue, proc) in self._workers.items() if peer not in (name, self._standby)}
+
+    def start_standby(self):
+        in_use = set(self._origins.values())
+        name = next(f"standby-{index}" for index in itertools.count() if f"standby-{index}" not in in_use)
+        send_queue = mp.Queue()
+        proc = self._spawn(name, self._worker_funcs[self._supervised[0]], send_queue, self._peer_queues(name),
+                           name=name)
+        self._workers[name] = send_queue, proc
+        self._origins[name] = name
+        self._running_count += 1
+        self._standby = name
+        self._standby_initialised = self._standby_ready = False
+        logger.info(f"Started standby worker {name}")
+
+    def init_standby(self):
+        # The standby launches its browser once the workers it backs are ready,
+        # not to slow their own startup down.
+        if self._standby is None or self._standby_initialised or self._closing:
+            return
+        if all(state.ready for state in self._supervision.values()):
+            self._standby_initialised = True
+            serialize_send(self.ADDRESS, self._workers[self._standby][0], to=self._standby, what="init")
 
     def init_all_workers(self):
         for name, (send_queue, proc) in self._workers.items():
-            serialize_send(self.ADDRESS, send_queue, to=name, what="init")
+            if name != self._standby:
+                serialize_send(self.ADDRESS, send_queue, to=name, what="init")
 
     def close_all_workers(self):
+        if self._closing:
+            return
+        self._closing = True
         for name, (send_queue, proc) in self._workers.items():
-            serialize_send(self.ADDRESS, send_queue, to=name, what="close")
+            if name in self._stopped:
+                continue
+            if name == self._standby and not self._standby_initialised:
+                serialize_send(self.ADDRESS, send_queue, to=name, what="_shutdown")
+                self._stopped.add(name)
+                self._running_count -= 1
+            else:
+                serialize_send(self.ADDRESS, send_queue, to=name, what="close")
 
     def wait_all_workers(self):
+        if self._exporter is not None:
+            self._collect_own_metrics()
+            self._exporter.publish()
+            self._exporter.close()
         for name, (send_queue, proc) in self._workers.items():
             proc.join(timeout=1.0)
             if proc.is_alive():
                 proc.terminate()
                 proc.join()
             send_queue.close()
-        self._recv_queue.close()
+        for recv_queue in self._recv_queues.values():
+            recv_queue.close()
+        if orphans := shared_payload.unlink_orphans(os.getpid()):
+            logger.warning(f"Removed {orphans} shared payloads that were never handled")
+
+    def _within_budget(self, restarts: list[float]) -> bool:
+        now = time.monotonic()
+        restarts[:] = [restart for restart in restarts if now - restart < settings.SUPERVISOR_RESTART_WINDOW_SEC]
+        restarts.append(now)
+        return len(restarts) <= settings.SUPERVISOR_MAX_RESTARTS
+
+    def restart_worker(self, name: str, reason: str):
+        old_queue, proc = self._workers[name]
+        state = self._supervision[name]
+        logger.error(f"Worker {name} {reason}, restarting it")
+        metrics.inc("worker_restarts_total", target=name)
+        if proc.is_alive():
+            proc.kill()
+        proc.join()
+        if not self._within_budget(state.restarts):
+            logger.critical(f"Worker {name} failed {len(state.restarts)} times in "
+                            f"{settings.SUPERVISOR_RESTART_WINDOW_SEC:.0f} s, shutting down")
+            self.worker_stopped(name)
+            return
+
+        # The journaled orders the failed process had not finished are sent
+        # again, whether they were still waiting in its queue or not. Those it
+        # was running only a limited number of times: they may make it fail again.
+        replay = []
+        for order in state.in_flight.values():
+            if order.started is None:
+                replay.append(order)
+            elif order.attempts >= settings.SUPERVISOR_MAX_ATTEMPTS:
+                logger.error(f"Dropping order {order.method} from {order.sender} after {order.attempts} attempts")
+                self._fail_order(name, order, f"Abandonné après {order.attempts} tentatives")
+            else:
+                replay.append(InFlightOrder(order.sender, order.what, None, order.attempts + 1))
+
+        # The killed process may have died reading its queue or writing to the
+        # manager, the new one gets queues of its own. Queues can only be
+        # handed to a process when it starts: the other workers reach the new
+        # one through the manager from now on. The other messages left in the
+        # old queue are lost, they are cheap to ask again.
+        self._discard(old_queue)
+        self._discard(self._recv_queues.pop(name))
+        if self._standby is not None and name in self._standby_for:
+            standby = self._standby
+            send_queue, proc = self._workers.pop(standby)
+            self._recv_queues[name] = self._recv_queues.pop(standby)
+            serialize_send(self.ADDRESS, send_queue, to=standby, what=("_adopt", (name,), {}))
+            if not self._standby_initialised:
+                # Taken over before its turn to start, it starts as a new process would
+                serialize_send(self.ADDRESS, send_queue, to=name, what="init")
+            self._origins[name] = self._origins.pop(standby)
+            if self._exporter is not None:
+                self._exporter.forget(standby)
+            self._running_count -= 1
+            ready = self._standby_ready
+            self._standby = None
+            logger.info(f"Standby {standby} takes over {name}")
+        else:
+            send_queue = mp.Queue()
+            proc = self._spawn(name, self._worker_funcs[name], send_queue, self._peer_queues(name))
+            self._origins[name] = name
+            ready = False
+            serialize_send(self.ADDRESS, send_queue, to=name, what="init")
+        self._workers[name] = send_queue, proc
+        self._supervision[name] = Supervision(proc.pid, ready=ready, restarted=time.monotonic(),
+                                              restarts=state.restarts)
+        for peer, (peer_queue, peer_proc) in self._workers.items():
+            if peer != name and peer not in self._stopped:
+                serialize_send(self.ADDRESS, peer_queue, to=peer, what=("_reroute", (name,), {}))
+        for order in replay:
+            serialize_send(order.sender, send_queue, to=name, what=self._journal(name, order))
+        if replay:
+            logger.info(f"Replayed {len(replay)} orders to {name}")
+
+        if self._standby_enabled and self._standby is None:
+            if self._within_budget(self._standby_restarts):
+                self.start_standby()
+                self.init_standby()
+            else:
+                logger.error("Standby workers fail too often, going on without one")
+
+    def _fail_order(self, name: str, order: InFlightOrder, detail: str):
+        # Whoever waits for a dropped scrap or dump is told it failed, on behalf
+        # of the worker, else the job would stay pending forever
+        func, args, kwargs = order.what if isinstance(order.what, tuple) else (order.what, (), {})
+        if func not in ("scrap", "dump"):
+            return
+        # The default of both methods
+        reply_to = kwargs.get("reply_to", "gui")
+        if reply_to not in self._workers or reply_to in self._stopped:
+            return
+        serialize_send(name, self._workers[reply_to][0], to=reply_to, what=("scrap_finished", (False, detail), {
+            "job_id": kwargs.get("job_id"),
+            "title": kwargs.get("title"),
+            "elapsed_sec": kwargs.get("elapsed_sec", 0.0),
+        }))
+
+    @staticmethod
+    def _discard(queue: mp.Queue):
+        # Nothing reads the queue any more, what its writers still buffer is lost
+        queue.cancel_join_thread()
+        queue.close()
+
+    def worker_stopped(self, name: str):
+        self._stopped.add(name)
+        self._supervision.pop(name, None)
+        self._running_count -= 1
+        self.close_all_workers()
+
+    def _failure(self, state: Supervision, now: float) -> str | None:
+        if not state.healthy:
+            return "reported itself unhealthy"
+        if state.ping_sent is not None and now - state.ping_sent > settings.SUPERVISOR_PING_TIMEOUT_SEC:
+            return f"did not answer a ping in {settings.SUPERVISOR_PING_TIMEOUT_SEC:.0f} s"
+        for order in state.in_flight.values():
+            limit = settings.SUPERVISOR_ORDER_TIMEOUT_SEC.get(order.method)
+            if limit is not None and order.started is not None and now - order.started > limit:
+                return f"spent more than {limit:.0f} s on {order.method}"
+        return None
+
+    def supervise(self):
+        now = time.monotonic()
+        for name, (send_queue, proc) in list(self._workers.items()):
+            if name in self._stopped:
+                continue
+            state = self._supervision.get(name)
+            if proc.exitcode is not None:
+                if self._closing:
+                    self._stopped.add(name)
+                    self._running_count -= 1
+                elif name == self._standby:
+                    logger.error(f"Standby {name} exited with code {proc.exitcode}")
+                    proc.join()
+                    del self._workers[name], self._origins[name]
+                    self._discard(self._recv_queues.pop(name))
+                    self._running_count -= 1
+                    self._standby = None
+                    if self._within_budget(self._standby_restarts):
+                        self.start_standby()
+                        self.init_standby()
+                elif state is not None:
+                    self.restart_worker(name, f"exited with code {proc.exitcode}")
+                else:
+                    logger.critical(f"Worker {name} exited with code {proc.exitcode}, shutting down")
+                    self.worker_stopped(name)
+            elif state is not None and not self._closing:
+                if (reason := self._failure(state, now)) is not None:
+                    self.restart_worker(name, reason)
+                elif state.ready and state.ping_sent is None and \
+                        now - state.last_ping >= settings.SUPERVISOR_PING_INTERVAL_SEC:
+                    state.last_ping = state.ping_sent = now
+                    serialize_send(self.ADDRESS, send_queue, to=name, what="_ping")
+
+    def _collect_own_metrics(self):
+        metrics.set_gauge("workers_running", self._running_count)
+        for name, (send_queue, proc) in self._workers.items():
+            try:
+                metrics.set_gauge("queue_depth", send_queue.qsize(), target=name)
+            except NotImplementedError:
+                break
+        for name, state in self._supervision.items():
+            metrics.set_gauge("in_flight_orders", len(state.in_flight), target=name)
+        self._exporter.update(self.ADDRESS, metrics.registry.snapshot())
+
+    def collect_metrics(self):
+        # Publishes what the workers reported during the previous interval,
+        # then asks them for their next snapshot
+        now = time.monotonic()
+        if self._exporter is None or now < self._metrics_due:
+            return
+        self._metrics_due = now + settings.METRICS_INTERVAL_SEC
+        self._collect_own_metrics()
+        self._exporter.publish()
+        if self._closing:
+            return
+        for name, (send_queue, proc) in self._workers.items():
+            if name not in self._stopped:
+                serialize_send(self.ADDRESS, send_queue, to=name, what="_metrics")
+
+    def _journal(self, name: str, order: InFlightOrder) -> Order:
+        # The order is kept until the worker reports it finished, and wrapped
+        # with its token for the worker to report it
+        token = next(self._tokens)
+        self._supervision[name].in_flight[token] = order
+        return "_journaled", (token, order.what), {}
+
+    def handle_journal(self, sender: str, func: str, args: tuple):
+        # Tokens are never reused: those of a process that has since been
+        # replaced are not found
+        if (state := self._supervision.get(sender)) is None or (order := state.in_flight.get(args[0])) is None:
+            return
+        if func == "_running":
+            order.started = time.monotonic()
+        else:
+            del state.in_flight[args[0]]
 
     def handle_message(self, sender: str, what: Order) -> None:
-        if what == "finished_init":
+        func, args, kwargs = what if isinstance(what, tuple) else (what, (), {})
+        if func == "finished_init":
+            if sender not in self._workers:
+                # Sent by a standby before it took over a worker
+                sender = next((name for name, origin in self._origins.items() if origin == sender), sender)
             logger.info(f"Finished initialization: {sender}")
-            if sender == "gui":
-                serialize_send(self.ADDRESS, self._workers["gui"][0], to="gui", what="mainloop")
-        elif what == "finished_close":
+            if sender == self._main_worker:
+                serialize_send(self.ADDRESS, self._workers[sender][0], to=sender, what="mainloop")
+            if sender == self._standby:
+                self._standby_ready = True
+            if (state := self._supervision.get(sender)) is not None:
+                state.ready = True
+                self.init_standby()
+        elif func == "finished_close":
             logger.info(f"Finished closing: {sender}")
             serialize_send(self.ADDRESS, self._workers[sender][0], to=sender, what="_shutdown")
+            self._stopped.add(sender)
             self._running_count -= 1
-        elif what == "request_shutdown":
+        elif func == "request_shutdown":
             logger.info(f"Received shutdown request: {sender}")
             self.close_all_workers()
+        elif func == "_pong":
+            if (state := self._supervision.get(sender)) is not None:
+                state.ping_sent = None
+                state.healthy = args[0]
+                if state.restarted is not None:
+                    logger.info(f"Worker {sender} answers again "
+                                f"{(time.monotonic() - state.restarted) * 1000:.0f} ms after its restart")
+                    state.restarted = None
+        elif func in ("_running", "_finished"):
+            self.handle_journal(sender, func, args)
+        elif func == "_metrics":
+            if self._exporter is not None:
+                self._exporter.update(sender, args[0])
+
+    def relay(self, message: tuple):
+        sender, receiver, what = message[:3]
+        trace = message[3] if len(message) > 3 else None
+        metrics.inc("messages_total", target=receiver)
+
+        if receiver == self.ADDRESS:
+            self.handle_message(sender, what)
+        elif receiver in self._workers:
+            send_queue, proc = self._workers[receiver]
+            if trace is not None:
+                tracing.stamp(trace, "relay")
+            method = what[0] if isinstance(what, tuple) else what
+            if receiver in self._supervision and method in settings.SUPERVISOR_JOURNALED:
+                what = self._journal(receiver, InFlightOrder(sender, what, None))
+            serialize_send(sender, send_queue, to=receiver, what=what, trace=trace)
+        else:
+            raise RuntimeError(f"Worker {receiver} not found")
 
     def listen_all_workers(self):
         self.init_all_workers()
 
         while self._running_count > 0:
-            message = self._recv_queue.get()
-            sender, receiver, what = message
-
-            if receiver == self.ADDRESS:
-                self.handle_message(sender, what)
-            elif receiver in self._workers:
-                send_queue, proc = self._workers[receiver]
-                serialize_send(sender, send_queue, to=receiver, what=what)
-            else:
-                raise RuntimeError(f"Worker {receiver} not found")
+            self.supervise()
+            self.collect_metrics()
+            readers = {queue_fileno(recv_queue): recv_queue for name, recv_queue in self._recv_queues.items()
+                       if name not in self._stopped}
+            sentinels = [proc.sentinel for name, (_, proc) in self._workers.items() if name not in self._stopped]
+            for ready in multiprocessing.connection.wait([*readers, *sentinels], timeout=settings.SUPERVISOR_TICK_SEC):
+                if ready in readers:
+                    self.relay(readers[ready].get())
 
     def run(self):
         self.start_all_workers()
@@ -0,0 +1,208 @@
+import codecs
+import http.client
+import logging
+import threading
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Iterator
+from urllib.parse import urljoin, urlsplit
+
+logger = logging.getLogger(__name__)
+
+HostKey = tuple[str, str, int]
+
+
+class HTTPEngineError(Exception):
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass(frozen=True)
+class HeadResult:
+    url: str
+    status: int
+    title: str | None
+    og_title: str | None
+
+
+class _HeadParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title: str | None = None
+        self.og_title: str | None = None
+        self.done = False
+        self._in_title = False
+        self._title_parts: list[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and self.title is None:
+            self._in_title = True
+        elif tag == "meta":
+            attributes = dict(attrs)
+            if attributes.get("property") == "og:title" and attributes.get("content"):
+                self.og_title = attributes["content"].strip()
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts).strip()
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+
+
+class ConnectionPool:
+    def __init__(self, *, max_per_host: int, timeout: float):
+        self._max_per_host = max_per_host
+        self._timeout = timeout
+        self._idle: defaultdict[HostKey, list[http.client.HTTPConnection]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_key(url: str) -> HostKey:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise HTTPEngineError(f"Unsupported URL: {url}")
+        return parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+
+    def _acquire(self, key: HostKey) -> http.client.HTTPConnection:
+        with self._lock:
+            if self._idle[key]:
+                return self._idle[key].pop()
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self._timeout)
+        return http.client.HTTPConnection(host, port, timeout=self._timeout)
+
+    def _release(self, key: HostKey, connection: http.client.HTTPConnection):
+        with self._lock:
+            if len(self._idle[key]) < self._max_per_host:
+                self._idle[key].append(connection)
+                return
+        connection.close()
+
+    @contextmanager
+    def request(self, method: str, url: str,
+                headers: dict[str, str] | None = None) -> Iterator[http.client.HTTPResponse]:
+        key = self.host_key(url)
+        parts = urlsplit(url)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+        connection = self._acquire(key)
+        try:
+            try:
+                connection.request(method, path, headers=headers or {})
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle keep-alive connection: retry once on a fresh one
+                connection.close()
+                connection.request(method, path, headers=headers or {})
+                response = connection.getresponse()
+            yield response
+        except BaseException:
+            connection.close()
+            raise
+        if response.isclosed():
+            self._release(key, connection)
+        else:
+            connection.close()
+
+    def close(self):
+        with self._lock:
+            connections = [connection for idle in self._idle.values() for connection in idle]
+            self._idle.clear()
+        for connection in connections:
+            connection.close()
+
+
+class HTTPEngine:
+    def __init__(self, *, user_agent: str, max_per_host: int = 4, timeout: float = 5.0,
+                 chunk_size: int = 16 * 1024, max_head_bytes: int = 512 * 1024,
+                 drain_limit: int = 256 * 1024, max_redirects: int = 5):
+        self.pool = ConnectionPool(max_per_host=max_per_host, timeout=timeout)
+        self._headers = {
+            "User-Agent": user_agent,
+            "Accept": "text/html,application/xhtml+xml",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        }
+        self._asset_headers = dict(self._headers, Accept="*/*")
+        self._chunk_size = chunk_size
+        self._max_head_bytes = max_head_bytes
+        self._drain_limit = drain_limit
+        self._max_redirects = max_redirects
+
+    @contextmanager
+    def _get(self, url: str, headers: dict[str, str]) -> Iterator[tuple[str, http.client.HTTPResponse]]:
+        for _ in range(self._max_redirects + 1):
+            with self.pool.request("GET", url, headers) as response:
+                if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                    self._drain(response)
+                    url = urljoin(url, response.getheader("Location"))
+                    continue
+                yield url, response
+                return
+        raise HTTPEngineError(f"Too many redirects: {url}")
+
+    def fetch_head(self, url: str) -> HeadResult:
+        with self._get(url, self._headers) as (url, response):
+            parser = self._parse_head(response)
+            self._drain(response)
+            return HeadResult(url, response.status, parser.title, parser.og_title)
+
+    def fetch_bytes(self, url: str) -> bytes:
+        with self._get(url, self._asset_headers) as (url, response):
+            if response.status != 200:
+                self._drain(response)
+                raise HTTPEngineError(f"Unexpected status {response.status} for {url}", response.status)
+            decompressor = self._decompressor(response)
+            data = response.read()
+            return decompressor.decompress(data) + decompressor.flush() if decompressor else data
+
+    @staticmethod
+    def _decompressor(response: http.client.HTTPResponse):
+        encoding = (response.getheader("Content-Encoding") or "identity").lower()
+        if encoding == "gzip":
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if encoding == "deflate":
+            return zlib.decompressobj()
+        if encoding == "identity":
+            return None
+        raise HTTPEngineError(f"Unsupported content encoding: {encoding}")
+
+    def _parse_head(self, response: http.client.HTTPResponse) -> _HeadParser:
+        decompressor = self._decompressor(response)
+        try:
+            decoder = codecs.getincrementaldecoder(response.headers.get_content_charset() or "utf-8")("replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+        parser = _HeadParser()
+        received = 0
+        while not parser.done and received < self._max_head_bytes:
+            chunk = response.read1(self._chunk_size)
+            if not chunk:
+                break
+            received += len(chunk)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            parser.feed(decoder.decode(chunk))
+        return parser
+
+    def _drain(self, response: http.client.HTTPResponse):
+        # Reading a short remainder keeps the connection reusable, a long one
+        # costs more than opening a new connection later.
+        if response.length is not None and response.length <= self._drain_limit:
+            response.read()
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,91 @@
+import importlib.abc
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ImportRecord:
+    name: str
+    self_us: int
+    cumulative_us: int
+
+
+class _TimedLoader(importlib.abc.Loader):
+    # Only stands in for the real loader while the module is created and run
+    def __init__(self, loader, timer: "ImportTimer"):
+        self._loader = loader
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__loader__ = module.__spec__.loader = self._loader
+        with self._timer.timing(module.__name__):
+            self._loader.exec_module(module)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    # The same figures as python -X importtime, gathered from inside a process
+    def __init__(self):
+        self.records: list[ImportRecord] = []
+        self.total_sec = 0.0
+        self._local = threading.local()
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            if (spec := finder.find_spec(name, path, target)) is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    @contextmanager
+    def timing(self, name: str) -> Iterator[None]:
+        # Each frame of the stack holds the time spent in nested imports
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0)
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            cumulative = time.perf_counter_ns() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            self.records.append(ImportRecord(name, (cumulative - nested) // 1000, cumulative // 1000))
+
+    def log(self, label: str, top: int):
+        logger.info(f"Startup phase 'import' of {label} took {self.total_sec * 1000:.0f} ms "
+                    f"({len(self.records)} modules)")
+        if not top:
+            return
+        logger.info("import time: self [us] | cumulative | imported package")
+        for record in sorted(self.records, key=lambda record: record.cumulative_us, reverse=True)[:top]:
+            logger.info(f"import time: {record.self_us:>9} | {record.cumulative_us:>10} | {record.name}")
+
+
+@contextmanager
+def measure() -> Iterator[ImportTimer]:
+    timer = ImportTimer()
+    sys.meta_path.insert(0, timer)
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        timer.total_sec = time.perf_counter() - start
+        sys.meta_path.remove(timer)
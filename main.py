@@ -1,22 +1,80 @@
+import argparse
 import logging
-import runpy
+import os
+import time
+from functools import partial
 
 import settings
-from handler_manager import HandlerManager
+from browser_profile import prune_profiles
+from handler_manager import HandlerManager, worker_entry
 
 logging.basicConfig(**settings.LOGGING_CONFIG)
-runpy.run_path(".venv/bin/activate_this.py")
 
 logger = logging.getLogger(__name__)
 handler_manager: HandlerManager
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Download scores from musescore.com")
+    parser.add_argument("--batch", metavar="URLS_FILE",
+                        help="download every URL of the file (one per line) without the GUI")
+    parser.add_argument("--workers", type=int, default=settings.BATCH_WORKERS or os.cpu_count() or 1,
+                        help="number of page workers in batch mode (default: one per core)")
+    parser.add_argument("--pages-per-worker", type=int, default=settings.BATCH_PAGES_PER_WORKER,
+                        help="browser pages, and concurrent scores, per page worker in batch mode")
+    parser.add_argument("--output-dir", default=settings.BATCH_OUTPUT_DIR,
+                        help="directory where the PDF files are written in batch mode")
+    parser.add_argument("--manifest", default=None,
+                        help="JSONL results manifest (default: manifest.jsonl in the output directory)")
+    parser.add_argument("--standby", action="store_true", default=settings.SUPERVISOR_STANDBY,
+                        help="keep a spare page worker with a launched browser to take over a failed one")
+    parser.add_argument("--metrics-port", type=int, default=settings.METRICS_PORT,
+                        help="serve runtime metrics on http://127.0.0.1:PORT/metrics (Prometheus text format)")
+    parser.add_argument("--metrics-file", action="store_true", default=settings.METRICS_TO_FILE,
+                        help="append runtime metrics to a rotating JSONL file in the cache directory")
+    return parser.parse_args()
+
+
+def batch_workers(args: argparse.Namespace) -> dict:
+    page_names = [f"page-{index}" for index in range(max(args.workers, 1))]
+    workers = {"batch": partial(worker_entry, "batch_manager",
+                                urls_file=args.batch,
+                                output_dir=args.output_dir,
+                                manifest=args.manifest or os.path.join(args.output_dir, "manifest.jsonl"),
+                                page_workers=page_names,
+                                jobs_per_worker=args.pages_per_worker)}
+    for name in page_names:
+        workers[name] = partial(worker_entry, "page_manager", name=name, pool_size=args.pages_per_worker,
+                                bulk_slots=args.pages_per_worker)
+    # A single dump worker converts on every core for all the page workers
+    workers["dump"] = partial(worker_entry, "dump_manager", jobs=len(page_names) * args.pages_per_worker)
+    return workers
+
+
+def prune_browser_profiles():
+    # Once for the profiles of every worker, those of earlier runs with other
+    # worker names included, before any browser of this run starts
+    start = time.perf_counter()
+    size = prune_profiles(settings.BROWSER_PROFILE_DIR, settings.BROWSER_PROFILE_MAX_BYTES)
+    logger.info(f"Startup phase 'profile prune' took {(time.perf_counter() - start) * 1000:.0f} ms"
+                f" ({size / 1e6:.0f} MB of profiles)")
+
+
 def main():
     global handler_manager
-    logger.info("Starting the application")
+    args = parse_args()
+    metrics_file = settings.METRICS_FILE if args.metrics_file else None
+    logger.info("Starting the application" + (f" in batch mode on {args.batch}" if args.batch else ""))
+    if settings.BROWSER_PERSISTENT_PROFILE:
+        prune_browser_profiles()
 
     try:
-        handler_manager = HandlerManager()
+        if args.batch:
+            handler_manager = HandlerManager(batch_workers(args), main_worker="batch", standby=args.standby,
+                                             metrics_port=args.metrics_port, metrics_file=metrics_file)
+        else:
+            handler_manager = HandlerManager(standby=args.standby, metrics_port=args.metrics_port,
+                                             metrics_file=metrics_file)
         handler_manager.run()
     except Exception as e:
         logger.critical(f"An error occurred (exiting) : {str(e)}")
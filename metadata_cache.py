@@ -0,0 +1,121 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ScoreMetadata:
+    score_id: int
+    title: str | None
+    not_found: bool
+    fetched_at: float
+
+
+class MetadataCache:
+    def __init__(self, path: Path, *, ttl_sec: float, negative_ttl_sec: float,
+                 max_entries: int, memory_entries: int):
+        self._path = path
+        self._ttl_sec = ttl_sec
+        self._negative_ttl_sec = negative_ttl_sec
+        self._max_entries = max_entries
+        self._memory_entries = memory_entries
+        self._memory: OrderedDict[int, ScoreMetadata] = OrderedDict()
+        # Access times of the memory hits, written to the database in batches
+        # so that its eviction order follows them
+        self._accessed: dict[int, float] = {}
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS scores (
+                score_id INTEGER PRIMARY KEY,
+                title TEXT,
+                not_found INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS scores_accessed_at ON scores (accessed_at)")
+        self.purge_expired()
+
+    def _is_fresh(self, entry: ScoreMetadata, now: float) -> bool:
+        ttl = self._negative_ttl_sec if entry.not_found else self._ttl_sec
+        return now - entry.fetched_at < ttl
+
+    def _remember(self, entry: ScoreMetadata):
+        self._memory[entry.score_id] = entry
+        self._memory.move_to_end(entry.score_id)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, score_id: int) -> ScoreMetadata | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(score_id)
+            if entry is not None:
+                if self._is_fresh(entry, now):
+                    self._memory.move_to_end(score_id)
+                    self._accessed[score_id] = now
+                    return entry
+                del self._memory[score_id]
+
+            row = self._db.execute(
+                "SELECT title, not_found, fetched_at FROM scores WHERE score_id = ?", (score_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            entry = ScoreMetadata(score_id, row[0], bool(row[1]), row[2])
+            if not self._is_fresh(entry, now):
+                self._db.execute("DELETE FROM scores WHERE score_id = ?", (score_id,))
+                return None
+            self._db.execute("UPDATE scores SET accessed_at = ? WHERE score_id = ?", (now, score_id))
+            self._remember(entry)
+            return entry
+
+    def _flush_accessed(self):
+        if self._accessed:
+            self._db.executemany("UPDATE scores SET accessed_at = ? WHERE score_id = ?",
+                                 [(accessed_at, score_id) for score_id, accessed_at in self._accessed.items()])
+            self._accessed.clear()
+
+    def put(self, score_id: int, title: str | None, not_found: bool = False) -> ScoreMetadata:
+        now = time.time()
+        entry = ScoreMetadata(score_id, title, not_found, now)
+        with self._lock:
+            self._flush_accessed()
+            self._db.execute(
+                "INSERT OR REPLACE INTO scores (score_id, title, not_found, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (score_id, title, int(not_found), now, now)
+            )
+            self._db.execute(
+                "DELETE FROM scores WHERE score_id IN ("
+                "SELECT score_id FROM scores ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self._max_entries,)
+            )
+            self._remember(entry)
+        return entry
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM scores WHERE (not_found = 0 AND fetched_at < ?) OR (not_found = 1 AND fetched_at < ?)",
+                (now - self._ttl_sec, now - self._negative_ttl_sec)
+            )
+        if cursor.rowcount:
+            logger.info(f"Purged {cursor.rowcount} expired metadata cache entries")
+
+    def close(self):
+        with self._lock:
+            self._flush_accessed()
+            self._memory.clear()
+            self._db.close()
@@ -0,0 +1,220 @@
+import bisect
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "msc_"
+
+# A series is a metric name and its sorted labels
+Key = tuple[str, tuple[tuple[str, str], ...]]
+# Counters, gauges and histograms (bucket counts, sum, count) of a process
+Snapshot = dict[str, dict[Key, float | tuple[list[int], float, int]]]
+
+
+def _key(name: str, labels: dict[str, str]) -> Key:
+    if len(labels) < 2:
+        return name, tuple(labels.items())
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    # Each process counts in its own registry, a dict update per event. The
+    # manager asks the workers for a snapshot once per interval.
+    def __init__(self, buckets: tuple[float, ...] = settings.METRICS_BUCKETS_SEC):
+        self._buckets = buckets
+        self._counters: defaultdict[Key, float] = defaultdict(float)
+        self._gauges: dict[Key, float] = {}
+        self._histograms: dict[Key, tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = _key(name, labels)
+        with self._lock:
+            if (histogram := self._histograms.get(key)) is None:
+                histogram = self._histograms[key] = [0] * (len(self._buckets) + 1), [0.0]
+            counts, total = histogram
+            counts[bisect.bisect_left(self._buckets, value)] += 1
+            total[0] += value
+
+    def snapshot(self) -> Snapshot:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {key: (list(counts), total[0], sum(counts))
+                               for key, (counts, total) in self._histograms.items()},
+            }
+
+
+registry = Registry()
+inc = registry.inc
+set_gauge = registry.set_gauge
+observe = registry.observe
+
+
+def _read_stat(pid: int | str) -> tuple[int, int] | None:
+    # Parent pid and resident size from /proc, where there is one
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    fields = data[data.rindex(b")") + 2:].split()
+    return int(fields[1]), int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_bytes(pid: int | None = None) -> int | None:
+    stat = _read_stat(pid or os.getpid())
+    return stat[1] if stat is not None else None
+
+
+def children_rss_bytes(pid: int | None = None) -> int | None:
+    # Resident size of every descendant, such as the browser processes
+    if not os.path.isdir("/proc"):
+        return None
+    children, sizes = defaultdict(list), {}
+    for entry in os.scandir("/proc"):
+        if entry.name.isdigit() and (stat := _read_stat(entry.name)) is not None:
+            children[stat[0]].append(int(entry.name))
+            sizes[int(entry.name)] = stat[1]
+    total, pending = 0, list(children[pid or os.getpid()])
+    while pending:
+        child = pending.pop()
+        total += sizes[child]
+        pending += children[child]
+    return total
+
+
+def _series(name: str, labels: tuple[tuple[str, str], ...], suffix: str = "") -> str:
+    if not labels:
+        return f"{PREFIX}{name}{suffix}"
+    escaped = ",".join(f"{label}={json.dumps(str(value))}" for label, value in labels)
+    return f"{PREFIX}{name}{suffix}{{{escaped}}}"
+
+
+def samples(snapshots: dict[str, Snapshot], buckets: tuple[float, ...] = settings.METRICS_BUCKETS_SEC
+            ) -> dict[str, tuple[str, dict[str, float]]]:
+    # The type and the samples of every metric, labelled with their worker
+    metrics: dict[str, tuple[str, dict[str, float]]] = {}
+    for worker, snapshot in snapshots.items():
+        for kind, type_name in (("counters", "counter"), ("gauges", "gauge")):
+            for (name, labels), value in snapshot[kind].items():
+                metrics.setdefault(name, (type_name, {}))[1][_series(name, (("worker", worker), *labels))] = value
+        for (name, labels), (counts, total, count) in snapshot["histograms"].items():
+            values = metrics.setdefault(name, ("histogram", {}))[1]
+            labels = (("worker", worker), *labels)
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                values[_series(name, (*labels, ("le", str(bound))), "_bucket")] = cumulative
+            values[_series(name, labels, "_sum")] = total
+            values[_series(name, labels, "_count")] = count
+    return metrics
+
+
+def render(snapshots: dict[str, Snapshot]) -> str:
+    # Prometheus text exposition format
+    lines = []
+    for name, (type_name, values) in sorted(samples(snapshots).items()):
+        lines.append(f"# TYPE {PREFIX}{name} {type_name}")
+        lines += [f"{series} {value}" for series, value in values.items()]
+    return "\n".join(lines) + "\n"
+
+
+class _EndpointHandler(BaseHTTPRequestHandler):
+    server: "_EndpointServer"
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _EndpointServer(ThreadingHTTPServer):
+    daemon_threads = True
+    text = ""
+
+
+class Exporter:
+    # Keeps the last snapshot of every worker and publishes them together,
+    # on a localhost endpoint, in a rotating JSONL file or both. Rendering
+    # happens once per interval, scrapes only read the text already built.
+    def __init__(self, port: int | None = None, file: Path | None = None):
+        self._snapshots: dict[str, Snapshot] = {}
+        self._server: _EndpointServer | None = None
+        self._file_logger: logging.Logger | None = None
+        if port is not None:
+            try:
+                self._server = _EndpointServer(("127.0.0.1", port), _EndpointHandler)
+            except OSError as e:
+                logger.error(f"Could not serve the metrics on port {port} : {str(e)}")
+            else:
+                threading.Thread(target=self._server.serve_forever, name="metrics-endpoint", daemon=True).start()
+                logger.info(f"Serving metrics on http://127.0.0.1:{self._server.server_port}/metrics")
+        if file is not None:
+            file.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(file, maxBytes=settings.METRICS_FILE_MAX_BYTES,
+                                                           backupCount=settings.METRICS_FILE_BACKUPS,
+                                                           encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._file_logger = logging.getLogger(f"{__name__}.file")
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.addHandler(handler)
+            logger.info(f"Writing metrics to {file}")
+
+    @property
+    def port(self) -> int | None:
+        return self._server.server_port if self._server is not None else None
+
+    def update(self, worker: str, snapshot: Snapshot):
+        self._snapshots[worker] = snapshot
+
+    def forget(self, worker: str):
+        self._snapshots.pop(worker, None)
+
+    def publish(self):
+        if self._server is not None:
+            self._server.text = render(self._snapshots)
+        if self._file_logger is not None:
+            values = {series: value for _, metric_values in samples(self._snapshots).values()
+                      for series, value in metric_values.items()}
+            self._file_logger.info(json.dumps({"time": time.time(), "metrics": values}))
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._file_logger is not None:
+            for handler in list(self._file_logger.handlers):
+                self._file_logger.removeHandler(handler)
+                handler.close()
@@ -0,0 +1,758 @@
+import base64
+import io
+import logging
+import math
+import re
+import struct
+import xml.etree.ElementTree as ElementTree
+import zlib
+from typing import Literal
+
+from pdf_writer import PdfImage, PdfPage, format_number
+
+logger = logging.getLogger(__name__)
+
+AssetKind = Literal["svg", "png"]
+Matrix = tuple[float, float, float, float, float, float]
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+A4_WIDTH_PT = 595.28
+PX_TO_PT = 0.75
+UNIT_TO_PX = {"": 1.0, "px": 1.0, "pt": 4 / 3, "pc": 16.0, "mm": 96 / 25.4, "cm": 96 / 2.54, "in": 96.0}
+NAMED_COLORS = {
+    "black": (0, 0, 0), "white": (255, 255, 255), "red": (255, 0, 0), "green": (0, 128, 0),
+    "blue": (0, 0, 255), "gray": (128, 128, 128), "grey": (128, 128, 128), "silver": (192, 192, 192),
+    "yellow": (255, 255, 0), "orange": (255, 165, 0), "purple": (128, 0, 128), "darkgray": (169, 169, 169),
+    "darkgrey": (169, 169, 169), "lightgray": (211, 211, 211), "lightgrey": (211, 211, 211),
+    "currentcolor": (0, 0, 0),
+}
+LINECAPS = {"butt": 0, "round": 1, "square": 2}
+LINEJOINS = {"miter": 0, "round": 1, "bevel": 2}
+INHERITED = ("fill", "stroke", "stroke-width", "fill-rule", "stroke-linecap", "stroke-linejoin",
+             "stroke-miterlimit", "visibility", "fill-opacity", "stroke-opacity", "font-family", "font-size",
+             "font-weight", "font-style")
+# Only drawn where a <use> or a clip-path refers to them
+NOT_RENDERED = ("defs", "title", "desc", "metadata", "style", "symbol", "clipPath", "mask", "marker", "pattern",
+                "linearGradient", "radialGradient", "filter")
+SVG_NAMESPACE = "{http://www.w3.org/2000/svg}"
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+# The standard fonts of every PDF reader, by family, then bold and italic
+STANDARD_FONTS = {
+    "serif": ("Times-Roman", "Times-Bold", "Times-Italic", "Times-BoldItalic"),
+    "sans-serif": ("Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Helvetica-BoldOblique"),
+    "monospace": ("Courier", "Courier-Bold", "Courier-Oblique", "Courier-BoldOblique"),
+}
+KAPPA = 0.5522847498
+
+
+class ConversionError(Exception):
+    pass
+
+
+def detect_kind(data: bytes) -> AssetKind:
+    if data.startswith(PNG_SIGNATURE):
+        return "png"
+    head = data[:512].lstrip().lower()
+    if head.startswith(b"<?xml") or head.startswith(b"<svg") or b"<svg" in head:
+        return "svg"
+    raise ConversionError("Unknown page asset format")
+
+
+def convert_asset(data: bytes) -> PdfPage:
+    if detect_kind(data) == "png":
+        return png_to_page(data)
+    return svg_to_page(data)
+
+
+# PNG
+
+def png_to_page(data: bytes) -> PdfPage:
+    image, dpi = _png_image(data)
+    page_width = image.width * 72 / dpi if dpi else A4_WIDTH_PT
+    page_height = image.height * page_width / image.width
+    content = ("q %s 0 0 %s 0 0 cm /Im0 Do Q" % (format_number(page_width), format_number(page_height))).encode()
+    return PdfPage(page_width, page_height, content, {"Im0": image})
+
+
+def _png_image(data: bytes) -> tuple[PdfImage, float | None]:
+    # The image and its resolution, when the file gives one
+    if not data.startswith(PNG_SIGNATURE):
+        raise ConversionError("Not a PNG file")
+    header = palette = None
+    transparency = False
+    idat: list[bytes] = []
+    dpi = None
+    offset = len(PNG_SIGNATURE)
+    while offset < len(data):
+        length, chunk_type = struct.unpack(">I4s", data[offset:offset + 8])
+        chunk = data[offset + 8:offset + 8 + length]
+        offset += 12 + length
+        if chunk_type == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif chunk_type == b"PLTE":
+            palette = chunk
+        elif chunk_type == b"IDAT":
+            idat.append(chunk)
+        elif chunk_type == b"tRNS":
+            transparency = True
+        elif chunk_type == b"pHYs":
+            x_ppu, _, unit = struct.unpack(">IIB", chunk)
+            if unit == 1 and x_ppu:
+                dpi = x_ppu * 0.0254
+        elif chunk_type == b"IEND":
+            break
+    if header is None:
+        raise ConversionError("PNG without IHDR chunk")
+
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if color_type in (0, 2, 3) and not interlace and not transparency and bit_depth <= 8:
+        # The zlib stream of the IDAT chunks is a valid PDF Flate stream once the
+        # PNG predictors are declared, so the pixels are never decoded. 16-bit
+        # samples would need PDF 1.5.
+        colors = 3 if color_type == 2 else 1
+        if color_type == 3:
+            if palette is None:
+                raise ConversionError("Paletted PNG without PLTE chunk")
+            palette = palette.ljust(3 * 2 ** bit_depth, b"\0")[:768]
+            color_space = b"[/Indexed /DeviceRGB %d <%s>]" % (len(palette) // 3 - 1, palette.hex().encode())
+        else:
+            color_space = b"/DeviceRGB" if color_type == 2 else b"/DeviceGray"
+        image = PdfImage(width, height, color_space, bit_depth, b"".join(idat),
+                         b"<< /Predictor 15 /Colors %d /BitsPerComponent %d /Columns %d >>"
+                         % (colors, bit_depth, width))
+    else:
+        image = _decode_png(data)
+    return image, dpi
+
+
+def _decode_png(data: bytes) -> PdfImage:
+    # Transparency, 16-bit samples and interlacing need the decoded pixels
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if image.mode in ("I", "I;16", "I;16B"):
+            return _decode_gray_16(image)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        gray = image.mode in ("1", "L", "LA")
+        smask = None
+        if has_alpha:
+            # Through the alpha mode, palettes and tRNS colours become an alpha channel
+            with_alpha = image.convert("LA" if gray else "RGBA")
+            alpha = with_alpha.getchannel("A")
+            smask = PdfImage(alpha.width, alpha.height, b"/DeviceGray", 8, zlib.compress(alpha.tobytes()))
+            color = with_alpha.convert("L" if gray else "RGB")
+        else:
+            color = image.convert("L" if gray else "RGB")
+        return PdfImage(color.width, color.height, b"/DeviceGray" if gray else b"/DeviceRGB", 8,
+                        zlib.compress(color.tobytes()), smask=smask)
+
+
+def _decode_gray_16(image) -> PdfImage:
+    # convert() would clip the samples to 8 bits, their high bytes scale them
+    from PIL import Image, ImageChops
+
+    samples = image.tobytes("raw", "I;16B")
+    high = Image.frombytes("L", image.size, samples[0::2])
+    smask = None
+    transparency = image.info.get("transparency")
+    if isinstance(transparency, int):
+        low = Image.frombytes("L", image.size, samples[1::2])
+        transparent = ImageChops.darker(high.point(lambda v: 255 if v == transparency >> 8 else 0),
+                                        low.point(lambda v: 255 if v == transparency & 0xFF else 0))
+        smask = PdfImage(image.width, image.height, b"/DeviceGray", 8,
+                         zlib.compress(ImageChops.invert(transparent).tobytes()))
+    return PdfImage(image.width, image.height, b"/DeviceGray", 8, zlib.compress(high.tobytes()), smask=smask)
+
+
+# SVG
+
+def _length(value: str | None, default: float = 0.0) -> float:
+    if not value:
+        return default
+    match = re.fullmatch(r"\s*([-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?)\s*([a-z%]*)\s*", value)
+    if not match or match.group(2) not in UNIT_TO_PX:
+        return default
+    return float(match.group(1)) * UNIT_TO_PX[match.group(2)]
+
+
+def _rgba(value: str | None) -> tuple[float, float, float, float] | None:
+    # Red, green, blue and alpha between 0 and 1, None when nothing is painted
+    # or the colour is malformed
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value in ("none", "transparent", "") or value.startswith("url("):
+        return None
+    alpha = 255.0
+    if value.startswith("#"):
+        digits = value[1:]
+        if len(digits) in (3, 4):
+            digits = "".join(c * 2 for c in digits)
+        if len(digits) not in (6, 8) or not re.fullmatch(r"[0-9a-f]+", digits):
+            return None
+        rgb = tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+        if len(digits) == 8:
+            alpha = int(digits[6:], 16)
+    elif value.startswith("rgb"):
+        match = re.fullmatch(r"rgba?\((.*)\)", value)
+        parts = re.findall(r"[-+]?(?:\d*\.\d+|\d+\.?)(?:e[-+]?\d+)?%?", match.group(1)) if match else []
+        if len(parts) not in (3, 4):
+            return None
+        rgb = tuple(float(p[:-1]) * 2.55 if p.endswith("%") else float(p) for p in parts[:3])
+        if len(parts) == 4:
+            alpha = float(parts[3][:-1]) * 2.55 if parts[3].endswith("%") else float(parts[3]) * 255
+    else:
+        rgb = NAMED_COLORS.get(value, (0, 0, 0))
+    return tuple(min(max(c / 255, 0.0), 1.0) for c in (*rgb, alpha))
+
+
+def _color(value: str | None) -> tuple[float, float, float] | None:
+    rgba = _rgba(value)
+    return rgba[:3] if rgba is not None else None
+
+
+def _color_alpha(value: str | None) -> float:
+    rgba = _rgba(value)
+    return rgba[3] if rgba is not None else 1.0
+
+
+def _number_list(value: str) -> list[float]:
+    return [float(n) for n in re.findall(r"[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?", value)]
+
+
+def _transform(value: str | None) -> list[Matrix]:
+    matrices: list[Matrix] = []
+    for name, arguments in re.findall(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)", value or ""):
+        n = _number_list(arguments)
+        if name == "matrix" and len(n) == 6:
+            matrices.append(tuple(n))
+        elif name == "translate" and n:
+            matrices.append((1, 0, 0, 1, n[0], n[1] if len(n) > 1 else 0))
+        elif name == "scale" and n:
+            matrices.append((n[0], 0, 0, n[1] if len(n) > 1 else n[0], 0, 0))
+        elif name == "rotate" and n:
+            angle = math.radians(n[0])
+            cos, sin = math.cos(angle), math.sin(angle)
+            if len(n) == 3:
+                matrices.append((1, 0, 0, 1, n[1], n[2]))
+            matrices.append((cos, sin, -sin, cos, 0, 0))
+            if len(n) == 3:
+                matrices.append((1, 0, 0, 1, -n[1], -n[2]))
+        elif name == "skewX" and n:
+            matrices.append((1, 0, math.tan(math.radians(n[0])), 1, 0, 0))
+        elif name == "skewY" and n:
+            matrices.append((1, math.tan(math.radians(n[0])), 0, 1, 0, 0))
+    return matrices
+
+
+class _PathParser:
+    NUMBER = re.compile(r"[\s,]*([-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?)")
+    COMMAND = re.compile(r"[\s,]*([MmLlHhVvCcSsQqTtAaZz])")
+    FLAG = re.compile(r"[\s,]*([01])")
+
+    def __init__(self, d: str):
+        self.d = d
+        self.pos = 0
+
+    def _match(self, pattern: re.Pattern) -> str | None:
+        match = pattern.match(self.d, self.pos)
+        if match is None:
+            return None
+        self.pos = match.end()
+        return match.group(1)
+
+    def command(self) -> str | None:
+        return self._match(self.COMMAND)
+
+    def has_number(self) -> bool:
+        return self.NUMBER.match(self.d, self.pos) is not None
+
+    def number(self) -> float:
+        value = self._match(self.NUMBER)
+        if value is None:
+            raise ConversionError(f"Malformed path data near position {self.pos}")
+        return float(value)
+
+    def flag(self) -> bool:
+        value = self._match(self.FLAG)
+        if value is None:
+            raise ConversionError(f"Malformed arc flag near position {self.pos}")
+        return value == "1"
+
+
+def _arc_to_curves(x1, y1, rx, ry, phi, large_arc, sweep, x2, y2) -> list[tuple[float, ...]]:
+    if rx == 0 or ry == 0:
+        return [(x1, y1, x2, y2, x2, y2)]
+    rx, ry = abs(rx), abs(ry)
+    cos_phi, sin_phi = math.cos(math.radians(phi)), math.sin(math.radians(phi))
+    dx, dy = (x1 - x2) / 2, (y1 - y2) / 2
+    x1p = cos_phi * dx + sin_phi * dy
+    y1p = -sin_phi * dx + cos_phi * dy
+    scale = (x1p ** 2) / (rx ** 2) + (y1p ** 2) / (ry ** 2)
+    if scale > 1:
+        rx, ry = rx * math.sqrt(scale), ry * math.sqrt(scale)
+    numerator = rx ** 2 * ry ** 2 - rx ** 2 * y1p ** 2 - ry ** 2 * x1p ** 2
+    denominator = rx ** 2 * y1p ** 2 + ry ** 2 * x1p ** 2
+    coefficient = math.sqrt(max(numerator / denominator, 0)) if denominator else 0
+    if large_arc == sweep:
+        coefficient = -coefficient
+    cxp, cyp = coefficient * rx * y1p / ry, -coefficient * ry * x1p / rx
+    cx = cos_phi * cxp - sin_phi * cyp + (x1 + x2) / 2
+    cy = sin_phi * cxp + cos_phi * cyp + (y1 + y2) / 2
+
+    def angle(ux, uy, vx, vy):
+        return math.atan2(ux * vy - uy * vx, ux * vx + uy * vy)
+
+    theta = angle(1, 0, (x1p - cxp) / rx, (y1p - cyp) / ry)
+    delta = angle((x1p - cxp) / rx, (y1p - cyp) / ry, (-x1p - cxp) / rx, (-y1p - cyp) / ry)
+    if not sweep and delta > 0:
+        delta -= 2 * math.pi
+    elif sweep and delta < 0:
+        delta += 2 * math.pi
+
+    segments = max(1, math.ceil(abs(delta) / (math.pi / 2)))
+    step = delta / segments
+    t = 4 / 3 * math.tan(step / 4)
+    curves = []
+    for i in range(segments):
+        a1, a2 = theta + i * step, theta + (i + 1) * step
+        points = []
+        for px, py in ((math.cos(a1) - t * math.sin(a1), math.sin(a1) + t * math.cos(a1)),
+                       (math.cos(a2) + t * math.sin(a2), math.sin(a2) - t * math.cos(a2)),
+                       (math.cos(a2), math.sin(a2))):
+            px, py = px * rx, py * ry
+            points += [cos_phi * px - sin_phi * py + cx, sin_phi * px + cos_phi * py + cy]
+        curves.append(tuple(points))
+    return curves
+
+
+def path_operators(d: str) -> list[str]:
+    fmt = format_number
+    parser = _PathParser(d)
+    ops: list[str] = []
+    x = y = start_x = start_y = 0.0
+    last_cubic: tuple[float, float] | None = None
+    last_quad: tuple[float, float] | None = None
+    command = None
+
+    def curve(x1, y1, x2, y2, x3, y3):
+        ops.append(f"{fmt(x1)} {fmt(y1)} {fmt(x2)} {fmt(y2)} {fmt(x3)} {fmt(y3)} c")
+
+    while True:
+        next_command = parser.command()
+        if next_command is None:
+            if command is None or command in "Zz" or not parser.has_number():
+                break
+            # Implicit repetition of the previous command, moveto becomes lineto
+            next_command = {"M": "L", "m": "l"}.get(command, command)
+        command = next_command
+        relative = command.islower()
+        ox, oy = (x, y) if relative else (0.0, 0.0)
+        upper = command.upper()
+
+        if upper == "Z":
+            ops.append("h")
+            x, y = start_x, start_y
+        elif upper == "M":
+            x, y = ox + parser.number(), oy + parser.number()
+            start_x, start_y = x, y
+            ops.append(f"{fmt(x)} {fmt(y)} m")
+        elif upper == "L":
+            x, y = ox + parser.number(), oy + parser.number()
+            ops.append(f"{fmt(x)} {fmt(y)} l")
+        elif upper == "H":
+            x = ox + parser.number()
+            ops.append(f"{fmt(x)} {fmt(y)} l")
+        elif upper == "V":
+            y = oy + parser.number()
+            ops.append(f"{fmt(x)} {fmt(y)} l")
+        elif upper in ("C", "S"):
+            if upper == "C":
+                x1, y1 = ox + parser.number(), oy + parser.number()
+            else:
+                x1, y1 = (2 * x - last_cubic[0], 2 * y - last_cubic[1]) if last_cubic else (x, y)
+            x2, y2 = ox + parser.number(), oy + parser.number()
+            x3, y3 = ox + parser.number(), oy + parser.number()
+            curve(x1, y1, x2, y2, x3, y3)
+            x, y = x3, y3
+            last_cubic, last_quad = (x2, y2), None
+            continue
+        elif upper in ("Q", "T"):
+            if upper == "Q":
+                qx, qy = ox + parser.number(), oy + parser.number()
+            else:
+                qx, qy = (2 * x - last_quad[0], 2 * y - last_quad[1]) if last_quad else (x, y)
+            x3, y3 = ox + parser.number(), oy + parser.number()
+            curve(x + 2 / 3 * (qx - x), y + 2 / 3 * (qy - y), x3 + 2 / 3 * (qx - x3), y3 + 2 / 3 * (qy - y3), x3, y3)
+            x, y = x3, y3
+            last_cubic, last_quad = None, (qx, qy)
+            continue
+        elif upper == "A":
+            rx, ry, phi = parser.number(), parser.number(), parser.number()
+            large_arc, sweep = parser.flag(), parser.flag()
+            x3, y3 = ox + parser.number(), oy + parser.number()
+            for points in _arc_to_curves(x, y, rx, ry, phi, large_arc, sweep, x3, y3):
+                curve(*points)
+            x, y = x3, y3
+        last_cubic = last_quad = None
+    return ops
+
+
+def _ellipse_operators(cx: float, cy: float, rx: float, ry: float) -> list[str]:
+    fmt = format_number
+    kx, ky = rx * KAPPA, ry * KAPPA
+    return [
+        f"{fmt(cx + rx)} {fmt(cy)} m",
+        f"{fmt(cx + rx)} {fmt(cy + ky)} {fmt(cx + kx)} {fmt(cy + ry)} {fmt(cx)} {fmt(cy + ry)} c",
+        f"{fmt(cx - kx)} {fmt(cy + ry)} {fmt(cx - rx)} {fmt(cy + ky)} {fmt(cx - rx)} {fmt(cy)} c",
+        f"{fmt(cx - rx)} {fmt(cy - ky)} {fmt(cx - kx)} {fmt(cy - ry)} {fmt(cx)} {fmt(cy - ry)} c",
+        f"{fmt(cx + kx)} {fmt(cy - ry)} {fmt(cx + rx)} {fmt(cy - ky)} {fmt(cx + rx)} {fmt(cy)} c",
+        "h",
+    ]
+
+
+def _opacity(value: str | None) -> float:
+    return min(max(_length(value, 1.0), 0.0), 1.0)
+
+
+def _href(attributes: dict[str, str]) -> str:
+    return attributes.get("href") or attributes.get(XLINK_HREF) or ""
+
+
+def _pdf_string(text: str) -> tuple[str, int]:
+    # A literal string in the WinAnsi encoding of the standard fonts and the
+    # number of characters it cannot show
+    chars, missing = [], 0
+    for char in text:
+        try:
+            code = char.encode("cp1252")[0]
+        except UnicodeEncodeError:
+            code, missing = ord("?"), missing + 1
+        if char in "()\\":
+            chars.append("\\" + char)
+        elif 32 <= code < 127:
+            chars.append(chr(code))
+        else:
+            chars.append(f"\\{code:03o}")
+    return "(" + "".join(chars) + ")", missing
+
+
+class _SvgConverter:
+    def __init__(self):
+        self.ops: list[str] = []
+        self.images: dict[str, PdfImage] = {}
+        self.fonts: dict[str, str] = {}
+        self.opacities: dict[str, tuple[float, float]] = {}
+        # What the page loses, logged once it is converted
+        self.unsupported: dict[str, int] = {}
+        self._ids: dict[str, ElementTree.Element] = {}
+        self._using: set[int] = set()
+
+    @staticmethod
+    def _local_name(tag: str) -> str:
+        return tag.rsplit("}", 1)[-1]
+
+    @staticmethod
+    def _attributes(element: ElementTree.Element) -> dict[str, str]:
+        attributes = dict(element.attrib)
+        for declaration in attributes.pop("style", "").split(";"):
+            if ":" in declaration:
+                name, value = declaration.split(":", 1)
+                attributes[name.strip()] = value.strip()
+        return attributes
+
+    def _unsupported(self, what: str, count: int = 1):
+        self.unsupported[what] = self.unsupported.get(what, 0) + count
+
+    def convert(self, root: ElementTree.Element) -> PdfPage:
+        viewbox = _number_list(root.get("viewBox", ""))
+        width_px = _length(root.get("width"), viewbox[2] if len(viewbox) == 4 else 0)
+        height_px = _length(root.get("height"), viewbox[3] if len(viewbox) == 4 else 0)
+        if width_px <= 0 or height_px <= 0:
+            raise ConversionError("SVG without usable size")
+        width, height = width_px * PX_TO_PT, height_px * PX_TO_PT
+        vb_x, vb_y, vb_w, vb_h = viewbox if len(viewbox) == 4 else (0, 0, width_px, height_px)
+        if vb_w <= 0 or vb_h <= 0:
+            raise ConversionError("SVG with an empty viewBox")
+        self._ids = {element.get("id"): element for element in root.iter() if element.get("id")}
+
+        sx, sy = width / vb_w, height / vb_h
+        self.ops.append(self._cm((sx, 0, 0, -sy, -sx * vb_x, height + sy * vb_y)))
+        state = {"fill": "black", "stroke": "none", "stroke-width": "1", "fill-rule": "nonzero",
+                 "stroke-linecap": "butt", "stroke-linejoin": "miter", "stroke-miterlimit": "4",
+                 "visibility": "visible", "opacity": "1", "fill-opacity": "1", "stroke-opacity": "1",
+                 "font-family": "serif", "font-size": "16", "font-weight": "normal", "font-style": "normal"}
+        self._children(root, state)
+        if self.unsupported:
+            logger.warning(f"Left unsupported SVG content out of the page: {self.unsupported}")
+        return PdfPage(width, height, "\n".join(self.ops).encode("ascii"), self.images, self.fonts, self.opacities)
+
+    @staticmethod
+    def _cm(matrix: Matrix) -> str:
+        return " ".join(format_number(v) for v in matrix) + " cm"
+
+    def _children(self, element: ElementTree.Element, state: dict[str, str]):
+        for child in element:
+            self._element(child, state)
+
+    def _element(self, element: ElementTree.Element, parent_state: dict[str, str], referenced: bool = False):
+        tag = element.tag
+        if not isinstance(tag, str) or tag.startswith("{") and not tag.startswith(SVG_NAMESPACE):
+            # Comments and the metadata of the editors
+            return
+        name = self._local_name(tag)
+        attributes = self._attributes(element)
+        if attributes.get("display") == "none" or name in NOT_RENDERED and not (referenced and name == "symbol"):
+            return
+        state = dict(parent_state)
+        state.update((key, attributes[key]) for key in INHERITED if key in attributes)
+        # Group opacity is applied to every child, which only differs where they overlap
+        state["opacity"] = str(_opacity(parent_state["opacity"]) * _opacity(attributes.get("opacity")))
+        for key in ("mask", "filter"):
+            if attributes.get(key, "none") != "none":
+                self._unsupported(key)
+
+        if name in ("g", "svg", "a", "symbol"):
+            setup = self._setup(attributes)
+            if setup:
+                self.ops.append("q")
+                self.ops.extend(setup)
+            self._children(element, state)
+            if setup:
+                self.ops.append("Q")
+            return
+        if name == "use":
+            self._use(attributes, state)
+            return
+        if state["visibility"] == "hidden":
+            return
+        if name == "text":
+            self._text(element, attributes, state)
+            return
+        if name == "image":
+            self._image(attributes, state)
+            return
+
+        path = self._shape(name, attributes)
+        if path is None:
+            self._unsupported(name)
+            return
+        if path:
+            self._paint(path, self._setup(attributes), state, closed_fill=name != "line")
+
+    def _setup(self, attributes: dict[str, str], offset: tuple[float, float] = (0, 0)) -> list[str]:
+        # Operators placing an element: its transform, then its clipping path
+        ops = [self._cm(m) for m in _transform(attributes.get("transform"))]
+        if offset != (0, 0):
+            ops.append(self._cm((1, 0, 0, 1, *offset)))
+        return ops + self._clip(attributes)
+
+    def _clip(self, attributes: dict[str, str]) -> list[str]:
+        reference = attributes.get("clip-path", "none")
+        if reference == "none":
+            return []
+        match = re.fullmatch(r"\s*url\(\s*['\"]?#([^'\")]+)['\"]?\s*\)\s*", reference)
+        target = self._ids.get(match.group(1)) if match else None
+        if target is None or target.get("clipPathUnits", "userSpaceOnUse") != "userSpaceOnUse":
+            self._unsupported("clip-path")
+            return []
+        path, even_odd = [], ""
+        for child in target:
+            child_attributes = self._attributes(child)
+            shape = self._shape(self._local_name(child.tag), child_attributes)
+            if shape is None or "transform" in child_attributes:
+                self._unsupported("clip-path")
+                return []
+            path += shape
+            if child_attributes.get("clip-rule") == "evenodd":
+                even_odd = "*"
+        # An empty clipping path hides the element
+        return (path or ["0 0 0 0 re"]) + ["W" + even_odd, "n"]
+
+    def _graphics_state(self, state: dict[str, str], fill: bool, stroke: bool) -> list[str]:
+        opacity = _opacity(state["opacity"])
+        fill_alpha = stroke_alpha = 1.0
+        if fill:
+            fill_alpha = round(opacity * _opacity(state["fill-opacity"]) * _color_alpha(state["fill"]), 3)
+        if stroke:
+            stroke_alpha = round(opacity * _opacity(state["stroke-opacity"]) * _color_alpha(state["stroke"]), 3)
+        if fill_alpha == stroke_alpha == 1:
+            return []
+        for name, alphas in self.opacities.items():
+            if alphas == (fill_alpha, stroke_alpha):
+                return [f"/{name} gs"]
+        name = f"GS{len(self.opacities)}"
+        self.opacities[name] = fill_alpha, stroke_alpha
+        return [f"/{name} gs"]
+
+    def _use(self, attributes: dict[str, str], state: dict[str, str]):
+        target = self._ids.get(_href(attributes).removeprefix("#"))
+        if target is None or id(target) in self._using:
+            self._unsupported("use")
+            return
+        offset = _length(attributes.get("x")), _length(attributes.get("y"))
+        setup = self._setup(attributes, offset)
+        self.ops.append("q")
+        self.ops.extend(setup)
+        self._using.add(id(target))
+        self._element(target, state, referenced=True)
+        self._using.discard(id(target))
+        self.ops.append("Q")
+
+    def _font(self, state: dict[str, str]) -> str:
+        family = state["font-family"].lower()
+        if "mono" in family or "courier" in family:
+            fonts = STANDARD_FONTS["monospace"]
+        elif "sans" in family or "arial" in family or "helvetica" in family:
+            fonts = STANDARD_FONTS["sans-serif"]
+        else:
+            fonts = STANDARD_FONTS["serif"]
+        weight = state["font-weight"]
+        bold = weight in ("bold", "bolder") or weight.isdigit() and int(weight) >= 600
+        italic = state["font-style"] in ("italic", "oblique")
+        base_font = fonts[2 * italic + bold]
+        for name, font in self.fonts.items():
+            if font == base_font:
+                return name
+        name = f"F{len(self.fonts)}"
+        self.fonts[name] = base_font
+        return name
+
+    def _text(self, element: ElementTree.Element, attributes: dict[str, str], state: dict[str, str]):
+        # Drawn with the closest standard font, from the start of every line.
+        # Positioned <tspan> elements start a new line, glyph positions and
+        # the anchor are not applied.
+        fill = _color(state["fill"])
+        if fill is None:
+            return
+        x, y = _number_list(attributes.get("x", "")), _number_list(attributes.get("y", ""))
+        runs = [[x[0] if x else 0.0, y[0] if y else 0.0, element.text or ""]]
+        for child in element:
+            child_x, child_y = _number_list(child.get("x", "")), _number_list(child.get("y", ""))
+            if child_x or child_y:
+                runs.append([child_x[0] if child_x else runs[-1][0], child_y[0] if child_y else runs[-1][1], ""])
+            runs[-1][2] += "".join(child.itertext()) + (child.tail or "")
+
+        size = _length(state["font-size"], 16.0)
+        self.ops.append("q")
+        self.ops.extend(self._setup(attributes))
+        self.ops.extend(self._graphics_state(state, fill=True, stroke=False))
+        self.ops.append("%s %s %s rg" % tuple(format_number(round(c, 4)) for c in fill))
+        self.ops.append(f"BT /{self._font(state)} {format_number(size)} Tf")
+        for run_x, run_y, text in runs:
+            text = " ".join(text.split())
+            if not text:
+                continue
+            string, missing = _pdf_string(text)
+            if missing:
+                self._unsupported("text characters", missing)
+            # The page space is flipped, the text is flipped back upright
+            self.ops.append(f"1 0 0 -1 {format_number(run_x)} {format_number(run_y)} Tm {string} Tj")
+        self.ops.append("ET Q")
+
+    def _image(self, attributes: dict[str, str], state: dict[str, str]):
+        # Only the PNG images embedded in the page, nothing is fetched
+        match = re.fullmatch(r"data:image/png;base64,(.*)", _href(attributes).strip(), re.DOTALL)
+        if match is None:
+            self._unsupported("image")
+            return
+        try:
+            image, _ = _png_image(base64.b64decode(match.group(1)))
+        except (ValueError, ConversionError, struct.error):
+            self._unsupported("image")
+            return
+        x, y = _length(attributes.get("x")), _length(attributes.get("y"))
+        width = _length(attributes.get("width"), image.width)
+        height = _length(attributes.get("height"), image.height)
+        if width <= 0 or height <= 0:
+            return
+        if attributes.get("preserveAspectRatio", "").strip() != "none":
+            # Scaled to fit and centred, the default of xMidYMid meet
+            scale = min(width / image.width, height / image.height)
+            x += (width - image.width * scale) / 2
+            y += (height - image.height * scale) / 2
+            width, height = image.width * scale, image.height * scale
+
+        name = f"Im{len(self.images)}"
+        self.images[name] = image
+        self.ops.append("q")
+        self.ops.extend(self._setup(attributes))
+        self.ops.extend(self._graphics_state(state, fill=True, stroke=False))
+        self.ops.append(self._cm((width, 0, 0, -height, x, y + height)))
+        self.ops.append(f"/{name} Do Q")
+
+    @staticmethod
+    def _shape(name: str, attributes: dict[str, str]) -> list[str] | None:
+        fmt = format_number
+        if name == "path":
+            return path_operators(attributes.get("d", ""))
+        if name in ("polyline", "polygon"):
+            points = _number_list(attributes.get("points", ""))
+            if len(points) < 4:
+                return []
+            ops = [f"{fmt(points[0])} {fmt(points[1])} m"]
+            ops += [f"{fmt(points[i])} {fmt(points[i + 1])} l" for i in range(2, len(points) - 1, 2)]
+            if name == "polygon":
+                ops.append("h")
+            return ops
+        if name == "line":
+            x1, y1 = _length(attributes.get("x1")), _length(attributes.get("y1"))
+            x2, y2 = _length(attributes.get("x2")), _length(attributes.get("y2"))
+            return [f"{fmt(x1)} {fmt(y1)} m", f"{fmt(x2)} {fmt(y2)} l"]
+        if name == "rect":
+            w, h = _length(attributes.get("width")), _length(attributes.get("height"))
+            if w <= 0 or h <= 0:
+                return []
+            x, y = _length(attributes.get("x")), _length(attributes.get("y"))
+            return [f"{fmt(x)} {fmt(y)} {fmt(w)} {fmt(h)} re"]
+        if name in ("circle", "ellipse"):
+            cx, cy = _length(attributes.get("cx")), _length(attributes.get("cy"))
+            if name == "circle":
+                rx = ry = _length(attributes.get("r"))
+            else:
+                rx, ry = _length(attributes.get("rx")), _length(attributes.get("ry"))
+            if rx <= 0 or ry <= 0:
+                return []
+            return _ellipse_operators(cx, cy, rx, ry)
+        return None
+
+    def _paint(self, path: list[str], setup: list[str], state: dict[str, str], closed_fill: bool):
+        fill = _color(state["fill"]) if closed_fill else None
+        stroke = _color(state["stroke"])
+        stroke_width = _length(state["stroke-width"], 1.0)
+        if stroke_width <= 0:
+            stroke = None
+        if fill is None and stroke is None:
+            return
+
+        self.ops.append("q")
+        self.ops.extend(setup)
+        self.ops.extend(self._graphics_state(state, fill=fill is not None, stroke=stroke is not None))
+        if fill is not None:
+            self.ops.append("%s %s %s rg" % tuple(format_number(round(c, 4)) for c in fill))
+        if stroke is not None:
+            self.ops.append("%s %s %s RG" % tuple(format_number(round(c, 4)) for c in stroke))
+            self.ops.append(f"{format_number(stroke_width)} w")
+            self.ops.append(f"{LINECAPS.get(state['stroke-linecap'], 0)} J")
+            self.ops.append(f"{LINEJOINS.get(state['stroke-linejoin'], 0)} j")
+            self.ops.append(f"{format_number(_length(state['stroke-miterlimit'], 4.0))} M")
+        self.ops.extend(path)
+        even_odd = "*" if state["fill-rule"] == "evenodd" else ""
+        if fill is not None and stroke is not None:
+            self.ops.append("B" + even_odd)
+        elif fill is not None:
+            self.ops.append("f" + even_odd)
+        else:
+            self.ops.append("S")
+        self.ops.append("Q")
+
+
+def svg_to_page(data: bytes) -> PdfPage:
+    try:
+        root = ElementTree.fromstring(data)
+    except ElementTree.ParseError as e:
+        raise ConversionError(f"Malformed SVG: {str(e)}") from e
+    if _SvgConverter._local_name(root.tag) != "svg":
+        raise ConversionError("Root element is not <svg>")
+    return _SvgConverter().convert(root)
@@ -1,81 +1,331 @@
+import asyncio
+import hashlib
+import http.client
 import logging
 import multiprocessing as mp
-import os
-from typing import Literal
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urljoin
 
-from playwright.sync_api import sync_playwright, Playwright, Browser, Page
+from playwright.async_api import Page
 
+import metrics
+import settings
+from browser_install import ensure_browser_installed
+from http_engine import HTTPEngine, HTTPEngineError
+from metadata_cache import MetadataCache
+from page_pool import PagePool, BrowserTypeAlias
+from route_profiles import SCRAP_PROFILE, TITLE_PROFILE, route_profile
+from scheduler import PriorityScheduler
+from url_classifier import classify
 from utils import Message
-from worker import Worker, Handler
+from worker import Worker, AsyncHandler
 
 logger = logging.getLogger(__name__)
 
-BrowserTypeAlias = Literal["chromium", "firefox", "webkit"]
+NOT_FOUND_TITLE = "Page inexistante"
+ERROR_TITLE = "Erreur lors du chargement du titre"
+NOT_FOUND_PAGE_TITLE = "Page not found (404) | MuseScore.com"
+TITLE_SELECTOR = "#aside-container-unique > div.XkhEk > h1 > span"
+HTML_TITLE_SUFFIX = re.compile(r"\s*(?:Sheet music for .*)?\|\s*musescore\.com\s*$", re.IGNORECASE)
+
+
+@dataclass
+class ScrapJob:
+    url: str
+    result_path: str
+    job_id: int | None
+    reply_to: str
+    progress: bool
+    title: str | None = None
+    started: float = field(default_factory=time.perf_counter)
 
 
 class PageManager(Worker):
-    METHODS = Worker.METHODS + ["scrap", "fetch_title"]
+    METHODS = Worker.METHODS + ["scrap", "fetch_title", "cancel_title"]
 
-    def __init__(self, address: str, handler: Handler):
+    def __init__(self, address: str, handler: AsyncHandler, pool_size: int = settings.PAGE_POOL_SIZE,
+                 bulk_slots: int | None = None, dump_worker: str = "dump"):
         super().__init__(address, handler)
+        self._pool_size = pool_size
+        self._dump_worker = dump_worker
+        slots = dict(settings.SCHEDULER_SLOTS)
+        if bulk_slots is not None:
+            slots["bulk"] = bulk_slots
+        self.scheduler = PriorityScheduler(slots)
+
+        self.pool: PagePool | None = None
+        self.cache: MetadataCache | None = None
+        self.http: HTTPEngine | None = None
+        self.http_executor: ThreadPoolExecutor | None = None
+        self._title_task: asyncio.Task | None = None
 
-        self.pw: Playwright | None = None
-        self.browser: Browser | None = None
-        self.page: Page | None = None
+    @property
+    def healthy(self) -> bool:
+        return self.pool is None or not self.pool.crashed
 
-    def init(self, browser: BrowserTypeAlias = "chromium") -> list[Message]:
+    def collect_metrics(self):
+        if self.pool is not None:
+            metrics.set_gauge("page_pool_size", self.pool.size)
+            metrics.set_gauge("page_pool_in_use", self.pool.in_use)
+            metrics.set_gauge("page_pool_waiting", self.pool.waiting)
+            metrics.set_gauge("browser_crashed", int(self.pool.crashed))
+        if (rss := metrics.children_rss_bytes()) is not None:
+            metrics.set_gauge("browser_rss_bytes", rss)
+        for stats in self.scheduler.stats():
+            metrics.set_gauge("scheduler_running", stats.running, scheduler_class=stats.name)
+            metrics.set_gauge("scheduler_queued", stats.queued, scheduler_class=stats.name)
+            metrics.set_gauge("scheduler_wait_p95_seconds", stats.p95_wait_sec, scheduler_class=stats.name)
+
+    async def init(self, browser: BrowserTypeAlias = settings.BROWSER) -> list[Message]:
         if self._is_init:
             raise RuntimeError("Cannot initialize PageManager twice")
-        logger.info("Initialising the browser and the page")
-        os.system("playwright install")
-        self.pw = sync_playwright().start()
-        self.browser = getattr(self.pw, browser).launch()
-        self.page = self.browser.new_page()
+        logger.info("Initialising the browser and the page pool")
+
+        profile_dir = settings.BROWSER_PROFILE_DIR / self._address if settings.BROWSER_PERSISTENT_PROFILE else None
+
+        def install_check():
+            start = time.perf_counter()
+            installed = ensure_browser_installed(browser)
+            logger.info(f"Startup phase 'install check' took {(time.perf_counter() - start) * 1000:.0f} ms"
+                        + (" (browser installed)" if installed else ""))
+
+        self.pool = PagePool(self._pool_size, browser, settings.PAGE_POOL_RECYCLE_AFTER, profile_dir)
+        self.pool.start(prepare=install_check, prelaunch=settings.PAGE_POOL_PRELAUNCH)
+        self.cache = MetadataCache(settings.METADATA_CACHE_FILE,
+                                   ttl_sec=settings.METADATA_CACHE_TTL_SEC,
+                                   negative_ttl_sec=settings.METADATA_CACHE_NEGATIVE_TTL_SEC,
+                                   max_entries=settings.METADATA_CACHE_MAX_ENTRIES,
+                                   memory_entries=settings.METADATA_CACHE_MEMORY_ENTRIES)
+        self.http = HTTPEngine(user_agent=settings.HTTP_USER_AGENT,
+                               max_per_host=settings.HTTP_POOL_SIZE,
+                               timeout=settings.HTTP_TIMEOUT_SEC)
+        self.http_executor = ThreadPoolExecutor(settings.HTTP_POOL_SIZE, thread_name_prefix="http")
         return super().init()
 
-    def close(self) -> list[Message]:
+    async def close(self) -> list[Message]:
         if not self._is_init or not self._ready:
             raise RuntimeError("Cannot close PageManager before initialization")
-        if self.browser:
-            logger.info("Closing the browser")
-            self.browser.close()
-        if self.pw:
-            logger.info("Closing the playwright")
-            self.pw.stop()
+        await self._handler.cancel_tasks()
+        if self.pool:
+            logger.info("Closing the page pool")
+            await self.pool.close(timeout=settings.PAGE_POOL_CLOSE_TIMEOUT_SEC)
+        if self.http_executor:
+            self.http_executor.shutdown(cancel_futures=True)
+        if self.http:
+            self.http.close()
+        if self.cache:
+            self.cache.close()
+        self.scheduler.log_stats()
         return super().close()
 
-    def scrap(self, url: str) -> list[Message]:
+    async def scrap(self, url: str, result_path: str, job_id: int | None = None,
+                    reply_to: str = "gui", progress: bool = True) -> list[Message]:
         if not self._ready:
             return []
         logger.info("Starting the scrapper")
-        self.page.goto(url)
-        title = self.page.title()
-        print(title)
-        return []
+        job = ScrapJob(url, result_path, job_id, reply_to, progress)
+        async with self.scheduler.slot("bulk"):
+            self._handler.order_running()
+            try:
+                async with asyncio.timeout(settings.SCRAP_FIND_TIMEOUT_SEC):
+                    job.title, asset_urls = await self._find_page_assets(url)
+            except TimeoutError:
+                logger.error(f"Timed out while looking for the pages of {url}")
+                return [self._finish_scrap(job, False, "Délai dépassé")]
+            except Exception as e:
+                logger.error(f"Could not find the pages of the score : {str(e)}")
+                return [self._finish_scrap(job, False, str(e))]
+            if not asset_urls:
+                logger.error("The score has no page")
+                return [self._finish_scrap(job, False, "Aucune page trouvée")]
+
+        # The dump worker downloads the pages and writes the PDF, away from the
+        # page worker, which is free for the next score meanwhile. Every output
+        # file of a score gets its own checkpoint.
+        info = classify(job.url)
+        score = str(info.score_id) if info.score_id is not None else hashlib.sha1(info.key.encode()).hexdigest()[:16]
+        key = f"{score}-{hashlib.sha1(job.result_path.encode()).hexdigest()[:8]}"
+        return [(self._address, self._dump_worker, ("dump", (asset_urls, job.result_path, key), {
+            "job_id": job.job_id,
+            "reply_to": job.reply_to,
+            "progress": job.progress,
+            "title": job.title,
+            "elapsed_sec": time.perf_counter() - job.started,
+        }))]
 
-    def fetch_title(self, url: str) -> list[Message]:
+    async def fetch_title(self, url: str, request_id: int | None = None) -> list[Message]:
         if not self._ready:
-            return [(self._address, "gui", ("set_title", ("-",), {}))]
+            return [(self._address, "gui", ("set_title", ("-",), {"request_id": request_id}))]
+        # Only the latest title matters: the running request is cancelled
+        self.cancel_title()
+        self._title_task = asyncio.current_task()
+
+        score_id = classify(url).score_id
+        if score_id is not None and (entry := self.cache.get(score_id)) is not None:
+            logger.info(f"Metadata cache hit for score {score_id}")
+            metrics.inc("titles_total", source="cache")
+            title = NOT_FOUND_TITLE if entry.not_found else entry.title
+            return [(self._address, "gui", ("set_title", (title,), {"request_id": request_id}))]
+
+        try:
+            queued = time.perf_counter()
+            async with self.scheduler.slot("interactive"), asyncio.timeout(settings.FETCH_TITLE_TIMEOUT_SEC):
+                if (wait := time.perf_counter() - queued) > settings.SCHEDULER_SLOW_WAIT_SEC:
+                    logger.warning(f"Title request waited {wait:.1f} s for a slot")
+                loop = asyncio.get_running_loop()
+                title = await loop.run_in_executor(self.http_executor, self._fetch_title_http, url)
+                source = "http"
+                if title is None:
+                    logger.info(f"Falling back to the browser for: {url}")
+                    title = await self._fetch_title(url)
+                    source = "browser"
+        except asyncio.CancelledError:
+            logger.info(f"Dropped superseded title request: {url}")
+            raise
+        except TimeoutError:
+            logger.error(f"Timed out while fetching the title of {url}")
+            metrics.inc("titles_total", source="timeout")
+            title = ERROR_TITLE
+        except Exception as e:
+            logger.error(f"Could not fetch the title : {str(e)}")
+            metrics.inc("titles_total", source="error")
+            title = ERROR_TITLE
+        else:
+            metrics.inc("titles_total", source=source)
+            if score_id is not None:
+                not_found = title == NOT_FOUND_TITLE
+                self.cache.put(score_id, None if not_found else title, not_found)
+        finally:
+            if self._title_task is asyncio.current_task():
+                self._title_task = None
+        return [(self._address, "gui", ("set_title", (title,), {"request_id": request_id}))]
+
+    def cancel_title(self) -> list[Message]:
+        if self._title_task is not None and not self._title_task.done():
+            self._title_task.cancel()
+        self._title_task = None
+        return []
+
+    async def _find_page_assets(self, url: str) -> tuple[str, list[str]]:
+        async with (self.pool.page(self.scheduler.priority("bulk")) as page,
+                    route_profile(page, SCRAP_PROFILE, url)):
+            await page.goto(url)
+            await page.wait_for_selector(settings.SCORE_PAGE_SELECTOR, state="attached",
+                                         timeout=settings.SCRAP_PAGE_TIMEOUT_MS)
+            title = HTML_TITLE_SUFFIX.sub("", await page.title())
+            logger.info(f"Looking for the pages of: {title}")
+
+            # Page images are only inserted once their container is scrolled into view
+            containers = page.locator(settings.SCORE_PAGE_SELECTOR)
+            asset_urls = []
+            for index in range(await containers.count()):
+                container = containers.nth(index)
+                await container.scroll_into_view_if_needed()
+                image = container.locator("img").first
+                await image.wait_for(state="attached", timeout=settings.SCRAP_PAGE_TIMEOUT_MS)
+                asset_urls.append(urljoin(page.url, await image.get_attribute("src")))
+        logger.info(f"Found {len(asset_urls)} pages")
+        return title, asset_urls
+
+    def _finish_scrap(self, job: ScrapJob, success: bool, detail: str) -> Message:
+        metrics.inc("scraps_total", result="success" if success else "failure")
+        return (self._address, job.reply_to, ("scrap_finished", (success, detail), {
+            "job_id": job.job_id,
+            "title": job.title,
+            "elapsed_sec": time.perf_counter() - job.started,
+        }))
+
+    def _fetch_title_http(self, url: str) -> str | None:
+        try:
+            result = self.http.fetch_head(url)
+        except (OSError, http.client.HTTPException, HTTPEngineError) as e:
+            logger.info(f"HTTP fast path failed for {url} : {str(e)}")
+            return None
+
+        # Some missing scores answer with a 200 and the usual 404 page
+        if result.status == 404 or (result.title or "").strip() == NOT_FOUND_PAGE_TITLE:
+            logger.warning("Detected 404 page")
+            return NOT_FOUND_TITLE
+        if result.status == 200:
+            title = result.og_title or HTML_TITLE_SUFFIX.sub("", result.title or "")
+            if title:
+                return title
+        logger.info(f"HTTP fast path inconclusive for {url} (status {result.status})")
+        return None
+
+    async def _fetch_title(self, url: str) -> str:
         logger.info(f"Fetching selector content for: {url}")
-        selector = "#aside-container-unique > div.XkhEk > h1 > span"
+        start = time.perf_counter()
+        async with (self.pool.page(self.scheduler.priority("interactive")) as page,
+                    route_profile(page, TITLE_PROFILE, url)):
+            title = await self._read_title(page, url)
+        logger.info(f"Browser title fetch took {(time.perf_counter() - start) * 1000:.0f} ms")
+        return title
+
+    @staticmethod
+    async def _read_title(page: Page, url: str) -> str:
+        # Navigation returns once the response is committed, the page goes on
+        # loading only until the 404 <title> or the title selector shows up
+        start = time.perf_counter()
+        response = await page.goto(url, wait_until="commit")
+        committed = time.perf_counter()
+        if response is not None and response.status == 404:
+            logger.warning("Detected 404 page")
+            source, title = "status", NOT_FOUND_TITLE
+        else:
+            source, title = await PageManager._race_title(page)
+            try:
+                await page.evaluate("window.stop()")
+            except Exception as e:
+                logger.info(f"Could not stop the navigation to {url} : {str(e)}")
+        elapsed = time.perf_counter() - start
+        metrics.observe("browser_title_seconds", elapsed, source=source)
+        logger.info(f"Time to title {elapsed * 1000:.0f} ms by {source} "
+                    f"(committed after {(committed - start) * 1000:.0f} ms): {url}")
+        return title
 
-        self.page.goto(url)
-        self.page.wait_for_load_state("domcontentloaded")
+    @staticmethod
+    async def _race_title(page: Page) -> tuple[str, str]:
+        timeout = settings.FETCH_TITLE_SELECTOR_TIMEOUT_MS
 
-        page_title = self.page.title()
-        if page_title.strip() == "Page not found (404) | MuseScore.com":
+        async def not_found_title() -> str:
+            await page.wait_for_function("title => document.title.trim() === title", arg=NOT_FOUND_PAGE_TITLE,
+                                         timeout=timeout)
             logger.warning("Detected 404 page")
-            return [(self._address, "gui", ("set_title", ("Page inexistante",), {}))]
+            return NOT_FOUND_TITLE
 
-        el = self.page.wait_for_selector(selector, state="attached", timeout=5000)
-        if not el:
-            logger.warning(f"Selector not found: {selector}")
-            return [(self._address, "gui", ("set_title", ("Page inexistante",), {}))]
+        async def selector_title() -> str:
+            el = await page.wait_for_selector(TITLE_SELECTOR, state="attached", timeout=timeout)
+            if not el:
+                logger.warning(f"Selector not found: {TITLE_SELECTOR}")
+                return NOT_FOUND_TITLE
+            text = await el.text_content()
+            return text.strip() if text else NOT_FOUND_TITLE
 
-        text = el.text_content()
-        return [(self._address, "gui", ("set_title", (text.strip() if text else "Page inexistante",), {}))]
+        tasks = {asyncio.create_task(not_found_title()): "title", asyncio.create_task(selector_title()): "selector"}
+        pending = set(tasks)
+        try:
+            # A racer that fails early, on a navigation destroying its context
+            # for instance, leaves the other one running
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return tasks[task], task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
 
-def multiprocess_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int):
-    gui_handler = Handler(PageManager, "page", send_queue, recv_queue, ppid)
-    gui_handler.listen()
+def multiprocess_main(send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int,
+                      peers: dict[str, mp.Queue] | None = None, name: str = "page",
+                      pool_size: int = settings.PAGE_POOL_SIZE, bulk_slots: int | None = None):
+    page_handler = AsyncHandler(PageManager, name, send_queue, recv_queue, ppid, peers,
+                                pool_size=pool_size, bulk_slots=bulk_slots)
+    page_handler.listen()
@@ -0,0 +1,197 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Literal
+
+from playwright.async_api import async_playwright, Playwright, Browser, BrowserContext, Page
+
+logger = logging.getLogger(__name__)
+
+BrowserTypeAlias = Literal["chromium", "firefox", "webkit"]
+
+
+class PagePool:
+    # A single browser serves every page. Without a profile directory each page
+    # gets its own context, with one they all share the persistent context so
+    # that cached scripts and session state survive restarts.
+    def __init__(self, size: int, browser_type: BrowserTypeAlias, recycle_after: int,
+                 profile_dir: Path | None = None):
+        if size < 1:
+            raise ValueError("Page pool size must be at least 1")
+        self._size = size
+        self._browser_type = browser_type
+        self._recycle_after = recycle_after
+        self._profile_dir = profile_dir
+
+        self._pw: Playwright | None = None
+        self._browser: Browser | None = None
+        self._context: BrowserContext | None = None
+        self._idle: list[Page] = []
+        self._uses: dict[Page, int] = {}
+        self._free = size
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._open_lock = asyncio.Lock()
+        self._launch_task: asyncio.Task | None = None
+        self._closing = False
+        self._crashed = False
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def in_use(self) -> int:
+        return self._size - self._free
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def crashed(self) -> bool:
+        return self._crashed
+
+    def _on_disconnect(self, *_):
+        if not self._closing:
+            logger.error("The browser closed unexpectedly")
+            self._crashed = True
+
+    def start(self, prepare: Callable[[], Any] | None = None, prelaunch: int = 0):
+        if self._launch_task is not None:
+            raise RuntimeError("Cannot start the page pool twice")
+        self._launch_task = asyncio.create_task(self._launch(prepare, min(prelaunch, self._size)))
+
+    async def _launch(self, prepare: Callable[[], Any] | None, prelaunch: int):
+        if prepare is not None:
+            try:
+                await asyncio.to_thread(prepare)
+            except Exception as e:
+                logger.error(f"Could not prepare the page pool : {str(e)}")
+                raise
+        if not prelaunch:
+            return
+        for _ in range(prelaunch):
+            self._idle.append(await self._new_page())
+
+    async def _open_browser(self):
+        logger.info("Launching the browser")
+        start = time.perf_counter()
+        self._pw = await async_playwright().start()
+        browser_type = getattr(self._pw, self._browser_type)
+        if self._profile_dir is None:
+            self._browser = await browser_type.launch()
+            self._browser.on("disconnected", self._on_disconnect)
+        else:
+            user_data_dir = self._profile_dir / "context"
+            warm = user_data_dir.is_dir()
+            user_data_dir.mkdir(parents=True, exist_ok=True)
+            os.utime(user_data_dir)
+            self._context = await browser_type.launch_persistent_context(user_data_dir)
+            self._context.on("close", self._on_disconnect)
+            logger.info(f"Using {'warm' if warm else 'cold'} browser profile {user_data_dir}")
+        logger.info(f"Startup phase 'launch' took {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    async def _new_page(self) -> Page:
+        async with self._open_lock:
+            first = self._pw is None
+            if first:
+                await self._open_browser()
+        start = time.perf_counter()
+        if self._context is not None:
+            # The persistent context opens with a blank page, use it first
+            unused = [page for page in self._context.pages if page not in self._uses]
+            page = unused[0] if unused else await self._context.new_page()
+        else:
+            context = await self._browser.new_context()
+            page = await context.new_page()
+        self._uses[page] = 0
+        if first:
+            logger.info(f"Startup phase 'first page' took {(time.perf_counter() - start) * 1000:.0f} ms")
+        return page
+
+    async def _discard(self, page: Page):
+        self._uses.pop(page, None)
+        try:
+            if self._context is not None:
+                await page.close()
+            else:
+                await page.context.close()
+        except Exception as e:
+            logger.warning(f"Could not close a pooled page : {str(e)}")
+
+    async def _release(self, page: Page):
+        self._uses[page] += 1
+        if self._uses[page] >= self._recycle_after:
+            await self._discard(page)
+            return
+        try:
+            await page.goto("about:blank")
+        except Exception:
+            await self._discard(page)
+            return
+        self._idle.append(page)
+
+    async def _acquire(self, priority: int):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over()
+            raise
+
+    def _hand_over(self):
+        # The most urgent waiter gets the page slot, then the oldest one
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._free += 1
+
+    @asynccontextmanager
+    async def page(self, priority: int = 0) -> AsyncIterator[Page]:
+        if self._launch_task is None:
+            raise RuntimeError("Cannot use a page pool that is not started")
+        await self._acquire(priority)
+        try:
+            await asyncio.shield(self._launch_task)
+            page = self._idle.pop() if self._idle else await self._new_page()
+            try:
+                yield page
+            except BaseException:
+                # A failed or cancelled operation may leave the page anywhere
+                await self._discard(page)
+                raise
+            await self._release(page)
+        finally:
+            self._hand_over()
+
+    async def close(self, timeout: float | None = None):
+        self._closing = True
+        if self._launch_task is not None and not self._launch_task.done():
+            self._launch_task.cancel()
+        try:
+            async with asyncio.timeout(timeout):
+                for page in self._idle:
+                    await self._discard(page)
+                self._idle.clear()
+                if self._context is not None:
+                    await self._context.close()
+                if self._browser is not None:
+                    await self._browser.close()
+                if self._pw is not None:
+                    await self._pw.stop()
+        except TimeoutError:
+            logger.warning("Timed out while closing the page pool")
+        self._context = self._browser = self._pw = None
@@ -0,0 +1,155 @@
+import os
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO
+
+
+@dataclass(frozen=True)
+class PdfImage:
+    width: int
+    height: int
+    color_space: bytes
+    bits_per_component: int
+    data: bytes
+    decode_parms: bytes | None = None
+    smask: "PdfImage | None" = None
+
+
+@dataclass(frozen=True)
+class PdfPage:
+    width: float
+    height: float
+    content: bytes
+    images: dict[str, PdfImage] = field(default_factory=dict)
+    # Standard Type 1 fonts by resource name, they are never embedded
+    fonts: dict[str, str] = field(default_factory=dict)
+    # Fill and stroke opacities by graphics state name
+    opacities: dict[str, tuple[float, float]] = field(default_factory=dict)
+
+
+def format_number(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    text = f"{value:.4f}".rstrip("0").rstrip(".")
+    # Rounding errors around zero
+    return "0" if text == "-0" else text
+
+
+class PdfStreamWriter:
+    # Every page is written to disk as soon as it is added: only the object
+    # offsets and the page object numbers stay in memory. The pages go to a
+    # .part file that replaces the PDF once it is complete, so a failed dump
+    # leaves the previous file in place.
+    CATALOG = 1
+    PAGES = 2
+
+    def __init__(self, path: str | Path, *, compress_level: int = 6):
+        self._path = Path(path)
+        self._part_path = self._path.with_name(self._path.name + ".part")
+        self._compress_level = compress_level
+        self._file: BinaryIO | None = None
+        self._offsets: dict[int, int] = {}
+        self._next_object = self.PAGES + 1
+        self._page_objects: list[int] = []
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_objects)
+
+    def __enter__(self) -> "PdfStreamWriter":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def open(self):
+        if self._file is not None:
+            raise RuntimeError("Cannot open a PDF writer twice")
+        self._file = open(self._part_path, "wb")
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _reserve(self) -> int:
+        number = self._next_object
+        self._next_object += 1
+        return number
+
+    def _write_object(self, number: int, body: bytes):
+        self._offsets[number] = self._file.tell()
+        self._file.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    def _write_stream(self, number: int, entries: bytes, data: bytes):
+        self._write_object(number, b"<< " + entries + b" /Length %d >>\nstream\n" % len(data)
+                           + data + b"\nendstream")
+
+    def _write_image(self, image: PdfImage) -> int:
+        smask = self._write_image(image.smask) if image.smask is not None else None
+        number = self._reserve()
+        entries = (b"/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent %d"
+                   b" /Filter /FlateDecode" % (image.width, image.height, image.color_space,
+                                               image.bits_per_component))
+        if image.decode_parms is not None:
+            entries += b" /DecodeParms " + image.decode_parms
+        if smask is not None:
+            entries += b" /SMask %d 0 R" % smask
+        self._write_stream(number, entries, image.data)
+        return number
+
+    def add_page(self, page: PdfPage):
+        if self._file is None:
+            raise RuntimeError("Cannot add a page to a closed PDF writer")
+        xobjects = b"".join(b"/%s %d 0 R " % (name.encode(), self._write_image(image))
+                            for name, image in page.images.items())
+
+        content = self._reserve()
+        self._write_stream(content, b"/Filter /FlateDecode", zlib.compress(page.content, self._compress_level))
+
+        resources = b"/ProcSet [/PDF /ImageB /ImageC /ImageI]"
+        if xobjects:
+            resources += b" /XObject << " + xobjects + b">>"
+        if page.fonts:
+            resources += b" /Font << " + b"".join(
+                b"/%s << /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >> "
+                % (name.encode(), base_font.encode()) for name, base_font in page.fonts.items()) + b">>"
+        if page.opacities:
+            resources += b" /ExtGState << " + b"".join(
+                b"/%s << /ca %s /CA %s >> " % (name.encode(), format_number(fill).encode(),
+                                               format_number(stroke).encode())
+                for name, (fill, stroke) in page.opacities.items()) + b">>"
+        number = self._reserve()
+        self._write_object(number, (
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %s %s] /Resources << %s >> /Contents %d 0 R >>"
+            % (self.PAGES, format_number(page.width).encode(), format_number(page.height).encode(),
+               resources, content)
+        ))
+        self._page_objects.append(number)
+
+    def close(self):
+        if self._file is None:
+            return
+        kids = b" ".join(b"%d 0 R" % number for number in self._page_objects)
+        self._write_object(self.PAGES, b"<< /Type /Pages /Kids [%s] /Count %d >>"
+                           % (kids, len(self._page_objects)))
+        self._write_object(self.CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % self.PAGES)
+
+        xref_offset = self._file.tell()
+        size = self._next_object
+        self._file.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for number in range(1, size):
+            self._file.write(b"%010d 00000 n \n" % self._offsets[number])
+        self._file.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                         % (size, self.CATALOG, xref_offset))
+        self._file.close()
+        self._file = None
+        os.replace(self._part_path, self._path)
+
+    def abort(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self._part_path.unlink(missing_ok=True)
@@ -0,0 +1,96 @@
+import logging
+import re
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+from urllib.parse import urlsplit
+
+from playwright.async_api import Page, Route, Request
+
+logger = logging.getLogger(__name__)
+
+TRACKER_HOSTS = frozenset({
+    "google-analytics.com", "googletagmanager.com", "googletagservices.com", "doubleclick.net",
+    "googlesyndication.com", "googleadservices.com", "adservice.google.com", "facebook.net",
+    "connect.facebook.net", "hotjar.com", "scorecardresearch.com", "quantserve.com", "quantcount.com",
+    "amazon-adsystem.com", "adnxs.com", "criteo.com", "criteo.net", "taboola.com", "outbrain.com",
+    "pubmatic.com", "rubiconproject.com", "casalemedia.com", "openx.net", "moatads.com",
+    "cloudflareinsights.com", "sentry.io", "bugsnag.com", "branch.io", "onetrust.com", "cookielaw.org",
+})
+SCORE_ASSET = re.compile(r"/score_\d+\.(?:svg|png)(?:$|\?)", re.IGNORECASE)
+
+# Rough transfer sizes of the resources of a score page, only used to report
+# what blocking saves since aborted requests never get a response.
+ESTIMATED_BYTES = {
+    "image": 40_000, "media": 500_000, "font": 60_000, "stylesheet": 30_000,
+    "script": 80_000, "xhr": 5_000, "fetch": 5_000, "other": 10_000,
+}
+
+
+@dataclass(frozen=True)
+class RouteProfile:
+    name: str
+    blocked_types: frozenset[str]
+    block_trackers: bool = True
+    allow: Callable[[Request], bool] | None = None
+
+    def is_allowed(self, request: Request) -> bool:
+        if self.allow is not None and self.allow(request):
+            return True
+        if request.resource_type in self.blocked_types:
+            return False
+        return not (self.block_trackers and is_tracker(request.url))
+
+
+def is_tracker(url: str) -> bool:
+    host = urlsplit(url).hostname or ""
+    parts = host.split(".")
+    return any(".".join(parts[index:]) in TRACKER_HOSTS for index in range(len(parts) - 1))
+
+
+def is_score_asset(request: Request) -> bool:
+    return bool(SCORE_ASSET.search(request.url))
+
+
+# The title only needs the document and the scripts that render the header
+TITLE_PROFILE = RouteProfile("title", frozenset({"image", "media", "font", "stylesheet", "websocket",
+                                                 "manifest", "texttrack", "eventsource", "other"}))
+# The viewer scripts must run to insert the page images, whose URLs are read
+# from the DOM: score assets are let through, other images are not needed.
+SCRAP_PROFILE = RouteProfile("scrap", frozenset({"image", "media", "font", "stylesheet", "websocket",
+                                                 "manifest", "texttrack", "eventsource"}),
+                             allow=is_score_asset)
+
+
+class RouteStats:
+    def __init__(self):
+        self.allowed = 0
+        self.blocked: Counter[str] = Counter()
+
+    @property
+    def bytes_saved(self) -> int:
+        return sum(ESTIMATED_BYTES.get(kind, ESTIMATED_BYTES["other"]) * count
+                   for kind, count in self.blocked.items())
+
+
+@asynccontextmanager
+async def route_profile(page: Page, profile: RouteProfile, url: str) -> AsyncIterator[RouteStats]:
+    stats = RouteStats()
+
+    async def handle(route: Route):
+        request = route.request
+        if profile.is_allowed(request):
+            stats.allowed += 1
+            await route.continue_()
+        else:
+            stats.blocked[request.resource_type] += 1
+            await route.abort()
+
+    await page.route("**/*", handle)
+    try:
+        yield stats
+    finally:
+        await page.unroute("**/*", handle)
+        logger.info(f"Route profile '{profile.name}' for {url} : {stats.allowed} allowed, "
+                    f"{sum(stats.blocked.values())} blocked (~{stats.bytes_saved / 1e6:.1f} MB saved)")
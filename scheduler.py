@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Hashable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ClassStats:
+    name: str
+    slots: int
+    running: int
+    queued: int
+    admitted: int
+    mean_wait_sec: float
+    p95_wait_sec: float
+    max_wait_sec: float
+
+
+class _SchedulerClass:
+    def __init__(self, name: str, slots: int):
+        if slots < 1:
+            raise ValueError(f"Scheduler class {name} needs at least one slot")
+        self.name = name
+        self.slots = slots
+        self.running = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits: deque[float] = deque(maxlen=1000)
+
+    def record_wait(self, wait: float):
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+    def stats(self) -> ClassStats:
+        waits = sorted(self.recent_waits)
+        return ClassStats(self.name, self.slots, self.running, len(self.waiters), self.admitted,
+                          self.total_wait / self.admitted if self.admitted else 0.0,
+                          waits[int(len(waits) * 0.95)] if waits else 0.0, self.max_wait)
+
+
+class PriorityScheduler:
+    # Classes are given from the most to the least urgent. Each one admits at
+    # most its number of slots at once, in arrival order; the class priority
+    # is what shared resources (the browser pages) use to pick who goes next.
+    def __init__(self, slots: dict[str, int]):
+        self._classes = {name: _SchedulerClass(name, count) for name, count in slots.items()}
+
+    def priority(self, name: str) -> int:
+        return list(self._classes).index(name)
+
+    def _release(self, scheduler_class: _SchedulerClass):
+        scheduler_class.running -= 1
+        while scheduler_class.waiters and scheduler_class.running < scheduler_class.slots:
+            waiter = scheduler_class.waiters.popleft()
+            if not waiter.done():
+                scheduler_class.running += 1
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, name: str) -> AsyncIterator[None]:
+        scheduler_class = self._classes[name]
+        queued = time.perf_counter()
+        if scheduler_class.running < scheduler_class.slots and not scheduler_class.waiters:
+            scheduler_class.running += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            scheduler_class.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Admitted at the moment it was cancelled
+                    self._release(scheduler_class)
+                raise
+        scheduler_class.record_wait(time.perf_counter() - queued)
+        try:
+            yield
+        finally:
+            self._release(scheduler_class)
+
+    def stats(self) -> list[ClassStats]:
+        return [scheduler_class.stats() for scheduler_class in self._classes.values()]
+
+    def log_stats(self):
+        for stats in self.stats():
+            logger.info(f"Scheduler class '{stats.name}' : {stats.admitted} admitted, {stats.queued} queued, "
+                        f"wait mean {stats.mean_wait_sec * 1000:.0f} ms, p95 {stats.p95_wait_sec * 1000:.0f} ms, "
+                        f"max {stats.max_wait_sec * 1000:.0f} ms")
+
+
+class FairShare:
+    # Shares a number of concurrent units between jobs in turn, so that a long
+    # job cannot hold all of them while shorter ones wait behind it.
+    def __init__(self, slots: int):
+        self._condition = threading.Condition()
+        self._free = slots
+        self._turns: deque[Hashable] = deque()
+        self._waiting: Counter[Hashable] = Counter()
+
+    @contextmanager
+    def turn(self, job: Hashable) -> Iterator[None]:
+        with self._condition:
+            if not self._waiting[job]:
+                self._turns.append(job)
+            self._waiting[job] += 1
+            self._condition.wait_for(lambda: self._free > 0 and self._turns[0] == job)
+            self._free -= 1
+            self._turns.popleft()
+            self._waiting[job] -= 1
+            if self._waiting[job]:
+                self._turns.append(job)
+            else:
+                del self._waiting[job]
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._free += 1
+                self._condition.notify_all()
@@ -1,8 +1,9 @@
 import logging
+import os
+import sys
+from pathlib import Path
 from typing import Literal
 
-from PySide6.QtCore import QStandardPaths
-
 BROWSER: Literal["chromium", "firefox", "webkit"] = "chromium"
 LOGGING_CONFIG = {
     "level": logging.INFO,
@@ -10,10 +11,92 @@ LOGGING_CONFIG = {
     "datefmt": '%Y-%m-%d %H:%M:%S'
 }
 ENTRY_PLACEHOLDER = "Entrez ou collez l'URL ici (https://musescore.com/...)"
-WINDOW_GEOMETRY: tuple[int, int] = (560, 260)
+WINDOW_GEOMETRY: tuple[int, int] = (560, 480)
 FETCH_TITLE_DEBOUNCE_MS: int = 500
 DEFAULT_AUTO_TITLE_MODE: bool = True
-DEFAULT_FOLDER_LOCATION = QStandardPaths.StandardLocation.DesktopLocation
+# Name of a QStandardPaths.StandardLocation, resolved by the GUI
+DEFAULT_FOLDER_LOCATION = "DesktopLocation"
 DEFAULT_FILE_NAME = "partition.pdf"
-DEFAULT_REFRESH_STEP_TIMEOUT_SEC: float = 1/30
-GUI_MANAGER_REFRESH_STEP_TIMEOUT_SEC: float = 1/60
+GUI_MESSAGE_POLL_INTERVAL_SEC: float = 1/60
+PAGE_POOL_SIZE: int = 3
+PAGE_POOL_RECYCLE_AFTER: int = 25
+PAGE_POOL_CLOSE_TIMEOUT_SEC: float = 5.0
+FETCH_TITLE_SELECTOR_TIMEOUT_MS: int = 5000
+FETCH_TITLE_TIMEOUT_SEC: float = 15.0
+APP_NAME = "MuseScoreScrapper"
+
+
+def _generic_cache_dir() -> Path:
+    # Where QStandardPaths.GenericCacheLocation points, without loading Qt
+    if sys.platform == "win32":
+        return Path(os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local") / "cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches"
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+
+
+CACHE_DIR = _generic_cache_dir() / APP_NAME
+METADATA_CACHE_FILE = CACHE_DIR / "metadata.sqlite3"
+METADATA_CACHE_TTL_SEC: float = 7 * 24 * 3600
+METADATA_CACHE_NEGATIVE_TTL_SEC: float = 3600
+METADATA_CACHE_MAX_ENTRIES: int = 10000
+METADATA_CACHE_MEMORY_ENTRIES: int = 256
+BROWSER_INSTALL_MARKER = CACHE_DIR / "browsers.json"
+PAGE_POOL_PRELAUNCH: int = 1
+HTTP_USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                   "Chrome/139.0.0.0 Safari/537.36")
+HTTP_POOL_SIZE: int = 4
+HTTP_TIMEOUT_SEC: float = 5.0
+SCORE_PAGE_SELECTOR = "#jmuse-scroller-component > div"
+SCRAP_PAGE_TIMEOUT_MS: int = 10000
+SCRAP_FIND_TIMEOUT_SEC: float = 120.0
+DUMP_CONCURRENCY: int = 4
+DUMP_SPOOL_DIR = CACHE_DIR / "dumps"
+# Page conversions run in a pool of processes of the dump worker, one per core
+# by default, for at most DUMP_JOBS scores at once.
+DUMP_PROCESSES: int | None = None
+DUMP_JOBS: int = 2
+DOWNLOAD_TIMEOUT_SEC: float = 20.0
+DOWNLOAD_RETRIES: int = 4
+DOWNLOAD_BACKOFF_BASE_SEC: float = 0.5
+DOWNLOAD_BACKOFF_MAX_SEC: float = 10.0
+BATCH_WORKERS: int | None = None
+BATCH_PAGES_PER_WORKER: int = 2
+BATCH_OUTPUT_DIR = "scores"
+DIRECT_CHANNELS: bool = True
+BROWSER_PERSISTENT_PROFILE: bool = True
+BROWSER_PROFILE_DIR = CACHE_DIR / "profiles"
+BROWSER_PROFILE_MAX_BYTES: int = 256 * 1024 * 1024
+TRACING: bool = os.environ.get("MUSESCORE_SCRAPPER_TRACE") == "1"
+TRACE_DIR = CACHE_DIR / "traces"
+# From the most to the least urgent. Bulk scraps get fewer slots than the page
+# pool has pages, so that previews always find a free page.
+SCHEDULER_SLOTS: dict[str, int] = {"interactive": 32, "bulk": 2}
+SCHEDULER_SLOW_WAIT_SEC: float = 1.0
+PROGRESS_INTERVAL_SEC: float = 1/60
+# Workers other than the main one are pinged and restarted when they fail,
+# with the orders they had not finished sent again. Only the long orders are
+# journaled for that, through the manager, the others are cheap to ask again.
+SUPERVISOR_TICK_SEC: float = 0.25
+SUPERVISOR_PING_INTERVAL_SEC: float = 2.0
+SUPERVISOR_PING_TIMEOUT_SEC: float = 10.0
+SUPERVISOR_JOURNALED: frozenset[str] = frozenset({"scrap", "dump"})
+SUPERVISOR_ORDER_TIMEOUT_SEC: dict[str, float] = {"scrap": 300.0, "dump": 1800.0}
+SUPERVISOR_MAX_ATTEMPTS: int = 2
+SUPERVISOR_MAX_RESTARTS: int = 5
+SUPERVISOR_RESTART_WINDOW_SEC: float = 300.0
+SUPERVISOR_STANDBY: bool = False
+# Slowest imports listed at the start of every worker process
+IMPORT_TIME_TOP: int = 10
+# Bytes-like message arguments from this size go through shared memory
+SHARED_PAYLOAD_MIN_BYTES: int = 256 * 1024
+# Workers report their metrics to the manager, that serves them on localhost
+# (Prometheus text format) and/or appends them to a rotating JSONL file.
+METRICS_INTERVAL_SEC: float = 5.0
+METRICS_PORT: int | None = int(os.environ["MUSESCORE_SCRAPPER_METRICS_PORT"]) \
+    if os.environ.get("MUSESCORE_SCRAPPER_METRICS_PORT") else None
+METRICS_TO_FILE: bool = os.environ.get("MUSESCORE_SCRAPPER_METRICS_FILE") == "1"
+METRICS_FILE = CACHE_DIR / "metrics" / "metrics.jsonl"
+METRICS_FILE_MAX_BYTES: int = 1024 * 1024
+METRICS_FILE_BACKUPS: int = 3
+METRICS_BUCKETS_SEC: tuple[float, ...] = (0.001, 0.005, 0.025, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0, 600.0)
@@ -0,0 +1,122 @@
+import logging
+import multiprocessing as mp
+import os
+import uuid
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "msc_"
+
+
+@dataclass(frozen=True)
+class PayloadHandle:
+    # What goes through the queues in place of a large bytes-like value
+    name: str
+    size: int
+
+
+class SharedPayload:
+    # The receiving side of a shared memory block. The handler holds a
+    # reference while the order runs, a worker keeping the payload past that
+    # retains it and releases it when done: the block is freed at zero.
+    def __init__(self, handle: PayloadHandle):
+        self._shm = shared_memory.SharedMemory(handle.name, track=False)
+        self._size = handle.size
+        self._refs = 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __buffer__(self, flags: int) -> memoryview:
+        return self._shm.buf[:self._size]
+
+    def __bytes__(self) -> bytes:
+        return bytes(self._shm.buf[:self._size])
+
+    def retain(self) -> "SharedPayload":
+        if self._refs <= 0:
+            raise RuntimeError("Cannot retain a released payload")
+        self._refs += 1
+        return self
+
+    def release(self):
+        if self._refs <= 0:
+            raise RuntimeError("Cannot release a payload twice")
+        self._refs -= 1
+        if self._refs:
+            return
+        try:
+            self._shm.close()
+        except BufferError:
+            logger.warning(f"Payload {self._shm.name} released while still in use")
+        self._shm.unlink()
+
+
+def _owner_pid() -> int:
+    # Blocks are named after the manager, that removes the undelivered ones
+    parent = mp.parent_process()
+    return parent.pid if parent is not None else os.getpid()
+
+
+def export(value: bytes | bytearray | memoryview | SharedPayload) -> PayloadHandle:
+    data = memoryview(value).cast("B")
+    shm = shared_memory.SharedMemory(f"{PREFIX}{_owner_pid()}_{uuid.uuid4().hex[:12]}", create=True,
+                                     size=max(data.nbytes, 1), track=False)
+    shm.buf[:data.nbytes] = data
+    shm.close()
+    return PayloadHandle(shm.name, data.nbytes)
+
+
+def _map(value: Any, func) -> Any:
+    if isinstance(value, (list, tuple)):
+        return type(value)(_map(item, func) for item in value)
+    if isinstance(value, dict):
+        return {key: _map(item, func) for key, item in value.items()}
+    return func(value)
+
+
+def pack(what):
+    if not isinstance(what, tuple):
+        return what
+
+    def swap(value):
+        if isinstance(value, (bytes, bytearray, memoryview, SharedPayload)) and \
+                memoryview(value).nbytes >= settings.SHARED_PAYLOAD_MIN_BYTES:
+            return export(value)
+        return value
+
+    func, args, kwargs = what
+    return func, _map(args, swap), _map(kwargs, swap)
+
+
+def unpack(args: tuple, kwargs: dict) -> tuple[tuple, dict, list[SharedPayload]]:
+    payloads = []
+
+    def attach(value):
+        if isinstance(value, PayloadHandle):
+            payloads.append(SharedPayload(value))
+            return payloads[-1]
+        return value
+
+    return _map(args, attach), _map(kwargs, attach), payloads
+
+
+def unlink_orphans(owner_pid: int) -> int:
+    # Blocks of messages that were never handled, where they can be listed
+    directory = Path("/dev/shm")
+    if not directory.is_dir():
+        return 0
+    count = 0
+    for path in directory.glob(f"{PREFIX}{owner_pid}_*"):
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        count += 1
+    return count
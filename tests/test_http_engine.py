@@ -0,0 +1,125 @@
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_engine import HTTPEngine, HTTPEngineError, _HeadParser
+
+
+def parse(*chunks: str) -> _HeadParser:
+    parser = _HeadParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser
+
+
+def test_title_and_og_title():
+    parser = parse('<html><head><meta property="og:title" content=" Sonata No. 1 ">'
+                   "<title>\n  Sonata &amp; Fugue | MuseScore\n</title></head>")
+    assert parser.title == "Sonata & Fugue | MuseScore"
+    assert parser.og_title == "Sonata No. 1"
+    assert parser.done
+
+
+def test_title_split_across_chunks():
+    parser = parse("<html><head><ti", "tle>Moon", "light &eac", "ute;</title>", "</he", "ad>")
+    assert parser.title == "Moonlight é"
+    assert parser.done
+
+
+def test_only_the_first_title():
+    assert parse("<title>First</title><title>Second</title>").title == "First"
+
+
+@pytest.mark.parametrize("html", [
+    '<head><meta property="og:title" content=""></head>',
+    '<head><meta name="og:title" content="Name, not property"></head>',
+    "<head></head>",
+])
+def test_missing_titles(html):
+    parser = parse(html)
+    assert (parser.title, parser.og_title) == (None, None)
+
+
+def test_stops_at_body_without_head():
+    parser = parse("<html><title>T</title>")
+    assert not parser.done
+    parser.feed("<body><title>Ignored</title>")
+    assert parser.done and parser.title == "T"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/score")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/loop":
+            self.send_response(301)
+            self.send_header("Location", "/loop")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/score":
+            body = gzip.compress("<html><head><title>Étude</title></head><body>…</body></html>".encode("latin-1",
+                                                                                                "replace"))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=latin-1")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def engine():
+    engine = HTTPEngine(user_agent="tests", max_redirects=2)
+    yield engine
+    engine.close()
+
+
+def test_fetch_head_follows_redirects(server, engine):
+    result = engine.fetch_head(f"{server}/redirect")
+    assert (result.url, result.status, result.title) == (f"{server}/score", 200, "Étude")
+
+
+def test_fetch_head_reuses_connections(server, engine):
+    engine.fetch_head(f"{server}/score")
+    engine.fetch_head(f"{server}/score")
+    assert sum(len(idle) for idle in engine.pool._idle.values()) == 1
+
+
+def test_too_many_redirects(server, engine):
+    with pytest.raises(HTTPEngineError):
+        engine.fetch_head(f"{server}/loop")
+
+
+def test_fetch_bytes_status(server, engine):
+    with pytest.raises(HTTPEngineError) as error:
+        engine.fetch_bytes(f"{server}/missing")
+    assert error.value.status == 404
+
+
+@pytest.mark.parametrize("url", ["ftp://example.com/file", "https:///path", "example.com"])
+def test_unsupported_urls(engine, url):
+    with pytest.raises(HTTPEngineError):
+        engine.fetch_head(url)
@@ -0,0 +1,289 @@
+import struct
+import zlib
+
+import pytest
+
+from page_converter import ConversionError, convert_asset, detect_kind, path_operators, png_to_page, svg_to_page
+
+
+def png(width: int, height: int, bit_depth: int, color_type: int, rows: list[bytes], *chunks: tuple[bytes, bytes],
+        interlace: int = 0) -> bytes:
+    # A PNG written chunk by chunk, every row with the None filter
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+    header = struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, interlace)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + b"".join(chunk(*c) for c in chunks)
+            + chunk(b"IDAT", zlib.compress(b"".join(b"\0" + row for row in rows))) + chunk(b"IEND", b""))
+
+
+def svg(body: str, attributes: str = 'width="100" height="50"') -> bytes:
+    return f'<svg xmlns="http://www.w3.org/2000/svg" {attributes}>{body}</svg>'.encode()
+
+
+def content(data: bytes) -> list[str]:
+    return svg_to_page(data).content.decode().splitlines()
+
+
+# Detection
+
+@pytest.mark.parametrize("data, kind", [
+    (png(1, 1, 8, 0, [b"\0"]), "png"),
+    (svg(""), "svg"),
+    (b'<?xml version="1.0"?>\n' + svg(""), "svg"),
+    (b"\n  <!-- exported -->" + svg(""), "svg"),
+])
+def test_detect_kind(data, kind):
+    assert detect_kind(data) == kind
+
+
+@pytest.mark.parametrize("data", [b"", b"GIF89a", b"<html><body></body></html>"])
+def test_detect_kind_rejects_other_formats(data):
+    with pytest.raises(ConversionError):
+        detect_kind(data)
+
+
+# SVG size
+
+def test_svg_size_in_points():
+    page = svg_to_page(svg("", 'width="200" height="100"'))
+    assert (page.width, page.height) == (150, 75)
+
+
+def test_svg_size_from_viewbox():
+    page = svg_to_page(svg("", 'viewBox="0 0 400 200"'))
+    assert (page.width, page.height) == (300, 150)
+
+
+@pytest.mark.parametrize("attributes", [
+    "",
+    'width="0" height="10"',
+    'width="-5" height="10"',
+    'viewBox="0 0 0 0"',
+    'width="10" height="10" viewBox="0 0 0 0"',
+    'width="10" height="10" viewBox="0 0 100 0"',
+    'width="10" height="10" viewBox="0 0 -100 100"',
+])
+def test_svg_without_usable_size(attributes):
+    with pytest.raises(ConversionError):
+        svg_to_page(svg("", attributes))
+
+
+@pytest.mark.parametrize("data", [b"<svg", b"<svg xmlns='http://www.w3.org/2000/svg'><g></svg>", b"<html/>"])
+def test_malformed_svg(data):
+    with pytest.raises(ConversionError):
+        svg_to_page(data)
+
+
+# Colours
+
+@pytest.mark.parametrize("fill, operator", [
+    ("red", "1 0 0 rg"),
+    ("#00f", "0 0 1 rg"),
+    ("#0000FF", "0 0 1 rg"),
+    ("rgb(255, 0, 0)", "1 0 0 rg"),
+    ("rgb(100%, 0%, 0%)", "1 0 0 rg"),
+    ("rgb(255 0 0)", "1 0 0 rg"),
+    ("rgb(300, -20, 0)", "1 0 0 rg"),
+    ("unknowncolour", "0 0 0 rg"),
+])
+def test_fill_colour(fill, operator):
+    assert operator in content(svg(f'<rect width="10" height="10" fill="{fill}"/>'))
+
+
+@pytest.mark.parametrize("fill", ["none", "transparent", "url(#gradient)", "rgb(10,20)", "rgb()", "rgb(1,2,3,4,5)",
+                                  "#12", "#12345", "#ggg", "#1234567"])
+def test_fill_not_painted(fill):
+    # Malformed colours paint nothing, rather than failing the whole page
+    assert content(svg(f'<rect width="10" height="10" fill="{fill}"/>'))[1:] == []
+
+
+@pytest.mark.parametrize("fill, operator, alpha", [
+    ("#ff000080", "1 0 0 rg", 0.502),
+    ("#f008", "1 0 0 rg", 0.533),
+    ("rgba(0, 0, 255, 0.5)", "0 0 1 rg", 0.5),
+    ("rgba(0, 0, 255, 25%)", "0 0 1 rg", 0.25),
+    ("rgb(0 0 255 / 0.5)", "0 0 1 rg", 0.5),
+])
+def test_fill_colour_alpha(fill, operator, alpha):
+    page = svg_to_page(svg(f'<rect width="10" height="10" fill="{fill}" fill-opacity="0.5"/>'))
+    assert operator in page.content.decode().splitlines()
+    assert list(page.opacities.values()) == [(round(alpha * 0.5, 3), 1.0)]
+
+
+def test_stroke_colour_alpha():
+    page = svg_to_page(svg('<line x2="10" y2="10" stroke="rgba(0, 0, 0, 0.5)"/>'))
+    assert list(page.opacities.values()) == [(1.0, 0.5)]
+
+
+def test_stroke_with_malformed_colour():
+    ops = content(svg('<rect width="10" height="10" fill="none" stroke="rgb(1, 2)"/>'))
+    assert "S" not in ops
+
+
+# Shapes and paths
+
+def test_rect_fill_and_stroke():
+    ops = content(svg('<rect x="1" y="2" width="3" height="4" fill="#000" stroke="#fff" stroke-width="2"/>'))
+    assert ops[1:] == ["q", "0 0 0 rg", "1 1 1 RG", "2 w", "0 J", "0 j", "4 M", "1 2 3 4 re", "B", "Q"]
+
+
+@pytest.mark.parametrize("element", [
+    '<rect width="0" height="10"/>',
+    '<circle r="0"/>',
+    '<ellipse rx="5" ry="-1"/>',
+    '<polygon points="1 2"/>',
+    '<path d=""/>',
+    '<line x2="10" y2="10"/>',
+])
+def test_empty_shapes_draw_nothing(element):
+    assert content(svg(element))[1:] == []
+
+
+def test_path_absolute_and_relative():
+    assert path_operators("M10 10 l5 0 v5 H10 z") == ["10 10 m", "15 10 l", "15 15 l", "10 15 l", "h"]
+
+
+def test_path_implicit_lineto():
+    assert path_operators("m1 1 2 2 3 3") == ["1 1 m", "3 3 l", "6 6 l"]
+
+
+def test_path_quadratic_becomes_cubic():
+    assert path_operators("M0 0 Q3 3 6 0") == ["0 0 m", "2 2 4 2 6 0 c"]
+
+
+def test_path_arc():
+    ops = path_operators("M0 0 A5 5 0 0 1 10 0")
+    assert ops[0] == "0 0 m"
+    assert all(op.endswith(" c") for op in ops[1:])
+    assert ops[-1].endswith(" 10 0 c")
+
+
+@pytest.mark.parametrize("d", ["M 0", "M0 0 L", "M0 0 A5 5 0 2 1 10 0"])
+def test_malformed_path(d):
+    with pytest.raises(ConversionError):
+        path_operators(d)
+
+
+def test_hidden_elements():
+    ops = content(svg('<rect width="1" height="1" display="none"/><rect width="1" height="1" visibility="hidden"/>'
+                      '<defs><rect width="1" height="1"/></defs>'))
+    assert ops[1:] == []
+
+
+def test_use_and_transform():
+    ops = content(svg('<defs><rect id="r" width="1" height="1"/></defs>'
+                      '<use href="#r" x="5" transform="scale(2)"/>'))
+    assert ops[1:4] == ["q", "2 0 0 2 0 0 cm", "1 0 0 1 5 0 cm"]
+    assert "0 0 1 1 re" in ops
+
+
+def test_use_cycle_is_not_followed():
+    # The group is drawn once through the <use>, which is not followed again inside
+    assert content(svg('<g id="g"><use href="#g"/></g>'))[1:] == ["q", "Q"]
+
+
+def test_text_with_standard_font():
+    page = svg_to_page(svg('<text x="1" y="2" font-family="Arial" font-weight="bold">(Page 1)</text>'))
+    assert page.fonts == {"F0": "Helvetica-Bold"}
+    assert "1 0 0 -1 1 2 Tm (\\(Page 1\\)) Tj" in page.content.decode()
+
+
+# PNG
+
+def test_gray_png_is_passed_through():
+    data = png(2, 1, 8, 0, [b"\x00\xff"])
+    page = png_to_page(data)
+    image = page.images["Im0"]
+    assert (image.color_space, image.bits_per_component, image.smask) == (b"/DeviceGray", 8, None)
+    assert image.decode_parms == b"<< /Predictor 15 /Colors 1 /BitsPerComponent 8 /Columns 2 >>"
+    assert zlib.decompress(image.data) == b"\x00\x00\xff"
+
+
+def test_rgb_png_is_passed_through():
+    image = png_to_page(png(1, 1, 8, 2, [b"\x01\x02\x03"])).images["Im0"]
+    assert (image.color_space, image.decode_parms is not None) == (b"/DeviceRGB", True)
+
+
+def test_palette_png_is_passed_through():
+    image = png_to_page(png(2, 1, 1, 3, [b"\x40"], (b"PLTE", b"\xff\x00\x00\x00\x00\xff"))).images["Im0"]
+    assert image.color_space == b"[/Indexed /DeviceRGB 1 <ff00000000ff>]"
+    assert image.bits_per_component == 1
+
+
+def test_palette_png_without_plte():
+    with pytest.raises(ConversionError):
+        png_to_page(png(1, 1, 8, 3, [b"\0"]))
+
+
+def test_png_resolution_sets_page_size():
+    data = png(96, 48, 8, 0, [b"\0" * 96] * 48, (b"pHYs", struct.pack(">IIB", 3780, 3780, 1)))
+    page = png_to_page(data)
+    assert (round(page.width, 1), round(page.height, 1)) == (72.0, 36.0)
+
+
+def test_png_without_resolution_is_a4_wide():
+    assert png_to_page(png(10, 20, 8, 0, [b"\0" * 10] * 20)).width == 595.28
+
+
+def test_palette_png_transparency_becomes_smask():
+    data = png(2, 1, 8, 3, [b"\x00\x01"], (b"PLTE", b"\xff\x00\x00\x00\x00\xff"), (b"tRNS", b"\x00"))
+    image = png_to_page(data).images["Im0"]
+    assert (image.color_space, image.bits_per_component, image.decode_parms) == (b"/DeviceRGB", 8, None)
+    assert zlib.decompress(image.data) == b"\xff\x00\x00\x00\x00\xff"
+    assert zlib.decompress(image.smask.data) == b"\x00\xff"
+
+
+def test_gray_png_transparency_becomes_smask():
+    image = png_to_page(png(2, 1, 8, 0, [b"\x07\x08"], (b"tRNS", b"\x00\x07"))).images["Im0"]
+    assert zlib.decompress(image.data) == b"\x07\x08"
+    assert zlib.decompress(image.smask.data) == b"\x00\xff"
+
+
+def test_rgb_png_transparency_becomes_smask():
+    data = png(2, 1, 8, 2, [b"\x01\x02\x03\x04\x05\x06"], (b"tRNS", b"\x00\x01\x00\x02\x00\x03"))
+    image = png_to_page(data).images["Im0"]
+    assert zlib.decompress(image.smask.data) == b"\x00\xff"
+
+
+def test_16_bit_gray_png_is_reduced_to_8_bits():
+    image = png_to_page(png(2, 1, 16, 0, [b"\x80\x00\xff\xff"])).images["Im0"]
+    assert (image.color_space, image.bits_per_component, image.smask) == (b"/DeviceGray", 8, None)
+    assert zlib.decompress(image.data) == b"\x80\xff"
+
+
+def test_16_bit_gray_png_transparency():
+    image = png_to_page(png(2, 1, 16, 0, [b"\x80\x00\x80\x01"], (b"tRNS", b"\x80\x01"))).images["Im0"]
+    assert zlib.decompress(image.smask.data) == b"\xff\x00"
+
+
+def test_16_bit_rgb_png_is_reduced_to_8_bits():
+    image = png_to_page(png(1, 1, 16, 2, [b"\xff\xff\x80\x00\x00\x00"])).images["Im0"]
+    assert (image.color_space, image.bits_per_component) == (b"/DeviceRGB", 8)
+    assert zlib.decompress(image.data) == b"\xff\x80\x00"
+
+
+def test_rgba_png_alpha_becomes_smask():
+    image = png_to_page(png(1, 1, 8, 6, [b"\x01\x02\x03\x40"])).images["Im0"]
+    assert zlib.decompress(image.data) == b"\x01\x02\x03"
+    assert zlib.decompress(image.smask.data) == b"\x40"
+
+
+def test_interlaced_png_is_decoded():
+    # A single pixel is all in the first Adam7 pass
+    image = png_to_page(png(1, 1, 8, 0, [b"\x09"], interlace=1)).images["Im0"]
+    assert (image.decode_parms, zlib.decompress(image.data)) == (None, b"\x09")
+
+
+def test_embedded_png_image_in_svg():
+    import base64
+
+    href = "data:image/png;base64," + base64.b64encode(png(2, 1, 8, 0, [b"\0\0"])).decode()
+    page = svg_to_page(svg(f'<image href="{href}" x="0" y="0" width="20" height="20"/>'))
+    assert list(page.images) == ["Im0"]
+    assert "/Im0 Do Q" in page.content.decode()
+
+
+def test_convert_asset_dispatches_on_format():
+    assert convert_asset(png(1, 1, 8, 0, [b"\0"])).images
+    assert not convert_asset(svg("")).images
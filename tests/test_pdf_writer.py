@@ -0,0 +1,91 @@
+import re
+import zlib
+
+import pytest
+
+from pdf_writer import PdfImage, PdfPage, PdfStreamWriter, format_number
+
+
+def page(content: bytes = b"0 0 m 10 10 l S", **kwargs) -> PdfPage:
+    return PdfPage(100, 50.5, content, **kwargs)
+
+
+def write(path, *pages: PdfPage) -> bytes:
+    with PdfStreamWriter(path) as writer:
+        for p in pages:
+            writer.add_page(p)
+    return path.read_bytes()
+
+
+@pytest.mark.parametrize("value, text", [
+    (0, "0"),
+    (12.0, "12"),
+    (-3, "-3"),
+    (0.5, "0.5"),
+    (1 / 3, "0.3333"),
+    (2.50001, "2.5"),
+    (-2.7e-16, "0"),
+    (-0.00001, "0"),
+])
+def test_format_number(value, text):
+    assert format_number(value) == text
+
+
+def test_xref_points_at_every_object(tmp_path):
+    data = write(tmp_path / "out.pdf", page(), page())
+    assert data.startswith(b"%PDF-1.4\n") and data.endswith(b"%%EOF\n")
+
+    xref_offset = int(re.search(rb"startxref\n(\d+)\n", data)[1])
+    assert data[xref_offset:].startswith(b"xref\n")
+    size = int(re.search(rb"/Size (\d+)", data)[1])
+    entries = data[xref_offset:].split(b"\n")[3:3 + size - 1]
+    for number, entry in enumerate(entries, 1):
+        offset = int(entry[:10])
+        assert data[offset:].startswith(b"%d 0 obj\n" % number)
+
+
+def test_pages_and_content(tmp_path):
+    data = write(tmp_path / "out.pdf", page(b"1 0 0 1 0 0 cm"), page())
+    assert b"/Type /Pages /Kids [4 0 R 6 0 R] /Count 2" in data
+    assert b"/MediaBox [0 0 100 50.5]" in data
+    stream = re.search(rb"/Length (\d+) >>\nstream\n", data)
+    start = stream.end()
+    assert zlib.decompress(data[start:start + int(stream[1])]) == b"1 0 0 1 0 0 cm"
+
+
+def test_resources(tmp_path):
+    mask = PdfImage(1, 1, b"/DeviceGray", 8, zlib.compress(b"\x80"))
+    image = PdfImage(1, 1, b"/DeviceRGB", 8, zlib.compress(b"\0\0\0"), smask=mask)
+    data = write(tmp_path / "out.pdf", page(images={"Im0": image}, fonts={"F0": "Helvetica"},
+                                            opacities={"G0": (0.5, 1.0)}))
+    assert b"/SMask 3 0 R" in data
+    assert b"/XObject << /Im0 4 0 R >>" in data
+    assert b"/Font << /F0 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica" in data
+    assert b"/ExtGState << /G0 << /ca 0.5 /CA 1 >> >>" in data
+
+
+def test_close_replaces_the_previous_file(tmp_path):
+    path = tmp_path / "out.pdf"
+    path.write_bytes(b"old")
+    write(path, page())
+    assert path.read_bytes().startswith(b"%PDF")
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_failure_keeps_the_previous_file(tmp_path):
+    path = tmp_path / "out.pdf"
+    path.write_bytes(b"old")
+    with pytest.raises(ValueError):
+        with PdfStreamWriter(path) as writer:
+            writer.add_page(page())
+            raise ValueError("conversion failed")
+    assert path.read_bytes() == b"old"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_add_page_after_close(tmp_path):
+    writer = PdfStreamWriter(tmp_path / "out.pdf")
+    writer.open()
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.add_page(page())
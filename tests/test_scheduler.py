@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from scheduler import FairShare, PriorityScheduler
+
+
+def test_priority_follows_the_class_order():
+    scheduler = PriorityScheduler({"interactive": 2, "batch": 1, "prefetch": 1})
+    assert [scheduler.priority(name) for name in ("interactive", "batch", "prefetch")] == [0, 1, 2]
+
+
+def test_classes_need_a_slot():
+    with pytest.raises(ValueError):
+        PriorityScheduler({"batch": 0})
+
+
+async def _run(scheduler: PriorityScheduler, name: str, label, events: list, release: asyncio.Event):
+    async with scheduler.slot(name):
+        events.append(("start", label))
+        await release.wait()
+    events.append(("end", label))
+
+
+def test_slots_are_capped_and_admitted_in_order():
+    async def main():
+        scheduler = PriorityScheduler({"batch": 2})
+        events, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(_run(scheduler, "batch", i, events, release)) for i in range(5)]
+        await asyncio.sleep(0)
+        assert events == [("start", 0), ("start", 1)]
+        stats, = scheduler.stats()
+        assert (stats.running, stats.queued) == (2, 3)
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert [label for event, label in events if event == "start"] == [0, 1, 2, 3, 4]
+        stats, = scheduler.stats()
+        assert (stats.running, stats.queued, stats.admitted) == (0, 0, 5)
+
+    asyncio.run(main())
+
+
+def test_a_saturated_class_does_not_block_another():
+    async def main():
+        scheduler = PriorityScheduler({"interactive": 1, "batch": 1})
+        events, blocked, release = [], asyncio.Event(), asyncio.Event()
+        batch = [asyncio.create_task(_run(scheduler, "batch", f"b{i}", events, blocked)) for i in range(3)]
+        interactive = asyncio.create_task(_run(scheduler, "interactive", "i", events, release))
+        await asyncio.sleep(0)
+        assert events == [("start", "b0"), ("start", "i")]
+
+        release.set()
+        await interactive
+        blocked.set()
+        await asyncio.gather(*batch)
+
+    asyncio.run(main())
+
+
+def test_a_cancelled_waiter_gives_its_turn():
+    async def main():
+        scheduler = PriorityScheduler({"batch": 1})
+        events, release = [], asyncio.Event()
+        first = asyncio.create_task(_run(scheduler, "batch", "first", events, release))
+        cancelled = asyncio.create_task(_run(scheduler, "batch", "cancelled", events, release))
+        last = asyncio.create_task(_run(scheduler, "batch", "last", events, release))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        release.set()
+        await asyncio.gather(first, last)
+        assert cancelled.cancelled()
+        assert [label for event, label in events if event == "start"] == ["first", "last"]
+        assert scheduler.stats()[0].running == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_when_admitted_releases_the_slot():
+    async def main():
+        scheduler = PriorityScheduler({"batch": 1})
+        events, release = [], asyncio.Event()
+        first = asyncio.create_task(_run(scheduler, "batch", "first", events, release))
+        second = asyncio.create_task(_run(scheduler, "batch", "second", events, release))
+        await asyncio.sleep(0)
+        # The slot goes to the second task, which is cancelled before it runs
+        release.set()
+        await first
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+
+        async with scheduler.slot("batch"):
+            assert scheduler.stats()[0].running == 1
+
+    asyncio.run(main())
+
+
+def test_fair_share_alternates_between_jobs():
+    share = FairShare(1)
+    order, lock = [], threading.Lock()
+    hold = threading.Event()
+
+    def unit(job: str, index: int):
+        with share.turn(job):
+            with lock:
+                order.append(job)
+            hold.wait()
+
+    # The first unit of "long" holds the only slot while everything queues
+    threads = [threading.Thread(target=unit, args=("long", 0))]
+    threads[0].start()
+    while not order:
+        time.sleep(0.001)
+    for index in range(1, 4):
+        threads.append(threading.Thread(target=unit, args=("long", index)))
+        threads[-1].start()
+    time.sleep(0.05)
+    for index in range(2):
+        threads.append(threading.Thread(target=unit, args=("short", index)))
+        threads[-1].start()
+    time.sleep(0.05)
+
+    hold.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["long", "long", "short", "long", "short", "long"]
@@ -0,0 +1,90 @@
+import pytest
+
+from url_classifier import UrlKind, classify, classify_many
+
+USER = "https://musescore.com/user/123/scores/456"
+OFFICIAL = "https://musescore.com/official_scores/scores/789"
+
+
+@pytest.mark.parametrize("url, kind", [
+    (USER, UrlKind.USER_SCORE),
+    ("https://www.musescore.com/user/123/scores/456/", UrlKind.USER_SCORE),
+    ("https://MuseScore.com/user/123/scores/456?share=copy#top", UrlKind.USER_SCORE),
+    (f"  {USER}\n", UrlKind.USER_SCORE),
+    (OFFICIAL, UrlKind.OFFICIAL_SCORE),
+    ("https://example.com/some/page", UrlKind.OTHER_SITE),
+    ("https://example.com/", UrlKind.OTHER_SITE),
+    ("https://sub.example.co.uk/a?b=c", UrlKind.OTHER_SITE),
+    # Not a score page, but still a page of the site
+    ("https://musescore.com/user/abc/scores/456", UrlKind.OTHER_SITE),
+])
+def test_strict_accepts(url, kind):
+    assert classify(url).kind is kind
+
+
+@pytest.mark.parametrize("url", [
+    "",
+    "musescore.com/user/123/scores/456",
+    "http://musescore.com/user/123/scores/456",
+    "http://example.com/page",
+    "https://example.com",
+    "ftp://example.com/file",
+    "https://localhost/page",
+    "not a url",
+])
+def test_strict_rejects(url):
+    assert classify(url).kind is UrlKind.INVALID
+
+
+@pytest.mark.parametrize("url, kind", [
+    ("http://musescore.com/user/123/scores/456", UrlKind.USER_SCORE),
+    ("http://example.com/page", UrlKind.OTHER_SITE),
+    ("https://example.com", UrlKind.OTHER_SITE),
+    ("ftp://example.com/file", UrlKind.INVALID),
+    ("not a url", UrlKind.INVALID),
+])
+def test_lenient(url, kind):
+    assert classify(url, lenient=True).kind is kind
+
+
+def test_score_key_ignores_url_variants():
+    variants = [USER, "https://www.musescore.com/user/123/scores/456/", "https://musescore.com/user/123/scores/456?x=1",
+                "http://MUSESCORE.com/user/123/scores/456#comments"]
+    infos = [classify(url, lenient=True) for url in variants]
+    assert {info.key for info in infos} == {"score:456"}
+    assert {info.canonical for info in infos} == {USER}
+    assert (infos[0].user_id, infos[0].score_id) == (123, 456)
+
+
+def test_other_site_key():
+    assert classify("https://Example.COM/page/").key == "url:https://example.com/page"
+    assert classify("https://example.com", lenient=True).key == "url:https://example.com"
+
+
+def test_classify_many():
+    result = classify_many([
+        "# a comment",
+        "",
+        USER,
+        USER,
+        "https://www.musescore.com/user/123/scores/456/",
+        OFFICIAL,
+        "https://example.com/page",
+        "garbage",
+    ])
+    assert [info.score_id for info in result.accepted] == [456, 789]
+    assert result.rejected == ["https://example.com/page", "garbage"]
+    assert result.duplicates == 2
+
+
+def test_classify_many_seen_and_kinds():
+    result = classify_many([USER, OFFICIAL, "https://example.com/page"], kinds=set(UrlKind) - {UrlKind.INVALID},
+                           seen={"score:456"})
+    assert [info.kind for info in result.accepted] == [UrlKind.OFFICIAL_SCORE, UrlKind.OTHER_SITE]
+    assert result.duplicates == 1
+
+
+def test_classify_many_lenient():
+    urls = ["http://musescore.com/user/123/scores/456"]
+    assert classify_many(urls).rejected == urls
+    assert [info.score_id for info in classify_many(urls, lenient=True).accepted] == [456]
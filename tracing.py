@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import statistics
+import time
+import uuid
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import TextIO
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+ENABLED: bool = settings.TRACING
+
+# Trace id, time the trace started at and the hops of the current message,
+# all timestamps being wall clock microseconds so that processes agree.
+Trace = tuple[str, int, list[tuple[str, int]]]
+
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def begin(started_us: int | None = None) -> Trace:
+    # A trace started by user input records the delay before the first send
+    if started_us is None:
+        started_us = now_us()
+        return uuid.uuid4().hex[:16], started_us, []
+    return uuid.uuid4().hex[:16], started_us, [("input", started_us)]
+
+
+def child(trace: Trace | None) -> Trace:
+    # Messages sent while handling a traced message continue its trace
+    if trace is None:
+        return begin()
+    trace_id, started_us, _ = trace
+    return trace_id, started_us, []
+
+
+def stamp(trace: Trace, hop: str):
+    trace[2].append((hop, now_us()))
+
+
+class Recorder:
+    def __init__(self, address: str):
+        self._address = address
+        self._file: TextIO | None = None
+        self._durations: defaultdict[str, list[int]] = defaultdict(list)
+
+    def _write(self, name: str, start_us: int, end_us: int, trace_id: str):
+        if self._file is None:
+            settings.TRACE_DIR.mkdir(parents=True, exist_ok=True)
+            self._file = open(settings.TRACE_DIR / f"{self._address}-{os.getpid()}.jsonl", "a", encoding="utf-8")
+        # Chrome trace complete events, one per line
+        self._file.write(json.dumps({
+            "name": name, "cat": "ipc", "ph": "X", "ts": start_us, "dur": end_us - start_us,
+            "pid": os.getpid(), "tid": self._address, "args": {"trace_id": trace_id},
+        }) + "\n")
+        self._durations[name].append(end_us - start_us)
+
+    def record(self, trace: Trace, method: str):
+        trace_id, started_us, hops = trace
+        for (previous, previous_us), (hop, hop_us) in zip(hops, hops[1:]):
+            if (previous, hop) == ("start", "end"):
+                name = f"{self._address}.{method}"
+            else:
+                name = f"{self._address} {previous}→{hop}"
+            self._write(name, previous_us, hop_us, trace_id)
+        if hops:
+            self._write(f"trace→{self._address}.{method}", started_us, hops[-1][1], trace_id)
+
+    def close(self):
+        for name, durations in sorted(self._durations.items()):
+            if len(durations) < 2:
+                logger.info(f"Trace span {name} : {durations[0] / 1000:.2f} ms")
+                continue
+            p50, p95, p99 = (statistics.quantiles(durations, n=100)[index] / 1000 for index in (49, 94, 98))
+            logger.info(f"Trace span {name} ({len(durations)}) : p50 {p50:.2f} ms, "
+                        f"p95 {p95:.2f} ms, p99 {p99:.2f} ms")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,103 @@
+import re
+from dataclasses import dataclass
+from enum import Enum
+from typing import Iterable, NamedTuple
+
+
+class UrlKind(Enum):
+    USER_SCORE = "user_score"
+    OFFICIAL_SCORE = "official_score"
+    OTHER_SITE = "other_site"
+    INVALID = "invalid"
+
+
+SCORE_KINDS = frozenset({UrlKind.USER_SCORE, UrlKind.OFFICIAL_SCORE})
+
+# Host case, www, a trailing slash, a query string and a fragment do not
+# change the score a URL points to. Plain http and URLs of other sites
+# without a path are only accepted when lenient, as in batch files.
+_SCORE_URL = re.compile(
+    r"(?P<scheme>https?)://(?:www\.)?musescore\.com/(?:user/(?P<user>[0-9]+)|official_scores)/scores/(?P<score>[0-9]+)"
+    r"/?(?:[?#].*)?",
+    re.IGNORECASE,
+)
+_OTHER_URL = re.compile(r"(?P<scheme>https?)://(?P<host>[a-zA-Z0-9\-.]+\.[a-zA-Z]{2,})(?P<rest>/[^#]*)?(?:#.*)?",
+                        re.IGNORECASE)
+
+
+class UrlInfo(NamedTuple):
+    # A tuple rather than a frozen dataclass: bulk validation builds one per
+    # line and the tuple is several times cheaper to create.
+    kind: UrlKind
+    url: str
+    canonical: str | None = None
+    user_id: int | None = None
+    score_id: int | None = None
+
+    @property
+    def is_score(self) -> bool:
+        return self.kind in SCORE_KINDS
+
+    @property
+    def key(self) -> str:
+        # Dedup and cache key: a score whatever its URL, or the canonical URL
+        if self.score_id is not None:
+            return f"score:{self.score_id}"
+        return f"url:{(self.canonical or self.url).rstrip('/')}"
+
+
+def classify(url: str, *, lenient: bool = False) -> UrlInfo:
+    url = url.strip()
+    match = _SCORE_URL.fullmatch(url) or _OTHER_URL.fullmatch(url)
+    if match is None:
+        return UrlInfo(UrlKind.INVALID, url)
+    if not lenient and (match["scheme"].lower() != "https" or match.re is _OTHER_URL and match["rest"] is None):
+        return UrlInfo(UrlKind.INVALID, url)
+    if match.re is _SCORE_URL:
+        user, score = match.group("user", "score")
+        score_id = int(score)
+        if user is None:
+            return UrlInfo(UrlKind.OFFICIAL_SCORE, url, f"https://musescore.com/official_scores/scores/{score_id}",
+                           None, score_id)
+        user_id = int(user)
+        return UrlInfo(UrlKind.USER_SCORE, url, f"https://musescore.com/user/{user_id}/scores/{score_id}",
+                       user_id, score_id)
+    canonical = f"{match['scheme'].lower()}://{match['host'].lower()}{match['rest'] or '/'}"
+    return UrlInfo(UrlKind.OTHER_SITE, url, canonical)
+
+
+@dataclass
+class BulkResult:
+    accepted: list[UrlInfo]
+    rejected: list[str]
+    duplicates: int
+
+
+def classify_many(urls: Iterable[str], kinds: Iterable[UrlKind] = SCORE_KINDS,
+                  seen: Iterable[str] = (), *, lenient: bool = False) -> BulkResult:
+    # A single pass: blank lines and comments are skipped, URLs of other kinds
+    # rejected, and the ones with a key already seen (before or given) counted
+    kinds = frozenset(kinds)
+    keys = set(seen)
+    # Lines repeated as is, the usual duplicates, are not classified again
+    lines = set()
+    accepted, rejected = [], []
+    duplicates = 0
+    for url in urls:
+        url = url.strip()
+        if not url or url.startswith("#"):
+            continue
+        if url in lines:
+            duplicates += 1
+            continue
+        info = classify(url, lenient=lenient)
+        if info.kind not in kinds:
+            rejected.append(url)
+        elif (key := info.key) in keys:
+            duplicates += 1
+            lines.add(url)
+        else:
+            keys.add(key)
+            lines.add(url)
+            accepted.append(info)
+    return BulkResult(accepted, rejected, duplicates)
@@ -1,9 +1,24 @@
 import multiprocessing as mp
 
+import shared_payload
+
 Order = tuple[str, tuple, dict] | str
 Message = tuple[str, str, Order]
 
 
 def serialize_send(sender: str, send_queue: mp.Queue, /, *, to: str,
-                   what: Order) -> None:
-    send_queue.put((sender, to, what))
+                   what: Order, trace: tuple | None = None) -> None:
+    # Large payloads travel in shared memory, traced messages carry their
+    # trace as a fourth element
+    what = shared_payload.pack(what)
+    if trace is None:
+        send_queue.put((sender, to, what))
+    else:
+        send_queue.put((sender, to, what, trace))
+
+
+def queue_fileno(recv_queue: mp.Queue) -> int:
+    # multiprocessing does not expose the read end of a queue, but its pipe
+    # is what select-like APIs (QSocketNotifier, selectors) need to wait on.
+    return recv_queue._reader.fileno()
+
@@ -1,10 +1,25 @@
+import asyncio
+import inspect
+import logging
 import multiprocessing as mp
+import multiprocessing.connection
 import os
 import queue
+import threading
+import time
+from contextvars import ContextVar
 from typing import Type
 
+import metrics
 import settings
-from utils import serialize_send, Message, Order
+import shared_payload
+import tracing
+from utils import serialize_send, queue_fileno, Message, Order
+
+logger = logging.getLogger(__name__)
+
+# Journal token of the order running in the current context
+current_order: ContextVar[int | None] = ContextVar("current_order", default=None)
 
 
 class Worker:
@@ -20,10 +35,22 @@ class Worker:
     def address(self):
         return self._address
 
+    @address.setter
+    def address(self, address):
+        self._address = address
+
     @property
     def ready(self):
         return self._ready
 
+    @property
+    def healthy(self) -> bool:
+        return True
+
+    def collect_metrics(self):
+        # Gauges worth reading only when the manager asks for the metrics
+        pass
+
     def init(self) -> list[Message]:
         if self._is_init:
             raise RuntimeError("Cannot initialize Worker twice")
@@ -40,32 +67,142 @@ class Worker:
 
 class Handler:
     def __init__(self, worker_class: Type[Worker], name: str,
-                 send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int):
-        self._worker = worker_class(name, self)
+                 send_queue: mp.Queue, recv_queue: mp.Queue, ppid: int,
+                 peers: dict[str, mp.Queue] | None = None, **worker_kwargs):
+        self._worker = worker_class(name, self, **worker_kwargs)
         self._send_queue = send_queue
         self._recv_queue = recv_queue
         self._ppid = ppid
+        self._peers = peers or {}
 
         self._running = False
+        self._recorder = tracing.Recorder(name) if tracing.ENABLED else None
 
     @property
     def is_ready(self) -> bool:
         return self._worker.ready
 
-    def send_message(self, to: str, what: Order):
-        serialize_send(self._worker.address, self._send_queue, to=to, what=what)
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def fileno(self) -> int:
+        return queue_fileno(self._recv_queue)
+
+    def _route(self, to: str, what: Order) -> mp.Queue:
+        # Peers are reached through their own queue, anything else (the
+        # manager, unknown workers) is relayed by the manager. So are the
+        # orders the manager journals, to send them again after a restart.
+        method = what[0] if isinstance(what, tuple) else what
+        if method in settings.SUPERVISOR_JOURNALED:
+            return self._send_queue
+        return self._peers.get(to, self._send_queue)
+
+    def send_message(self, to: str, what: Order, trace: tracing.Trace | None = None):
+        if tracing.ENABLED and to != "manager":
+            trace = trace or tracing.child(tracing.current_trace.get())
+            tracing.stamp(trace, "send")
+        serialize_send(self._worker.address, self._route(to, what), to=to, what=what, trace=trace)
+
+    def _send_all(self, result_messages: list[Message], trace: tracing.Trace | None = None):
+        # Only messages between workers are traced, not the lifecycle ones
+        for sender, receiver, what in result_messages:
+            reply_trace = None
+            if tracing.ENABLED and receiver != "manager":
+                reply_trace = tracing.child(trace)
+                tracing.stamp(reply_trace, "send")
+            serialize_send(sender, self._route(receiver, what), to=receiver, what=what, trace=reply_trace)
+
+    @staticmethod
+    def _journaled(message: Message) -> tuple[Message, int | None]:
+        # The manager keeps the long orders of a supervised worker until it
+        # finishes them, to send them again if the worker has to be restarted.
+        # They come wrapped with their journal token.
+        what = message[2]
+        if not isinstance(what, tuple) or what[0] != "_journaled":
+            return message, None
+        token, order = what[1]
+        return (*message[:2], order, *message[3:]), token
 
-    def listen_step(self, *, block: bool = False,
-                    timeout_step: float | None = settings.DEFAULT_REFRESH_STEP_TIMEOUT_SEC):
-        what = None
+    def _journal_running(self, token: int | None):
+        if token is not None:
+            serialize_send(self._worker.address, self._send_queue, to="manager", what=("_running", (token,), {}))
+
+    def order_running(self):
+        # Orders that wait for a slot or a thread tell the manager when they
+        # actually start, the watchdog only times them from then on
+        self._journal_running(current_order.get())
+
+    def _journal_end(self, token: int | None):
+        if token is not None:
+            serialize_send(self._worker.address, self._send_queue, to="manager", what=("_finished", (token,), {}))
+
+    def _pong(self):
+        serialize_send(self._worker.address, self._send_queue, to="manager",
+                       what=("_pong", (self._worker.healthy,), {}))
+
+    def _report_metrics(self):
+        self._worker.collect_metrics()
+        if (rss := metrics.rss_bytes()) is not None:
+            metrics.set_gauge("process_rss_bytes", rss)
+        serialize_send(self._worker.address, self._send_queue, to="manager",
+                       what=("_metrics", (metrics.registry.snapshot(),), {}))
+
+    def _reroute(self, name: str):
+        # The worker has a new process, with a new queue that only the manager
+        # can reach
+        if (peer_queue := self._peers.pop(name, None)) is not None:
+            peer_queue.cancel_join_thread()
+
+    def _adopt(self, name: str):
+        # A standby takes over the address of a failed worker, its messages
+        # come on the queue of the standby from now on
+        logger.info(f"{self._worker.address} takes over {name}")
+        self._reroute(name)
+        self._worker.address = name
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = tracing.Recorder(name)
+
+    def _control(self, what: Order) -> bool:
+        # Messages between the handler and the manager, never seen by the worker
+        if what == "_ping":
+            self._pong()
+        elif what == "_metrics":
+            self._report_metrics()
+        elif isinstance(what, tuple) and what[0] == "_adopt":
+            self._adopt(*what[1])
+        elif isinstance(what, tuple) and what[0] == "_reroute":
+            self._reroute(*what[1])
+        else:
+            return False
+        return True
+
+    def watch_parent(self):
+        # Blocks on the parent sentinel instead of polling getppid, then wakes
+        # the worker up through its own queue.
+        def watch():
+            multiprocessing.connection.wait([parent.sentinel])
+            logger.warning(f"Parent process died, shutting down: {self._worker.address}")
+            serialize_send(self._worker.address, self._recv_queue, to=self._worker.address, what="_shutdown")
+
+        if (parent := mp.parent_process()) is not None:
+            threading.Thread(target=watch, name="parent-watch", daemon=True).start()
+
+    def listen_step(self, *, block: bool = False, timeout_step: float | None = None) -> bool:
         try:
-            sender, receiver, what = self._recv_queue.get(block=block, timeout=timeout_step)
+            message = self._recv_queue.get(block=block, timeout=timeout_step)
         except queue.Empty:
-            return
-        finally:
-            if os.getppid() != self._ppid or what == "_shutdown":
-                self._running = False
-                return
+            return False
+        sender, receiver, what = message[:3]
+        if what == "_shutdown" or os.getppid() != self._ppid:
+            self._running = False
+            return False
+        if self._control(what):
+            return True
+        message, token = self._journaled(message)
+        what = message[2]
+        trace = message[3] if len(message) > 3 else None
 
         func, args, kwargs = what if isinstance(what, tuple) else (what, (), {})
         assert receiver == self._worker.address
@@ -73,11 +210,157 @@ class Handler:
         if func not in self._worker.METHODS:
             raise RuntimeError(f"Unknown method {func}")
 
-        result_messages = getattr(self._worker, func)(*args, **kwargs)
-        for sender, receiver, what in result_messages:
-            serialize_send(sender, self._send_queue, to=receiver, what=what)
+        self._journal_running(token)
+        args, kwargs, payloads = shared_payload.unpack(args, kwargs)
+        started = time.perf_counter()
+        if trace is None:
+            result_messages = getattr(self._worker, func)(*args, **kwargs)
+        else:
+            tracing.stamp(trace, "receive")
+            tracing.stamp(trace, "start")
+            context_token = tracing.current_trace.set(trace)
+            try:
+                result_messages = getattr(self._worker, func)(*args, **kwargs)
+            finally:
+                tracing.current_trace.reset(context_token)
+                tracing.stamp(trace, "end")
+                self._recorder.record(trace, func)
+        metrics.observe("order_seconds", time.perf_counter() - started, method=func)
+        for payload in payloads:
+            payload.release()
+        self._send_all(result_messages, trace)
+        self._journal_end(token)
+        return True
 
-    def listen(self, timeout_step: float | None = settings.DEFAULT_REFRESH_STEP_TIMEOUT_SEC):
+    def listen(self):
         self._running = True
+        self.watch_parent()
         while self._running:
-            self.listen_step(block=True, timeout_step=timeout_step)
+            self.listen_step(block=True)
+        if self._recorder is not None:
+            self._recorder.close()
+
+
+class AsyncHandler(Handler):
+    # Orders run on an event loop: coroutine methods become tasks that reply
+    # when they finish, so a slow order never holds back the next messages.
+    # A thread blocks on the queue and hands every message to the loop.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopped: asyncio.Event | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._held: list[tuple[Message, int | None]] | None = []
+
+    def _read_queue(self):
+        while True:
+            message = self._recv_queue.get()
+            sender, receiver, what = message[:3]
+            if len(message) > 3:
+                tracing.stamp(message[3], "receive")
+            # Pings and metrics are answered from the loop, so that a stuck
+            # loop misses them
+            if what not in ("_ping", "_metrics") and self._control(what):
+                continue
+            message, token = self._journaled(message)
+            self._loop.call_soon_threadsafe(self._dispatch, message, token)
+            if what == "_shutdown":
+                return
+
+    def _dispatch(self, message: Message, token: int | None = None):
+        sender, receiver, what = message[:3]
+        if what == "_shutdown" or os.getppid() != self._ppid:
+            self._running = False
+            self._stopped.set()
+            return
+        if what == "_ping":
+            self._pong()
+            return
+        if what == "_metrics":
+            self._report_metrics()
+            return
+        trace = message[3] if len(message) > 3 else None
+
+        func, args, kwargs = what if isinstance(what, tuple) else (what, (), {})
+        assert receiver == self._worker.address
+
+        if func not in self._worker.METHODS:
+            raise RuntimeError(f"Unknown method {func}")
+        if self._held is not None and func != "init":
+            # Orders wait for the worker to be initialised, as after a restart
+            self._held.append((message, token))
+            return
+
+        args, kwargs, payloads = shared_payload.unpack(args, kwargs)
+        started = time.perf_counter()
+        if trace is not None:
+            tracing.stamp(trace, "start")
+        # Tasks copy the context when created, so the trace and the journal
+        # token follow them
+        context_token, order_token = tracing.current_trace.set(trace), current_order.set(token)
+        try:
+            result = getattr(self._worker, func)(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = asyncio.ensure_future(result)
+        finally:
+            current_order.reset(order_token)
+            tracing.current_trace.reset(context_token)
+        if not inspect.isawaitable(result):
+            self._finish(result, func, trace, token, payloads, started)
+            return
+        task = asyncio.ensure_future(result)
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._finish_task(t, func, trace, token, payloads, started))
+
+    def _finish(self, result_messages: list[Message] | None, func: str, trace: tracing.Trace | None,
+                token: int | None, payloads: list[shared_payload.SharedPayload], started: float):
+        metrics.observe("order_seconds", time.perf_counter() - started, method=func)
+        for payload in payloads:
+            payload.release()
+        if result_messages is not None:
+            if trace is not None:
+                tracing.stamp(trace, "end")
+                self._recorder.record(trace, func)
+            self._send_all(result_messages, trace)
+        self._journal_end(token)
+        if func == "init" and self._held is not None:
+            held, self._held = self._held, None
+            for message, held_token in held:
+                self._dispatch(message, held_token)
+
+    def _finish_task(self, task: asyncio.Task, func: str, trace: tracing.Trace | None,
+                     token: int | None, payloads: list[shared_payload.SharedPayload], started: float):
+        self._tasks.discard(task)
+        result_messages = None
+        if task.cancelled():
+            metrics.inc("orders_cancelled_total", method=func)
+        elif (e := task.exception()) is not None:
+            logger.error(f"Order {func} of {self._worker.address} failed : {str(e)}")
+            metrics.inc("order_errors_total", method=func)
+        else:
+            result_messages = task.result()
+        self._finish(result_messages, func, trace, token, payloads, started)
+
+    async def cancel_tasks(self):
+        current = asyncio.current_task()
+        tasks = [task for task in self._tasks if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        threading.Thread(target=self._read_queue, name="queue-reader", daemon=True).start()
+        await self._stopped.wait()
+        await self.cancel_tasks()
+
+    def listen_step(self, *, block: bool = False, timeout_step: float | None = None) -> bool:
+        raise RuntimeError("AsyncHandler only listens through listen()")
+
+    def listen(self):
+        self._running = True
+        self.watch_parent()
+        asyncio.run(self._serve())
+        if self._recorder is not None:
+            self._recorder.close()